@@ -0,0 +1,93 @@
+"""In-memory stand-ins for the broker and the workers, to drive 'loop.MainLoop' in benchmarks."""
+from broker import task_reader, publisher, schema
+from queue import Queue, Empty
+from reader import data
+from rss import parser
+from threading import Event, Thread
+from time import monotonic, sleep
+from typing import Dict, List
+
+
+class QueueTaskReader(task_reader.TaskReader):
+    """Hands out the tasks put on 'tasks', and records when each one was submitted and acked.
+
+    Like RabbitMQ it blocks up to 'interval_timeout' waiting for a task.
+    """
+
+    def __init__(self, interval_timeout: float = 1):
+        self.interval_timeout = interval_timeout
+        self.tasks = Queue()
+        self.submitted: Dict[int, float] = {}
+        self.acked: Dict[int, float] = {}
+        self.rejected: List[int] = []
+        self._next_id = 0
+
+    def submit(self, link: str):
+        self.submitted[self._next_id] = monotonic()
+        self.tasks.put((schema.Task(link=link), self._next_id))
+        self._next_id += 1
+
+    def get_task(self):
+        while True:
+            try:
+                yield self.tasks.get(timeout=self.interval_timeout)
+            except Empty:
+                yield None, None
+
+    def close(self):
+        pass
+
+    def ack(self, task_id):
+        self.acked[task_id] = monotonic()
+
+    def reject(self, task_id):
+        self.rejected.append(task_id)
+
+    def latencies(self) -> List[float]:
+        return sorted(self.acked[task_id] - self.submitted[task_id] for task_id in self.acked)
+
+
+class ListPublisher(publisher.Publisher):
+    def __init__(self):
+        self.published = []
+
+    def publish(self, msg: bytes):
+        self.published.append(msg)
+
+    def close(self):
+        pass
+
+
+class StaticParser(parser.Parser):
+    def parse(self, data: str) -> List[parser.schema.Item]:
+        return [parser.schema.Item(title="benchmark")]
+
+
+class SleepWorker(Thread):
+    """Worker 'fetching' every task in 'delay' seconds, a delay of None never finishes a fetch."""
+
+    def __init__(self, in_q: Queue, result_q: Queue, stop_event: Event, delay=0.01):
+        self.in_q = in_q
+        self.result_q = result_q
+        self.stop_event = stop_event
+        self.delay = delay
+        super().__init__(daemon=True)
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                in_data: data.InputData = self.in_q.get(timeout=1)
+            except Empty:
+                continue
+            if self.delay is None:
+                self.stop_event.wait()
+                return
+            sleep(self.delay)
+            self.result_q.put(data.ResultData(url=in_data.url, data="benchmark"))
+
+
+def percentile(values: List[float], p: float) -> float:
+    """percentile of sorted values"""
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
@@ -0,0 +1,70 @@
+"""Synthetic feeds shaped like real-world ones: escaped html descriptions, guids, authors and dates."""
+from typing import Iterator, Tuple
+import os
+import random
+
+_WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def rss_feed(items: int = 50, description_words: int = 80, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    entries = "".join(
+        f"""
+    <item>
+      <title>{_sentence(rng, 8)}</title>
+      <link>https://example.org/{seed}/posts/{i}</link>
+      <guid isPermaLink="false">urn:example:{seed}:{i}</guid>
+      <dc:creator>{_sentence(rng, 2)}</dc:creator>
+      <pubDate>Sat, 13 Dec 2003 18:30:02 GMT</pubDate>
+      <category>{rng.choice(_WORDS)}</category>
+      <description>&lt;p&gt;{_sentence(rng, description_words)}&lt;/p&gt;</description>
+    </item>""" for i in range(items)
+    )
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <channel>
+    <title>Example feed {seed}</title>
+    <link>https://example.org/{seed}/</link>
+    <description>{_sentence(rng, 10)}</description>{entries}
+  </channel>
+</rss>
+""".encode()
+
+
+def atom_feed(items: int = 50, description_words: int = 80, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    entries = "".join(
+        f"""
+  <entry>
+    <title>{_sentence(rng, 8)}</title>
+    <link rel="alternate" href="https://example.org/{seed}/posts/{i}"/>
+    <id>urn:example:{seed}:{i}</id>
+    <updated>2003-12-13T18:30:02Z</updated>
+    <author><name>{_sentence(rng, 2)}</name></author>
+    <summary type="html">&lt;p&gt;{_sentence(rng, description_words)}&lt;/p&gt;</summary>
+  </entry>""" for i in range(items)
+    )
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Example feed {seed}</title>
+  <id>urn:example:{seed}</id>
+  <updated>2003-12-13T18:30:02Z</updated>{entries}
+</feed>
+""".encode()
+
+
+def synthetic_corpus(feeds: int = 40, items: int = 50) -> Iterator[Tuple[str, bytes]]:
+    for seed in range(feeds):
+        make = rss_feed if seed % 2 == 0 else atom_feed
+        yield f"{make.__name__}-{seed}", make(items=items, seed=seed)
+
+
+def directory_corpus(path: str) -> Iterator[Tuple[str, bytes]]:
+    """every file in the directory is a feed, i.e. saved with 'curl -o'"""
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), "rb") as f:
+            yield name, f.read()
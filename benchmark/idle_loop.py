@@ -0,0 +1,73 @@
+"""Measures the CPU used by 'loop.MainLoop' while idle or saturated, and the task latency.
+
+    python -m benchmark.idle_loop [--duration SECONDS]
+
+Scenarios:
+    idle: no tasks at all, the loop waits for the broker.
+    saturated: the in-flight window is full and no worker finishes, the loop waits for results.
+    steady: tasks arrive at a steady rate and each fetch takes 10ms, reports the latency from task
+        submission to ack.
+"""
+import argparse
+import resource
+from functools import partial
+from threading import Thread
+from time import monotonic, sleep
+import loop
+from benchmark import fakes
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(duration: float, fetch_delay, task_rate: float = 0, threads_num: int = 4, max_in_flight: int = 8):
+    task_reader = fakes.QueueTaskReader(interval_timeout=1)
+    main_loop = loop.MainLoop(
+        threads_num, partial(fakes.SleepWorker, delay=fetch_delay),
+        parser_=fakes.StaticParser(), publisher_=fakes.ListPublisher(), task_reader_=task_reader,
+        max_in_flight=max_in_flight
+    )
+    loop_thread = Thread(target=main_loop.loop, daemon=True)
+
+    if fetch_delay is None:
+        # fill up the window with tasks that never finish
+        for i in range(max_in_flight):
+            task_reader.submit(f"feed{i}")
+
+    start_cpu, start = _cpu_seconds(), monotonic()
+    loop_thread.start()
+    submitted = 0
+    while monotonic() - start < duration:
+        if task_rate:
+            task_reader.submit(f"feed{submitted}")
+            submitted += 1
+            sleep(1 / task_rate)
+        else:
+            sleep(0.1)
+    cpu, wall = _cpu_seconds() - start_cpu, monotonic() - start
+    main_loop.stop_event.set()
+    loop_thread.join(3)
+    return cpu / wall, task_reader.latencies()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--duration", type=float, default=5)
+    args = arg_parser.parse_args()
+
+    cpu, _ = run(args.duration, fetch_delay=0.01)
+    print(f"idle:      cpu {cpu:6.1%}")
+    cpu, _ = run(args.duration, fetch_delay=None)
+    print(f"saturated: cpu {cpu:6.1%}")
+    cpu, latencies = run(args.duration, fetch_delay=0.01, task_rate=200)
+    print(
+        f"steady:    cpu {cpu:6.1%}  tasks {len(latencies)}  "
+        f"latency p50 {fakes.percentile(latencies, 50) * 1000:.1f}ms  "
+        f"p99 {fakes.percentile(latencies, 99) * 1000:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
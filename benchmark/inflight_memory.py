@@ -0,0 +1,96 @@
+"""Measures the memory of the in-flight bookkeeping and of the queue records at a number of in-flight tasks.
+
+    python -m benchmark.inflight_memory [--tasks 10000]
+
+Every task has an 'InputData' waiting in in_q, a 'ResultData' waiting in result_q and an entry in the
+in-flight table. They are compared with the same records as plain dataclasses, and the in-flight table with
+a dict of task ids plus a dict of the same per-task fields. Links are shared, so only the bookkeeping counts.
+"""
+import argparse
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Callable, Optional, Union
+from inflight import InFlightTable
+from reader import data
+
+
+@dataclass
+class DictInputData:
+    url: str
+
+
+@dataclass
+class DictResultData:
+    url: str
+    data: Optional[Union[str, bytes]] = None
+    error: Optional[str] = None
+    not_modified: bool = False
+    status_code: Optional[int] = None
+    retry_after: Optional[float] = None
+    retryable: bool = False
+
+
+@dataclass
+class DictInFlight:
+    task_id: int
+    started: float
+    retries: int
+    deadline: float
+
+
+def _measure(build: Callable[[], object]) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def _dict_table(links):
+    table = OrderedDict()
+    for i, link in enumerate(links):
+        now = monotonic()
+        table[link] = DictInFlight(i, now, 0, now + 600)
+    return table
+
+
+def _slots_table(links):
+    table = InFlightTable()
+    for i, link in enumerate(links):
+        table.add(link, i)
+    return table
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--tasks", type=int, default=10000)
+    args = arg_parser.parse_args()
+
+    links = [f"https://example.org/{i}/feed.xml" for i in range(args.tasks)]
+    body = b"<rss/>"
+    rows = [
+        ("InputData", lambda: [DictInputData(link) for link in links], lambda: [data.InputData(link) for link in links]),
+        (
+            "ResultData",
+            lambda: [DictResultData(link, body) for link in links],
+            lambda: [data.ResultData(link, body) for link in links]
+        ),
+        ("in-flight table", lambda: _dict_table(links), lambda: _slots_table(links)),
+        ("task id dict", lambda: {link: i for i, link in enumerate(links)}, None),
+    ]
+    print(f"{args.tasks} tasks in flight")
+    print(f"{'':16}{'__dict__ KiB':>14}{'__slots__ KiB':>15}{'bytes/task':>12}")
+    for name, dict_build, slots_build in rows:
+        dict_size = _measure(dict_build)
+        slots_size = _measure(slots_build) if slots_build else None
+        per_task = (slots_size if slots_size is not None else dict_size) / args.tasks
+        slots_column = f"{slots_size / 1024:>15.0f}" if slots_size is not None else f"{'-':>15}"
+        print(f"{name:16}{dict_size / 1024:>14.0f}{slots_column}{per_task:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
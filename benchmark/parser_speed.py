@@ -0,0 +1,49 @@
+"""Compares the speed of 'BasicParser' and 'FastParser', and checks they extract the same items.
+
+    python -m benchmark.parser_speed [--corpus DIR] [--repeat N]
+
+Without a corpus directory, a synthetic corpus of RSS 2.0 and Atom feeds is used. To benchmark real-world
+feeds, save some of them to a directory first, i.e. 'curl -o corpus/feed1.xml https://...'.
+"""
+import argparse
+from time import perf_counter
+from benchmark import feeds
+from rss import parser, exceptions
+
+
+def _parse_all(p: parser.Parser, corpus, repeat: int):
+    results = {}
+    start = perf_counter()
+    for _ in range(repeat):
+        for name, feed in corpus:
+            try:
+                results[name] = p.parse(feed)
+            except exceptions.ParseError as e:
+                results[name] = repr(e)
+    return perf_counter() - start, results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--corpus", help="directory of feed files")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    corpus = list(feeds.directory_corpus(args.corpus) if args.corpus else feeds.synthetic_corpus())
+    size = sum(len(feed) for _, feed in corpus)
+    print(f"corpus: {len(corpus)} feeds, {size / 1024 / 1024:.1f} MiB")
+
+    basic_time, basic_results = _parse_all(parser.BasicParser(), corpus, args.repeat)
+    fast_time, fast_results = _parse_all(parser.FastParser(), corpus, args.repeat)
+    for name, elapsed in (("basic", basic_time), ("fast", fast_time)):
+        print(f"{name:6} {elapsed / args.repeat:8.3f}s per pass  {size * args.repeat / elapsed / 1024 / 1024:8.1f} MiB/s")
+    print(f"speedup {basic_time / fast_time:.1f}x")
+
+    mismatches = [name for name in basic_results if basic_results[name] != fast_results[name]]
+    print(f"feeds with different items: {len(mismatches)}")
+    for name in mismatches:
+        print(f"  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compares serializing a published result with pydantic's 'json()' and with 'PublishData.to_json()'.
+
+    python -m benchmark.serialization [--items 100,1000,5000] [--repeat N]
+
+The items are parsed once with 'FastParser', then every round builds and serializes a 'PublishData' the
+way the main loop does: validated and dumped by pydantic before, constructed and dumped by 'to_json' now.
+"""
+import argparse
+import json
+from time import perf_counter
+from benchmark import feeds
+from rss import parser
+import loop
+import utils
+
+
+def _ints(value: str):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--items", type=_ints, default=[100, 1000, 5000], help="feed sizes in items")
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    print(f"json encoder: {'orjson' if utils.orjson is not None else 'json'}")
+    print(f"{'items':>8}{'pydantic ms':>14}{'lean ms':>10}{'speedup':>10}")
+    for items_num in args.items:
+        items = parser.FastParser().parse(feeds.rss_feed(items=items_num))
+
+        start = perf_counter()
+        for _ in range(args.repeat):
+            before = loop.PublishData(link="https://example.org/feed", items=items, error=None).json()
+        pydantic_time = (perf_counter() - start) / args.repeat
+
+        start = perf_counter()
+        for _ in range(args.repeat):
+            after = loop.PublishData.construct(link="https://example.org/feed", items=items, error=None).to_json()
+        lean_time = (perf_counter() - start) / args.repeat
+
+        assert json.loads(before) == json.loads(after), "the serialized documents differ"
+        print(f"{items_num:>8}{pydantic_time * 1000:>14.2f}{lean_time * 1000:>10.2f}{pydantic_time / lean_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
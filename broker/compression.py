@@ -0,0 +1,66 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Compressor(ABC):
+    # value of the 'content_encoding' message property
+    encoding = ""
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplemented
+
+    @abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplemented
+
+
+class GzipCompressor(Compressor):
+    encoding = "gzip"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # a fixed mtime, so the same message is always compressed to the same bytes
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+
+class ZstdCompressor(Compressor):
+    """Needs the 'zstandard' package."""
+    encoding = "zstd"
+
+    def __init__(self, level: int = 3):
+        if zstandard is None:
+            raise ImportError("zstd compression needs the 'zstandard' package")
+        self.level = level
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+
+def get_compressor(encoding: str, level: Optional[int] = None) -> Optional[Compressor]:
+    """returns the compressor of a 'content_encoding', None for 'none'
+
+    :param level: compression level, defaults to the compressor's default.
+    """
+    compressors = {GzipCompressor.encoding: GzipCompressor, ZstdCompressor.encoding: ZstdCompressor}
+    if encoding == "none":
+        return None
+    if encoding not in compressors:
+        raise ValueError(f"unknown compression: {encoding}")
+    return compressors[encoding]() if level is None else compressors[encoding](level)
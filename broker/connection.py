@@ -0,0 +1,207 @@
+from abc import ABC, abstractmethod
+from logging import getLogger
+from threading import Event, Lock, Thread
+from typing import Callable, List, Optional
+from pika.adapters.select_connection import IOLoop, SelectConnection
+from pika.channel import Channel
+from broker import exceptions
+import pika
+
+
+class ChannelClient(ABC):
+    """A user of its own channel of a RabbitmqConnection.
+
+    The methods starting with an underscore run on the I/O thread. A lost channel is opened again, unless the
+    client is closing or the whole connection is lost, in which case it is opened along with the next connection.
+    """
+
+    def __init__(self, connection_: "RabbitmqConnection"):
+        self.connection = connection_
+        self.channel: Optional[Channel] = None
+        # set while the channel is open and set up
+        self.ready = Event()
+        self.closed = Event()
+        self._closing = False
+        self._connection: Optional[SelectConnection] = None
+
+    def wait_ready(self):
+        """blocks until the channel is ready
+
+        :raises ConnectionFailed: if the connection gives up first
+        """
+        while not self.ready.wait(0.1):
+            if self.connection.failed.is_set():
+                raise exceptions.ConnectionFailed
+
+    def close_channel(self, timeout: float = 5):
+        """closes the channel, after the callbacks handed over so far, and detaches from the connection"""
+        if not self.connection.failed.is_set():
+            self.connection.call_threadsafe(self._close)
+            if not self.closed.wait(timeout):
+                getLogger().error("Timed out closing a RabbitMQ channel")
+        self.connection.detach(self)
+
+    def on_connection_open(self, connection_: SelectConnection):
+        self._connection = connection_
+        self._open()
+
+    def _open(self):
+        if not self._closing and self._connection.is_open:
+            self._connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_channel_open(self, channel: Channel):
+        channel.add_on_close_callback(self._on_channel_closed)
+        self._setup(channel)
+
+    @abstractmethod
+    def _setup(self, channel: Channel):
+        """declares what the client needs on a new channel, then calls '_on_ready'"""
+        raise NotImplementedError
+
+    def _on_ready(self, channel: Channel):
+        if self._closing:
+            channel.close()
+            return
+        self.channel = channel
+        self.ready.set()
+
+    def _on_channel_lost(self):
+        """forgets the state of the lost channel"""
+        pass
+
+    def _on_channel_closed(self, channel: Channel, reason: Exception):
+        # the channels are closed along with their connection too
+        self.channel = None
+        self.ready.clear()
+        self._on_channel_lost()
+        if self._closing:
+            self.closed.set()
+        elif self._connection.is_open:
+            getLogger().error(f"RabbitMQ channel closed {reason}")
+            self.connection.call_later(self.connection.retry_interval, self._open)
+
+    def _close(self):
+        self._closing = True
+        if self.channel is not None and self.channel.is_open:
+            self.channel.close()
+        else:
+            self.closed.set()
+
+
+class RabbitmqConnection(Thread):
+    """One connection to RabbitMQ, driven by its own I/O thread.
+
+    Every client gets its own channel of the connection, so consuming, publishing and acking don't wait on each
+    other. The other threads never touch the connection or the channels, they hand callbacks over to the I/O
+    thread with 'call_threadsafe'. A lost connection is opened again after the retry interval, along with the
+    channels of the clients.
+    """
+
+    def __init__(self, rabbitmq_url: str, retry: int, retry_interval: float):
+        """
+
+        :param retry: number of failed connection attempts in a row to give up after.
+        :param retry_interval: seconds between two connection attempts.
+        """
+        super().__init__(name="RabbitmqConnection", daemon=True)
+        self.connection_params = pika.connection.URLParameters(rabbitmq_url)
+        self.retry = retry
+        self.retry_interval = retry_interval
+        # set once the connection gives up, the clients raise ConnectionFailed
+        self.failed = Event()
+        self._ioloop = IOLoop()
+        self._connection: Optional[SelectConnection] = None
+        # only used by the I/O thread
+        self._clients: List[ChannelClient] = []
+        self._lock = Lock()
+        self._users = 0
+        self._attempts = 0
+        self._closing = False
+
+    def attach(self, client: ChannelClient):
+        """adds a client, its channel is opened as soon as the connection is"""
+        with self._lock:
+            self._users += 1
+            if not self.is_alive() and not self._closing:
+                self.start()
+        self.call_threadsafe(lambda: self._add(client))
+
+    def detach(self, client: ChannelClient, timeout: float = 5):
+        """removes a client, the connection is closed along with its last client"""
+        with self._lock:
+            self._users -= 1
+            last = self._users == 0
+            if last:
+                self._closing = True
+        if self.failed.is_set():
+            return
+        self.call_threadsafe(lambda: self._clients.remove(client))
+        if last:
+            self.call_threadsafe(self._close)
+            self.join(timeout)
+
+    def call_threadsafe(self, callback: Callable[[], None]):
+        """runs the callback on the I/O thread, the callbacks run in the order they are given
+
+        :raises ConnectionFailed: if the connection has given up
+        """
+        if self.failed.is_set():
+            raise exceptions.ConnectionFailed
+        self._ioloop.add_callback_threadsafe(callback)
+
+    def call_later(self, delay: float, callback: Callable[[], None]):
+        """runs the callback on the I/O thread after delay seconds, only to be called on the I/O thread"""
+        self._ioloop.call_later(delay, callback)
+
+    def run(self):
+        self._connect()
+        self._ioloop.start()
+        self._ioloop.close()
+
+    def _connect(self):
+        getLogger().info("Trying to connect to RabbitMQ ...")
+        self._connection = SelectConnection(
+            self.connection_params,
+            on_open_callback=self._on_open,
+            on_open_error_callback=self._on_open_error,
+            on_close_callback=self._on_closed,
+            custom_ioloop=self._ioloop
+        )
+
+    def _add(self, client: ChannelClient):
+        self._clients.append(client)
+        if self._connection is not None and self._connection.is_open:
+            client.on_connection_open(self._connection)
+
+    def _on_open(self, connection: SelectConnection):
+        getLogger().info("Connected to RabbitMQ")
+        self._attempts = 0
+        for client in self._clients:
+            client.on_connection_open(connection)
+
+    def _on_open_error(self, connection: SelectConnection, error: Exception):
+        getLogger().error(f"Connection to RabbitMQ failed {error}")
+        self._attempts += 1
+        if self._closing:
+            self._ioloop.stop()
+        elif self._attempts >= self.retry:
+            getLogger().error(f"Giving up connecting to RabbitMQ: {self.connection_params}")
+            self.failed.set()
+            self._ioloop.stop()
+        else:
+            self.call_later(self.retry_interval, self._connect)
+
+    def _on_closed(self, connection: SelectConnection, reason: Exception):
+        if self._closing:
+            self._ioloop.stop()
+        else:
+            getLogger().error(f"Connection to RabbitMQ lost {reason}")
+            self.call_later(self.retry_interval, self._connect)
+
+    def _close(self):
+        if self._connection is not None and not (self._connection.is_closed or self._connection.is_closing):
+            # the loop stops once the connection is closed, or its opening is aborted
+            self._connection.close()
+        else:
+            self._ioloop.stop()
+
@@ -0,0 +1,143 @@
+from abc import ABC, abstractmethod
+from enum import Enum
+from threading import Lock
+from time import time
+from typing import Dict, List, Optional
+from uuid import uuid4
+import sqlite3
+
+
+class LeaseState(str, Enum):
+    # the caller holds the lease and should fetch the link
+    acquired = "acquired"
+    # another worker holds the lease, the link is being fetched right now
+    held = "held"
+    # a worker, this one included, has completed the link recently
+    done = "done"
+
+
+class LeaseRegistry(ABC):
+    """Leases on the links being fetched, shared by all the workers.
+
+    A worker fetches a link only if it gets its lease, so the same feed is not fetched concurrently by several
+    workers. A lease expires after its ttl, in case its worker dies without releasing it. A link completed by
+    any worker, this one included, is reported as 'done' for a while, so a repeated task isn't fetched again.
+    """
+
+    def __init__(self, fresh_for: float = 60, owner: Optional[str] = None):
+        """
+
+        :param fresh_for: seconds a completed link is reported as 'done', to every worker.
+        :param owner: unique name of this worker, a random one by default.
+        """
+        self.fresh_for = fresh_for
+        self.owner = owner or uuid4().hex
+
+    @abstractmethod
+    def acquire(self, link: str, ttl: float) -> LeaseState:
+        """tries to take the lease of the link for ttl seconds"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release(self, link: str, completed: bool):
+        """gives up the lease of the link, if this worker holds it
+
+        :param completed: the result of the link is published, so other workers don't need to fetch it.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Closes all open resources."""
+        pass
+
+
+class _Lease:
+    __slots__ = ("owner", "expires_at", "completed_at")
+
+    def __init__(self):
+        self.owner: Optional[str] = None
+        self.expires_at = 0.0
+        self.completed_at = 0.0
+
+
+class InMemoryLeaseRegistry(LeaseRegistry):
+    """Stand-in registry for a single process, registries sharing the same leases dict act as separate workers."""
+
+    def __init__(self, fresh_for: float = 60, owner: Optional[str] = None, leases: Optional[Dict] = None):
+        super().__init__(fresh_for, owner)
+        self._leases: Dict[str, _Lease] = leases if leases is not None else {}
+        self._lock = Lock()
+
+    def acquire(self, link: str, ttl: float) -> LeaseState:
+        now = time()
+        with self._lock:
+            lease = self._leases.setdefault(link, _Lease())
+            if lease.owner not in (None, self.owner) and lease.expires_at > now:
+                return LeaseState.held
+            if lease.completed_at > now - self.fresh_for:
+                return LeaseState.done
+            lease.owner = self.owner
+            lease.expires_at = now + ttl
+            return LeaseState.acquired
+
+    def release(self, link: str, completed: bool):
+        with self._lock:
+            lease = self._leases.get(link)
+            if lease is None or lease.owner != self.owner:
+                return
+            lease.owner = None
+            lease.expires_at = 0.0
+            if completed:
+                lease.completed_at = time()
+            # the entry is only worth keeping to report the link as done
+            if lease.completed_at <= time() - self.fresh_for:
+                del self._leases[link]
+
+
+class SqliteLeaseRegistry(LeaseRegistry):
+    """Registry in a sqlite file, shared by the worker processes of a host or a shared volume."""
+
+    def __init__(self, path: str, fresh_for: float = 60, owner: Optional[str] = None):
+        super().__init__(fresh_for, owner)
+        # autocommit, every statement is its own transaction
+        self._db = sqlite3.connect(path, isolation_level=None, timeout=10)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leases "
+            "(link TEXT PRIMARY KEY, owner TEXT, expires_at REAL, completed_at REAL)"
+        )
+        self._db.execute(
+            "DELETE FROM leases WHERE expires_at < ? AND completed_at < ?", (time(), time() - fresh_for)
+        )
+
+    def acquire(self, link: str, ttl: float) -> LeaseState:
+        now = time()
+        # takes the lease only if it is free or expired, and the link is not completed recently
+        taken = self._db.execute(
+            "INSERT INTO leases (link, owner, expires_at, completed_at) VALUES (?, ?, ?, 0) "
+            "ON CONFLICT (link) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE (leases.owner IS NULL OR leases.owner = excluded.owner OR leases.expires_at <= ?) "
+            "AND leases.completed_at <= ?",
+            (link, self.owner, now + ttl, now, now - self.fresh_for)
+        ).rowcount
+        if taken:
+            return LeaseState.acquired
+        row: List = self._db.execute(
+            "SELECT owner, expires_at FROM leases WHERE link = ?", (link,)
+        ).fetchone()
+        if row is not None and row[0] not in (None, self.owner) and row[1] > now:
+            return LeaseState.held
+        return LeaseState.done
+
+    def release(self, link: str, completed: bool):
+        if completed:
+            self._db.execute(
+                "UPDATE leases SET owner = NULL, expires_at = 0, completed_at = ? WHERE link = ? AND owner = ?",
+                (time(), link, self.owner)
+            )
+        else:
+            self._db.execute(
+                "UPDATE leases SET owner = NULL, expires_at = 0 WHERE link = ? AND owner = ?", (link, self.owner)
+            )
+
+    def close(self):
+        self._db.close()
@@ -1,10 +1,17 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from functools import partial
+from itertools import takewhile
+from threading import Event
 from pika.adapters.blocking_connection import BlockingChannel
+from pika.channel import Channel
 from pika.exceptions import AMQPConnectionError, ChannelError
 import pika
 from logging import getLogger
-from time import sleep
-from broker import exceptions
+from time import sleep, monotonic
+from typing import Hashable, List, Optional, Tuple
+from broker import connection, exceptions
+from broker.compression import Compressor
 
 
 class Publisher(ABC):
@@ -18,19 +25,63 @@ class Publisher(ABC):
         """Closes all open resources."""
         raise NotImplemented
 
+    def publish_tracked(self, msg: bytes, tag: Hashable) -> List[Hashable]:
+        """Publishes the msg and returns the tags of the messages that are safely published so far.
 
-class RabbitmqPublisher(Publisher):
+        Publishers buffering messages may return an empty list, the tag is returned by a later call
+        or by 'flush'.
+        """
+        self.publish(msg)
+        return [tag]
+
+    def flush(self, force: bool = False) -> List[Hashable]:
+        """Publishes the buffered messages if due (or if forced)
+
+        returns the tags of the messages that are safely published.
+        """
+        return []
+
+    def flush_due(self) -> Optional[float]:
+        """returns the seconds until the buffered messages are due, None if nothing is buffered"""
+        return None
+
+
+class _Encoding:
+    """Compresses the messages of a publisher, if it has a compressor"""
+
+    def _init_encoding(self, compressor: Optional[Compressor], compress_min_size: int):
+        self.publish_props = pika.BasicProperties(delivery_mode=2)
+        self.compressor = compressor
+        self.compress_min_size = compress_min_size
+        if compressor is not None:
+            self.compressed_props = pika.BasicProperties(delivery_mode=2, content_encoding=compressor.encoding)
+
+    def _encode(self, msg: bytes) -> Tuple[bytes, pika.BasicProperties]:
+        """returns the body and the properties to publish the msg with"""
+        if self.compressor is None or len(msg) < self.compress_min_size:
+            return msg, self.publish_props
+        return self.compressor.compress(msg), self.compressed_props
+
+
+class RabbitmqPublisher(Publisher, _Encoding):
     def __init__(
             self, rabbitmq_url: str, exchange_name: str,
             routing_key: str, retry: int,
-            retry_interval: int
+            retry_interval: int,
+            compressor: Optional[Compressor] = None,
+            compress_min_size: int = 1024
     ):
+        """
+
+        :param compressor: if given, message bodies are compressed and their 'content_encoding' is set.
+        :param compress_min_size: messages smaller than this many bytes are sent uncompressed.
+        """
         self.connection_params = pika.connection.URLParameters(rabbitmq_url)
         self.exchange_name = exchange_name
         self.routing_key = routing_key
         self.retry = retry
         self.retry_interval = retry_interval
-        self.publish_props = pika.BasicProperties(delivery_mode=2)
+        self._init_encoding(compressor, compress_min_size)
 
         self.channel = self._connect()
 
@@ -56,19 +107,230 @@ class RabbitmqPublisher(Publisher):
             raise exceptions.ConnectionFailed
 
     def publish(self, msg: bytes):
-        try:
-            self.channel.basic_publish(
-                self.exchange_name,
-                self.routing_key,
-                msg,
-                self.publish_props
-            )
-        except (AMQPConnectionError, ChannelError) as e:
-            getLogger().error(f"Connection to RabbitMQ failed {e}")
-            self.channel = self._connect()
+        """publishes the msg, again on a new channel if the connection fails
+
+        :raises ConnectionFailed: if all the retries fail
+        """
+        body, props = self._encode(msg)
+        for _ in range(self.retry):
+            try:
+                self.channel.basic_publish(
+                    self.exchange_name,
+                    self.routing_key,
+                    body,
+                    props
+                )
+            except (AMQPConnectionError, ChannelError) as e:
+                getLogger().error(f"Connection to RabbitMQ failed {e}")
+                self.channel = self._connect()
+            else:
+                return
+        else:
+            getLogger().error("Giving up publishing a message")
+            raise exceptions.ConnectionFailed
 
     def close(self):
         try:
             self.channel.close()
         except Exception as e:
             getLogger().exception(e)
+
+
+class RabbitmqBatchPublisher(RabbitmqPublisher):
+    """Buffers the messages and publishes them in batches.
+
+    Each batch is published in an AMQP transaction, once committed the broker has taken the responsibility
+    for all the messages of the batch. In case of a connection failure the whole batch is published again,
+    so messages are delivered at least once.
+    """
+
+    def __init__(
+            self, rabbitmq_url: str, exchange_name: str,
+            routing_key: str, retry: int,
+            retry_interval: int, batch_size: int,
+            batch_interval: float,
+            compressor: Optional[Compressor] = None,
+            compress_min_size: int = 1024
+    ):
+        """
+
+        :param batch_size: max number of messages in a batch.
+        :param batch_interval: max seconds a message waits in the buffer.
+        """
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        # encoded messages with their properties and tags
+        self.batch: List[Tuple[bytes, pika.BasicProperties, Hashable]] = []
+        self.batch_started = 0.0
+        super().__init__(
+            rabbitmq_url, exchange_name, routing_key, retry, retry_interval, compressor, compress_min_size
+        )
+
+    def _connect(self) -> BlockingChannel:
+        channel = super()._connect()
+        channel.tx_select()
+        return channel
+
+    def publish(self, msg: bytes):
+        self.publish_tracked(msg, None)
+
+    def publish_tracked(self, msg: bytes, tag: Hashable) -> List[Hashable]:
+        if not self.batch:
+            self.batch_started = monotonic()
+        self.batch.append((*self._encode(msg), tag))
+        return self.flush()
+
+    def flush_due(self) -> Optional[float]:
+        if not self.batch:
+            return None
+        return max(0.0, self.batch_interval - (monotonic() - self.batch_started))
+
+    def flush(self, force: bool = False) -> List[Hashable]:
+        if not self.batch:
+            return []
+        if not force and len(self.batch) < self.batch_size and monotonic() - self.batch_started < self.batch_interval:
+            return []
+
+        for _ in range(self.retry):
+            try:
+                for body, props, _ in self.batch:
+                    self.channel.basic_publish(self.exchange_name, self.routing_key, body, props)
+                self.channel.tx_commit()
+            except (AMQPConnectionError, ChannelError) as e:
+                getLogger().error(f"Connection to RabbitMQ failed {e}")
+                self.channel = self._connect()
+            else:
+                tags = [tag for _, _, tag in self.batch if tag is not None]
+                self.batch = []
+                return tags
+        else:
+            getLogger().error(f"Giving up publishing a batch of {len(self.batch)} messages")
+            raise exceptions.ConnectionFailed
+
+
+class ThreadedPublisher(Publisher, _Encoding, connection.ChannelClient):
+    """Publishes with publisher confirms on its own channel of a RabbitmqConnection.
+
+    Publishing returns at once, the tag of a message is returned by a later call once the broker confirms it.
+    The messages not confirmed when their channel is lost are published again on the next one, so messages are
+    delivered at least once.
+    """
+
+    def __init__(
+            self, connection_: connection.RabbitmqConnection, exchange_name: str, routing_key: str,
+            compressor: Optional[Compressor] = None, compress_min_size: int = 1024, flush_timeout: float = 5,
+            confirm_poll: float = 0.05
+    ):
+        """
+
+        :param connection_: connection shared with the other clients.
+        :param compressor: if given, message bodies are compressed and their 'content_encoding' is set.
+        :param compress_min_size: messages smaller than this many bytes are sent uncompressed.
+        :param flush_timeout: max seconds a forced flush waits for the confirms of all the messages.
+        :param confirm_poll: max seconds for the caller to wait before taking the confirms, while messages are
+            pending. The confirms come on the I/O thread, which can't wake the caller's wait.
+        """
+        super().__init__(connection_)
+        self.exchange_name = exchange_name
+        self.routing_key = routing_key
+        self.flush_timeout = flush_timeout
+        self.confirm_poll = confirm_poll
+        self._init_encoding(compressor, compress_min_size)
+        # number of messages published and not taken back as confirmed yet
+        self.pending = 0
+        # tags of the confirmed messages, filled by the I/O thread
+        self.confirmed = deque()
+        self.confirm_event = Event()
+        # owned by the I/O thread: messages waiting for a channel and messages waiting for their confirms by
+        # their publish sequence number
+        self.outbox: deque = deque()
+        self.unconfirmed: "OrderedDict[int, Tuple[bytes, pika.BasicProperties, Hashable]]" = OrderedDict()
+        self.sequence = 0
+        connection_.attach(self)
+        self.wait_ready()
+
+    def publish(self, msg: bytes):
+        self.publish_tracked(msg, None)
+
+    def publish_tracked(self, msg: bytes, tag: Hashable) -> List[Hashable]:
+        # compressing on the caller's thread keeps the I/O thread free for the network
+        message = (*self._encode(msg), tag)
+        self.connection.call_threadsafe(partial(self._publish, message))
+        self.pending += 1
+        return self._take_confirmed()
+
+    def flush(self, force: bool = False) -> List[Hashable]:
+        """returns the tags confirmed so far, a forced flush waits for all the pending ones"""
+        if not force:
+            return self._take_confirmed()
+        deadline = monotonic() + self.flush_timeout
+        tags = []
+        while True:
+            self.confirm_event.clear()
+            tags.extend(self._take_confirmed())
+            if self.pending == 0 or monotonic() >= deadline or self.connection.failed.is_set():
+                return tags
+            self.confirm_event.wait(deadline - monotonic())
+
+    def flush_due(self) -> Optional[float]:
+        if self.confirmed:
+            return 0
+        return self.confirm_poll if self.pending else None
+
+    def _take_confirmed(self) -> List[Hashable]:
+        tags = []
+        while self.confirmed:
+            tag = self.confirmed.popleft()
+            self.pending -= 1
+            if tag is not None:
+                tags.append(tag)
+        return tags
+
+    def close(self):
+        self.flush(force=True)
+        if self.pending:
+            getLogger().error(f"Closing the publisher with {self.pending} messages not confirmed")
+        self.close_channel()
+
+    def _setup(self, channel: Channel):
+        channel.exchange_declare(self.exchange_name, 'direct', durable=True)
+        channel.confirm_delivery(self._on_confirm, callback=lambda _: self._on_confirming(channel))
+
+    def _on_confirming(self, channel: Channel):
+        self.sequence = 0
+        # the messages of the lost channel go first, in their order
+        self.outbox.extendleft(reversed(self.unconfirmed.values()))
+        self.unconfirmed.clear()
+        self._on_ready(channel)
+        self._send()
+
+    def _publish(self, message: Tuple[bytes, pika.BasicProperties, Hashable]):
+        self.outbox.append(message)
+        self._send()
+
+    def _send(self):
+        if self.channel is None:
+            return
+        while self.outbox:
+            message = self.outbox.popleft()
+            self.channel.basic_publish(self.exchange_name, self.routing_key, message[0], message[1])
+            self.sequence += 1
+            self.unconfirmed[self.sequence] = message
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        if method.multiple:
+            sequences = list(takewhile(lambda sequence: sequence <= method.delivery_tag, self.unconfirmed))
+        else:
+            sequences = [method.delivery_tag]
+        for sequence in sequences:
+            message = self.unconfirmed.pop(sequence, None)
+            if message is None:
+                continue
+            if isinstance(method, pika.spec.Basic.Ack):
+                self.confirmed.append(message[2])
+            else:
+                getLogger().error("RabbitMQ could not take a message, publishing it again")
+                self.outbox.append(message)
+        self.confirm_event.set()
+        self._send()
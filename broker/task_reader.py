@@ -1,22 +1,27 @@
 from abc import ABC, abstractmethod
-from typing import Generator, Optional, Tuple
+from typing import Generator, Iterable, List, Optional, Tuple
+from collections import deque
+from functools import partial
+from queue import Empty, Queue
 from pika.adapters.blocking_connection import BlockingChannel
+from pika.channel import Channel
 from pika.exceptions import AMQPConnectionError, ChannelError
 from broker import schema
 import pika
 from json import JSONDecodeError
 from logging import getLogger
 from pydantic import ValidationError
-from time import sleep
-from broker import exceptions
+from time import sleep, monotonic
+from broker import connection, exceptions
 
 
 class TaskReader(ABC):
     @abstractmethod
-    def get_task(self) -> Generator[Tuple[Optional[schema.Task], Optional[int]], None, None]:
+    def get_task(self) -> Generator[Tuple[Optional[schema.Task], Optional[int]], Optional[float], None]:
         """blocking task getter.
 
-        returns None in case of read timeout.
+        returns None in case of read timeout. The caller may send the max seconds to wait for the next task,
+        None (or 'next') waits for the reader's own read timeout.
         """
         raise NotImplemented
 
@@ -35,15 +40,99 @@ class TaskReader(ABC):
         """Reject the task_id"""
         raise NotImplemented
 
+    def ack_many(self, task_ids: Iterable):
+        """Acknowledge the completion of all the task_ids"""
+        for task_id in task_ids:
+            self.ack(task_id)
+
+
+class AckCoalescer:
+    """Keeps track of delivered and completed delivery tags, to ack them in batches.
+
+    The completed tags at the start of the delivered ones form a contiguous range, which is acked with
+    a single 'multiple' ack. The completed tags after a pending one are acked one by one on forced flushes,
+    so a slow task can't hold back the acks of the others for longer than the flush interval.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        """
+
+        :param batch_size: number of completed tags to flush after.
+        :param flush_interval: max seconds a completed tag waits before being flushed.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.delivered = deque()
+        self.completed = set()
+        self.rejected = set()
+        self.last_flush = monotonic()
+
+    def deliver(self, tag: int):
+        self.delivered.append(tag)
+
+    def complete(self, tag: int):
+        self.completed.add(tag)
+
+    def reject(self, tag: int):
+        self.rejected.add(tag)
+
+    @property
+    def due(self) -> bool:
+        return bool(self.completed) and (
+            len(self.completed) >= self.batch_size or monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def flush(self, force: bool = False) -> Tuple[Optional[int], List[int]]:
+        """returns the tag to ack with 'multiple' (if any) and the tags to ack one by one
+
+        flushes are forced once the flush interval is over.
+        """
+        force = force or monotonic() - self.last_flush >= self.flush_interval
+        if force:
+            # only a forced flush empties 'completed', so steady acks can't keep postponing it
+            self.last_flush = monotonic()
+        multiple_tag = None
+        while self.delivered and (self.delivered[0] in self.completed or self.delivered[0] in self.rejected):
+            tag = self.delivered.popleft()
+            if tag in self.completed:
+                self.completed.remove(tag)
+                multiple_tag = tag
+            else:
+                self.rejected.remove(tag)
+
+        singles = []
+        if force and self.completed:
+            singles = sorted(self.completed)
+            self.delivered = deque(tag for tag in self.delivered if tag not in self.completed)
+            self.completed.clear()
+        return multiple_tag, singles
+
+    def reset(self):
+        """forgets all the tags, i.e. because the channel they belong to is gone"""
+        self.delivered.clear()
+        self.completed.clear()
+        self.rejected.clear()
+
 
 class RabbitmqTaskReader(TaskReader):
+    """Consumes the tasks on a blocking channel, driven by the caller.
+
+    A task id is the generation of its channel with its delivery tag: the broker requeues the unacked deliveries
+    of a lost channel, so the acks and rejects of their task ids are ignored after a reconnection.
+    """
 
     def __init__(
             self, rabbitmq_url: str, prefetch: int,
             queue_name: str, exchange_name: str,
             binding_key: str, interval_timeout: int,
-            retry: int, retry_interval: int
+            retry: int, retry_interval: int,
+            ack_batch_size: int = 1, ack_flush_interval: float = 0.5
     ):
+        """
+
+        :param ack_batch_size: number of completed tasks to ack together, 1 acks every task on its own.
+        :param ack_flush_interval: max seconds a completed task waits for its ack when batching.
+        """
         self.connection_params = pika.connection.URLParameters(rabbitmq_url)
         self.prefetch = prefetch
         self.queue_name = queue_name
@@ -53,6 +142,14 @@ class RabbitmqTaskReader(TaskReader):
         self.retry = retry
         self.retry_interval = retry_interval
         self.last_delivery_tag = None
+        self.ack_coalescer = None
+        if ack_batch_size > 1:
+            self.ack_coalescer = AckCoalescer(ack_batch_size, ack_flush_interval)
+        # (delivery tag, body) of the deliveries dispatched by the channel, at most prefetch of them
+        self.deliveries = deque()
+        self.consumer_tag = None
+        # number of channels lost so far
+        self.generation = 0
 
         self.channel = self._connect()
 
@@ -72,6 +169,7 @@ class RabbitmqTaskReader(TaskReader):
                     self.queue_name, durable=True
                 )
                 channel.queue_bind(self.queue_name, self.exchange_name, self.binding_key)
+                self.consumer_tag = channel.basic_consume(self.queue_name, self._on_message)
             except (AMQPConnectionError, ChannelError) as e:
                 getLogger().error(f"Connection to RabbitMQ failed {e}")
                 sleep(self.retry_interval)
@@ -82,49 +180,246 @@ class RabbitmqTaskReader(TaskReader):
             getLogger().error(f"Giving up connecting to RabbitMQ: {self.connection_params}")
             raise exceptions.ConnectionFailed
 
-    def get_task(self) -> [Tuple[Optional[schema.Task], Optional[int]], None, None]:
+    def _on_message(self, channel: BlockingChannel, method_frame, properties, body: bytes):
+        if self.ack_coalescer is not None:
+            self.ack_coalescer.deliver(method_frame.delivery_tag)
+        self.deliveries.append((method_frame.delivery_tag, body))
+
+    def get_task(self) -> Generator[Tuple[Optional[schema.Task], Optional[Tuple[int, int]]], Optional[float], None]:
+        timeout = self.interval_timeout
         while True:
             try:
-                for method_frame, properties, body in self.channel.consume(
-                        self.queue_name, inactivity_timeout=self.interval_timeout
-                ):
-                    if body is None:
-                        # in case of inactivity timeout
-                        yield None, None
-                        continue
-                    try:
-                        result = schema.Task.parse_raw(body)
-                    except (JSONDecodeError, ValidationError, TypeError) as e:
-                        getLogger().error(f"While getting tasks, received bad format data: {body}")
-                        getLogger().exception(e)
-                        self.channel.basic_ack(delivery_tag=method_frame.delivery_tag)
-                        continue
-                    else:
-                        yield result, method_frame.delivery_tag
+                if not self.deliveries:
+                    # returns as soon as deliveries are dispatched to '_on_message', or on timeout
+                    self.channel.connection.process_data_events(time_limit=timeout)
+                if self.ack_coalescer is not None and self.ack_coalescer.due:
+                    self._flush_acks()
             except (AMQPConnectionError, ChannelError) as e:
                 getLogger().error(f"Connection to RabbitMQ failed {e}")
-                self.channel = self._connect()
+                self._reconnect()
+                continue
+            if not self.deliveries:
+                # in case of read timeout
+                timeout = yield None, None
+                timeout = self.interval_timeout if timeout is None else timeout
+                continue
+            delivery_tag, body = self.deliveries.popleft()
+            task_id = (self.generation, delivery_tag)
+            try:
+                result = schema.Task.parse_raw(body)
+            except (JSONDecodeError, ValidationError, TypeError) as e:
+                getLogger().error(f"While getting tasks, received bad format data: {body}")
+                getLogger().exception(e)
+                self.ack(task_id)
                 continue
+            timeout = yield result, task_id
+            timeout = self.interval_timeout if timeout is None else timeout
+
+    def _reconnect(self):
+        # the unacked deliveries of the lost channel are requeued by the broker
+        self.generation += 1
+        self.deliveries.clear()
+        if self.ack_coalescer is not None:
+            self.ack_coalescer.reset()
+        self.channel = self._connect()
+
+    def _flush_acks(self, force: bool = False):
+        multiple_tag, singles = self.ack_coalescer.flush(force)
+        try:
+            if multiple_tag is not None:
+                self.channel.basic_ack(delivery_tag=multiple_tag, multiple=True)
+            for tag in singles:
+                self.channel.basic_ack(delivery_tag=tag)
+        except (AMQPConnectionError, ChannelError) as e:
+            getLogger().error(f"Connection to RabbitMQ failed {e}")
+            self._reconnect()
 
     def close(self):
         try:
-            self.channel.cancel()
+            if self.ack_coalescer is not None:
+                self._flush_acks(force=True)
+            self.channel.basic_cancel(self.consumer_tag)
             self.channel.close()
         except Exception as e:
             getLogger().exception(e)
 
+    def _current_tags(self, task_ids: Iterable[Tuple[int, int]]) -> List[int]:
+        """returns the delivery tags of the task ids delivered on the open channel"""
+        return [delivery_tag for generation, delivery_tag in task_ids if generation == self.generation]
+
     def ack(self, task_id):
+        self.ack_many((task_id,))
+
+    def ack_many(self, task_ids: Iterable):
+        delivery_tags = self._current_tags(task_ids)
+        if self.ack_coalescer is not None:
+            for delivery_tag in delivery_tags:
+                self.ack_coalescer.complete(delivery_tag)
+            if self.ack_coalescer.due:
+                self._flush_acks()
+            return
         try:
-            self.channel.basic_ack(delivery_tag=task_id)
+            for delivery_tag in delivery_tags:
+                self.channel.basic_ack(delivery_tag=delivery_tag)
         except (AMQPConnectionError, ChannelError) as e:
+            # the deliveries not acked yet are requeued along with the channel
             getLogger().error(f"Connection to RabbitMQ failed {e}")
-            self.channel = self._connect()
-            self.channel.basic_ack(delivery_tag=task_id)
+            self._reconnect()
 
     def reject(self, task_id):
-        try:
-            self.channel.basic_reject(delivery_tag=task_id)
-        except (AMQPConnectionError, ChannelError) as e:
-            getLogger().error(f"Connection to RabbitMQ failed {e}")
-            self.channel = self._connect()
-            self.channel.basic_reject(delivery_tag=task_id)
+        for delivery_tag in self._current_tags((task_id,)):
+            if self.ack_coalescer is not None:
+                self.ack_coalescer.reject(delivery_tag)
+            try:
+                self.channel.basic_reject(delivery_tag=delivery_tag)
+            except (AMQPConnectionError, ChannelError) as e:
+                # the delivery is requeued along with the channel
+                getLogger().error(f"Connection to RabbitMQ failed {e}")
+                self._reconnect()
+
+
+class ThreadedTaskReader(TaskReader, connection.ChannelClient):
+    """Consumes the tasks on its own channel of a RabbitmqConnection.
+
+    The I/O thread buffers the deliveries, so the caller waits on a local queue instead of the network, and acks
+    and rejects return at once. A task id is the generation of its channel with its delivery tag: the broker
+    requeues the unacked deliveries of a lost channel, so their buffered deliveries are dropped and their acks
+    are ignored.
+    """
+
+    def __init__(
+            self, connection_: connection.RabbitmqConnection, prefetch: int,
+            queue_name: str, exchange_name: str, binding_key: str,
+            poll_interval: float = 0.05, ack_batch_size: int = 1, ack_flush_interval: float = 0.5
+    ):
+        """
+
+        :param connection_: connection shared with the other clients.
+        :param poll_interval: max seconds 'get_task' waits for a task. The wait costs no round trip, it only
+            bounds how long the caller is kept from its other work.
+        :param ack_batch_size: number of completed tasks to ack together, 1 acks every task on its own.
+        :param ack_flush_interval: max seconds a completed task waits for its ack when batching.
+        """
+        super().__init__(connection_)
+        self.prefetch = prefetch
+        self.queue_name = queue_name
+        self.exchange_name = exchange_name
+        self.binding_key = binding_key
+        self.poll_interval = poll_interval
+        # (generation, delivery tag, body) of the deliveries, at most prefetch of them
+        self.deliveries: Queue = Queue()
+        self.generation = 0
+        self.ack_coalescer = None
+        if ack_batch_size > 1:
+            self.ack_coalescer = AckCoalescer(ack_batch_size, ack_flush_interval)
+        connection_.attach(self)
+        self.wait_ready()
+
+    def get_task(self) -> Generator[Tuple[Optional[schema.Task], Optional[Tuple[int, int]]], Optional[float], None]:
+        timeout = self.poll_interval
+        while True:
+            try:
+                generation, delivery_tag, body = self.deliveries.get(timeout=timeout)
+            except Empty:
+                if self.connection.failed.is_set():
+                    raise exceptions.ConnectionFailed
+                timeout = yield None, None
+                timeout = self.poll_interval if timeout is None else timeout
+                continue
+            if generation != self.generation:
+                # requeued by the broker along with its channel
+                continue
+            task_id = (generation, delivery_tag)
+            try:
+                result = schema.Task.parse_raw(body)
+            except (JSONDecodeError, ValidationError, TypeError) as e:
+                getLogger().error(f"While getting tasks, received bad format data: {body}")
+                getLogger().exception(e)
+                self.ack(task_id)
+                continue
+            timeout = yield result, task_id
+            timeout = self.poll_interval if timeout is None else timeout
+
+    def ack(self, task_id):
+        self.ack_many((task_id,))
+
+    def ack_many(self, task_ids: Iterable):
+        task_ids = list(task_ids)
+        if task_ids:
+            self.connection.call_threadsafe(partial(self._ack, task_ids))
+
+    def reject(self, task_id):
+        self.connection.call_threadsafe(partial(self._reject, task_id))
+
+    def close(self):
+        self.close_channel()
+
+    def _setup(self, channel: Channel):
+        # the channel sends its requests one after the other, each once the previous one is answered
+        channel.exchange_declare(self.exchange_name, 'direct', durable=True)
+        channel.basic_qos(prefetch_count=self.prefetch)
+        channel.queue_declare(self.queue_name, durable=True)
+        channel.queue_bind(self.queue_name, self.exchange_name, self.binding_key)
+        # a consumer cancelled by the broker, i.e. on a deleted queue, is started again on a new channel
+        channel.add_on_cancel_callback(lambda _: channel.close())
+        channel.basic_consume(self.queue_name, self._on_message, callback=lambda _: self._on_consuming(channel))
+
+    def _on_consuming(self, channel: Channel):
+        self._on_ready(channel)
+        if self.ack_coalescer is not None:
+            self.connection.call_later(
+                self.ack_coalescer.flush_interval, partial(self._on_flush_timer, self.generation)
+            )
+
+    def _on_message(self, channel: Channel, method, properties, body: bytes):
+        if self.ack_coalescer is not None:
+            self.ack_coalescer.deliver(method.delivery_tag)
+        self.deliveries.put((self.generation, method.delivery_tag, body))
+
+    def _on_channel_lost(self):
+        # the deliveries still buffered are stale from now on
+        self.generation += 1
+        if self.ack_coalescer is not None:
+            self.ack_coalescer.reset()
+
+    def _current_tags(self, task_ids: Iterable[Tuple[int, int]]) -> List[int]:
+        """returns the delivery tags of the task ids delivered on the open channel"""
+        if self.channel is None:
+            return []
+        return [delivery_tag for generation, delivery_tag in task_ids if generation == self.generation]
+
+    def _ack(self, task_ids: List[Tuple[int, int]]):
+        delivery_tags = self._current_tags(task_ids)
+        if self.ack_coalescer is not None:
+            for delivery_tag in delivery_tags:
+                self.ack_coalescer.complete(delivery_tag)
+            if self.ack_coalescer.due:
+                self._flush_acks()
+            return
+        for delivery_tag in delivery_tags:
+            self.channel.basic_ack(delivery_tag=delivery_tag)
+
+    def _reject(self, task_id: Tuple[int, int]):
+        for delivery_tag in self._current_tags((task_id,)):
+            if self.ack_coalescer is not None:
+                self.ack_coalescer.reject(delivery_tag)
+            self.channel.basic_reject(delivery_tag=delivery_tag)
+
+    def _flush_acks(self, force: bool = False):
+        multiple_tag, singles = self.ack_coalescer.flush(force)
+        if multiple_tag is not None:
+            self.channel.basic_ack(delivery_tag=multiple_tag, multiple=True)
+        for delivery_tag in singles:
+            self.channel.basic_ack(delivery_tag=delivery_tag)
+
+    def _on_flush_timer(self, generation: int):
+        if self.channel is None or generation != self.generation:
+            return
+        if self.ack_coalescer.due:
+            self._flush_acks()
+        self.connection.call_later(self.ack_coalescer.flush_interval, partial(self._on_flush_timer, generation))
+
+    def _close(self):
+        if self.ack_coalescer is not None and self.channel is not None:
+            self._flush_acks(force=True)
+        super()._close()
@@ -1,9 +1,14 @@
 from pydantic import (
     BaseSettings,
     Field,
-    PositiveInt
+    NonNegativeFloat,
+    NonNegativeInt,
+    PositiveFloat,
+    PositiveInt,
+    root_validator
 )
 from enum import Enum
+from typing import Optional
 
 
 class Config(BaseSettings):
@@ -13,6 +18,40 @@ class Config(BaseSettings):
         warning = "WARNING"
     log_level: _LogLevel = Field('INFO', env='LOG_LEVEL')
 
+    metrics_port: Optional[PositiveInt] = Field(
+        None, env="METRICS_PORT",
+        description="Port to serve Prometheus metrics on at /metrics, disabled if not set. "
+                    "Worker process N serves on METRICS_PORT + N"
+    )
+
+    worker_processes: PositiveInt = Field(
+        1, env="WORKER_PROCESSES",
+        description="Number of worker processes, each with its own connections and main loop. "
+                    "More than 1 runs a supervisor restarting the dead ones"
+    )
+
+    profile: bool = Field(
+        False, env="PROFILE",
+        description="Profile every worker process from its start, SIGUSR1 starts or stops a profile at any time"
+    )
+
+    profile_window: PositiveFloat = Field(
+        60, env="PROFILE_WINDOW", description="Max seconds a profile runs for"
+    )
+
+    profile_interval: PositiveFloat = Field(
+        5, env="PROFILE_INTERVAL", description="Milliseconds between two samples of the thread stacks"
+    )
+
+    profile_dir: str = Field(
+        "/tmp/feedreader-profiles", env="PROFILE_DIR",
+        description="Directory to write the profiles to, as flamegraph collapsed stacks"
+    )
+
+    profile_top: PositiveInt = Field(
+        10, env="PROFILE_TOP", description="Number of the slowest feeds to log at the end of a profile"
+    )
+
     rabbitmq_url: str = Field(..., env="RABBITMQ_URL")
 
     work_queue: str = Field(
@@ -29,7 +68,226 @@ class Config(BaseSettings):
 
     threads_num: PositiveInt = Field(2, env="THREADS_NUM", description="Number of worker threads")
 
-    read_timeout: PositiveInt = Field(2, env="READ_TIMEOUT", description="RabbitMQ read interval timeout")
+    class _ReaderType(str, Enum):
+        thread = "thread"
+        asyncio = "async"
+    reader: _ReaderType = Field(
+        'thread', env="READER",
+        description="'thread' for one blocking fetch per worker thread, "
+                    "'async' for many concurrent fetches on an event loop per worker thread"
+    )
+
+    async_max_in_flight: PositiveInt = Field(
+        200, env="ASYNC_MAX_IN_FLIGHT", description="Max concurrent fetches per async worker"
+    )
+
+    async_per_host_limit: PositiveInt = Field(
+        10, env="ASYNC_PER_HOST_LIMIT", description="Max concurrent connections per host for an async worker"
+    )
+
+    max_body_size: PositiveInt = Field(
+        32 * 1024 * 1024, env="MAX_BODY_SIZE", description="Max bytes of a feed, larger feeds are reported as errors"
+    )
+
+    http_read_timeout: PositiveFloat = Field(
+        30, env="HTTP_READ_TIMEOUT", description="Max seconds to wait for a feed server to send data"
+    )
+
+    http_connect_timeout: PositiveFloat = Field(
+        10, env="HTTP_CONNECT_TIMEOUT", description="Max seconds to wait for a connection to a feed server"
+    )
+
+    http_pool_connections: PositiveInt = Field(
+        100, env="HTTP_POOL_CONNECTIONS", description="Number of hosts each worker keeps a connection pool for"
+    )
+
+    http_pool_maxsize: PositiveInt = Field(
+        2, env="HTTP_POOL_MAXSIZE", description="Max number of connections each worker keeps per host"
+    )
+
+    http_keep_alive: bool = Field(
+        True, env="HTTP_KEEP_ALIVE", description="Reuse connections for subsequent requests to the same host"
+    )
+
+    host_scheduler: bool = Field(
+        False, env="HOST_SCHEDULER",
+        description="Schedule the fetches per host, with HOST_RATE, HOST_BURST and HOST_MAX_CONNECTIONS limits"
+    )
+
+    host_rate: NonNegativeFloat = Field(
+        0, env="HOST_RATE", description="Max requests per second to a single host, 0 is unlimited"
+    )
+
+    host_burst: PositiveInt = Field(
+        5, env="HOST_BURST", description="Number of requests a host may get at once before HOST_RATE applies"
+    )
+
+    host_max_connections: PositiveInt = Field(
+        2, env="HOST_MAX_CONNECTIONS", description="Max concurrent fetches from a single host"
+    )
+
+    fetch_retries: NonNegativeInt = Field(
+        0, env="FETCH_RETRIES",
+        description="Max retries of a feed after a timeout, connection error, 429 or 5xx, 0 disables retries"
+    )
+
+    retry_base_delay: PositiveFloat = Field(
+        1, env="RETRY_BASE_DELAY", description="Seconds to wait before the first retry, doubled on every retry"
+    )
+
+    retry_max_delay: PositiveFloat = Field(
+        300, env="RETRY_MAX_DELAY",
+        description="Max seconds to wait before a retry, a longer Retry-After is not retried"
+    )
+
+    max_in_flight: Optional[PositiveInt] = Field(
+        None, env="MAX_IN_FLIGHT",
+        description="Max number of tasks being processed and not acked yet, tasks beyond the busy workers are "
+                    "buffered locally. Defaults to twice the number of concurrent fetches"
+    )
+
+    max_waiting: Optional[NonNegativeInt] = Field(
+        None, env="MAX_WAITING",
+        description="Max number of tasks parked by HOST_SCHEDULER, waiting for a retry or for another worker's "
+                    "lease that are not counted against MAX_IN_FLIGHT, the ones beyond it are. "
+                    "Defaults to MAX_IN_FLIGHT"
+    )
+
+    fetch_timeout: Optional[PositiveFloat] = Field(
+        120, env="FETCH_TIMEOUT",
+        description="Max seconds for a whole fetch, on top of HTTP_CONNECT_TIMEOUT and HTTP_READ_TIMEOUT"
+    )
+
+    in_flight_timeout: PositiveFloat = Field(
+        600, env="IN_FLIGHT_TIMEOUT",
+        description="Seconds a task may stay in flight before its timeout is published and its worker replaced"
+    )
+
+    lease_path: Optional[str] = Field(
+        None, env="LEASE_PATH",
+        description="sqlite file of the leases on the links being fetched, shared by the workers so they don't "
+                    "fetch the same feed at the same time. Disabled if not set"
+    )
+
+    lease_fresh: NonNegativeFloat = Field(
+        60, env="LEASE_FRESH",
+        description="Seconds after another worker completes a link, during which its tasks are acked without fetching"
+    )
+
+    lease_recheck: PositiveFloat = Field(
+        5, env="LEASE_RECHECK", description="Seconds between two attempts to take a lease held by another worker"
+    )
+
+    prefetch: Optional[PositiveInt] = Field(
+        None, env="PREFETCH",
+        description="RabbitMQ prefetch count, defaults to MAX_IN_FLIGHT plus MAX_WAITING if tasks may wait"
+    )
+
+    validator_cache_size: NonNegativeInt = Field(
+        100000, env="VALIDATOR_CACHE_SIZE",
+        description="Number of feeds to keep ETag/Last-Modified for conditional requests, 0 disables it"
+    )
+
+    validator_cache_path: Optional[str] = Field(
+        None, env="VALIDATOR_CACHE_PATH", description="sqlite file to persist the validator cache to"
+    )
+
+    class _ParserType(str, Enum):
+        basic = "basic"
+        fast = "fast"
+    parser: _ParserType = Field(
+        'basic', env="PARSER",
+        description="'basic' parses with feedparser, 'fast' extracts RSS 2.0/Atom items with a streaming xml "
+                    "parser and falls back to feedparser for anything else"
+    )
+
+    parse_processes: NonNegativeInt = Field(
+        0, env="PARSE_PROCESSES", description="Number of processes to parse feeds on, 0 parses on the main thread"
+    )
+
+    parse_backlog: PositiveInt = Field(
+        64, env="PARSE_BACKLOG", description="Max number of feeds submitted to the parser processes at once"
+    )
+
+    poller: bool = Field(
+        False, env="POLLER",
+        description="Publish a task for every feed of POLLER_FEEDS whenever it is due, adapting the interval of "
+                    "every feed to how often it changes. It turns on CONTENT_CACHE to detect unchanged feeds. "
+                    "Needs WORKER_PROCESSES=1, run it on a single worker"
+    )
+
+    poller_feeds: Optional[str] = Field(
+        None, env="POLLER_FEEDS", description="File of the feed urls to poll, one per line"
+    )
+
+    poller_min_interval: PositiveFloat = Field(
+        60, env="POLLER_MIN_INTERVAL", description="Min seconds between two polls of a feed"
+    )
+
+    poller_max_interval: PositiveFloat = Field(
+        24 * 3600, env="POLLER_MAX_INTERVAL", description="Max seconds between two polls of a feed"
+    )
+
+    poller_initial_interval: PositiveFloat = Field(
+        900, env="POLLER_INITIAL_INTERVAL", description="Seconds between the polls of a feed, until it adapts"
+    )
+
+    content_cache: bool = Field(
+        False, env="CONTENT_CACHE", description="Skip parsing a body identical to the last one of the feed"
+    )
+
+    content_cache_size: PositiveInt = Field(
+        64, env="CONTENT_CACHE_SIZE", description="Max memory of the content cache in MiB"
+    )
+
+    content_cache_items: bool = Field(
+        True, env="CONTENT_CACHE_ITEMS",
+        description="Keep the parsed items to publish them again for an identical body, "
+                    "otherwise it is published as not modified"
+    )
+
+    content_cache_skip_publish: bool = Field(
+        False, env="CONTENT_CACHE_SKIP_PUBLISH", description="Publish nothing for an identical body"
+    )
+
+    dedup: bool = Field(
+        False, env="DEDUP", description="Publish only the items which are new or changed since the last poll"
+    )
+
+    dedup_max_items: PositiveInt = Field(
+        1000000, env="DEDUP_MAX_ITEMS", description="Max number of seen items kept in memory"
+    )
+
+    dedup_ttl: PositiveInt = Field(
+        7 * 24 * 3600, env="DEDUP_TTL", description="Seconds after which an item not seen again is forgotten"
+    )
+
+    dedup_path: Optional[str] = Field(
+        None, env="DEDUP_PATH", description="sqlite file to persist the seen items to"
+    )
+
+    class _Transport(str, Enum):
+        blocking = "blocking"
+        threaded = "threaded"
+    rabbitmq_transport: _Transport = Field(
+        'blocking', env="RABBITMQ_TRANSPORT",
+        description="'blocking' for a blocking connection each for consuming and publishing, driven by the main "
+                    "thread, 'threaded' for one connection driven by its own I/O thread, consuming, publishing and "
+                    "acking concurrently on separate channels. The threaded publisher doesn't batch, it waits for "
+                    "publisher confirms instead of transactions"
+    )
+
+    read_timeout: PositiveInt = Field(
+        2, env="READ_TIMEOUT", description="RabbitMQ read interval timeout, unused by the threaded transport"
+    )
+
+    ack_batch_size: PositiveInt = Field(
+        1, env="ACK_BATCH_SIZE", description="Number of completed tasks to ack together, 1 acks every task on its own"
+    )
+
+    ack_flush_interval: PositiveInt = Field(
+        500, env="ACK_FLUSH_INTERVAL", description="Max milliseconds a completed task waits for its ack"
+    )
 
     rabbitmq_retry_interval: PositiveInt = Field(
         10, env="RABBITMQ_RETRY_INTERVAL", description="RabbitMQ connection retry interval"
@@ -46,6 +304,40 @@ class Config(BaseSettings):
         description="RabbitMQ exchange name to send results to"
     )
 
+    class _Compression(str, Enum):
+        none = "none"
+        gzip = "gzip"
+        zstd = "zstd"
+    publish_compression: _Compression = Field(
+        "none", env="PUBLISH_COMPRESSION",
+        description="Compression of the published results, set as the message 'content_encoding'. "
+                    "zstd needs the 'zstandard' package"
+    )
+
+    publish_compression_level: Optional[int] = Field(
+        None, env="PUBLISH_COMPRESSION_LEVEL", description="Compression level, defaults to gzip 6 or zstd 3"
+    )
+
+    publish_compression_min_size: NonNegativeInt = Field(
+        1024, env="PUBLISH_COMPRESSION_MIN_SIZE", description="Results smaller than this many bytes are not compressed"
+    )
+
+    publish_batch_size: PositiveInt = Field(
+        1, env="PUBLISH_BATCH_SIZE",
+        description="Max number of results published in one transaction, 1 publishes every result on its own"
+    )
+
+    publish_batch_interval: PositiveInt = Field(
+        100, env="PUBLISH_BATCH_INTERVAL", description="Max milliseconds a result waits for its batch to fill up"
+    )
+
+    @root_validator(skip_on_failure=True)
+    def _single_process_poller(cls, values):
+        # the poller only learns the outcomes of the tasks fetched by its own process
+        if values["poller"] and values["worker_processes"] > 1:
+            raise ValueError("POLLER needs WORKER_PROCESSES=1, it only learns the poll outcomes of its own process")
+        return values
+
 
 settings = None
 
@@ -1,46 +1,215 @@
-from broker import task_reader, publisher
+from broker import task_reader, publisher, compression, lease, connection
 from config import get_conf
-from rss import parser
+from rss import parser, pool, dedup, content_cache
 from queue import Queue
 from threading import Event, Thread
-from reader import http_reader
+from reader import http_reader, async_reader, validator_cache, scheduler, retry
 import loop
+import poller
+
+# an async worker keeps many fetches in flight, so the main loop has to hand out more tasks
+if get_conf().reader == "async":
+    _concurrent_fetches = get_conf().threads_num * get_conf().async_max_in_flight
+else:
+    _concurrent_fetches = get_conf().threads_num
+# by default every fetch has the next task waiting for it
+_max_in_flight = get_conf().max_in_flight or 2 * _concurrent_fetches
+# the tasks waiting without a worker are left out of the window, the prefetch has room for them on top of it
+_max_waiting = 0
+if get_conf().host_scheduler or get_conf().fetch_retries or get_conf().lease_path:
+    _max_waiting = _max_in_flight if get_conf().max_waiting is None else get_conf().max_waiting
+_prefetch = get_conf().prefetch or _max_in_flight + _max_waiting
+
+# singleton connection of the threaded transport, shared by the task reader and the publishers
+_connection = None
+if get_conf().rabbitmq_transport == "threaded":
+    _connection = connection.RabbitmqConnection(
+        rabbitmq_url=get_conf().rabbitmq_url,
+        retry=get_conf().rabbitmq_connection_retry,
+        retry_interval=get_conf().rabbitmq_retry_interval
+    )
 
 # Singleton task_reader
-_task_reader = task_reader.RabbitmqTaskReader(
-    rabbitmq_url=get_conf().rabbitmq_url,
-    prefetch=get_conf().threads_num,
-    queue_name=get_conf().work_queue,
-    exchange_name=get_conf().task_exchange,
-    binding_key=get_conf().binding_key,
-    interval_timeout=get_conf().read_timeout,
-    retry=get_conf().rabbitmq_connection_retry,
-    retry_interval=get_conf().rabbitmq_retry_interval
-)
+if _connection is not None:
+    _task_reader = task_reader.ThreadedTaskReader(
+        connection_=_connection,
+        prefetch=_prefetch,
+        queue_name=get_conf().work_queue,
+        exchange_name=get_conf().task_exchange,
+        binding_key=get_conf().binding_key,
+        ack_batch_size=get_conf().ack_batch_size,
+        ack_flush_interval=get_conf().ack_flush_interval / 1000
+    )
+else:
+    _task_reader = task_reader.RabbitmqTaskReader(
+        rabbitmq_url=get_conf().rabbitmq_url,
+        prefetch=_prefetch,
+        queue_name=get_conf().work_queue,
+        exchange_name=get_conf().task_exchange,
+        binding_key=get_conf().binding_key,
+        interval_timeout=get_conf().read_timeout,
+        retry=get_conf().rabbitmq_connection_retry,
+        retry_interval=get_conf().rabbitmq_retry_interval,
+        ack_batch_size=get_conf().ack_batch_size,
+        ack_flush_interval=get_conf().ack_flush_interval / 1000
+    )
 
 
 # singleton publisher
-_publisher = publisher.RabbitmqPublisher(
-    rabbitmq_url=get_conf().rabbitmq_url,
-    exchange_name=get_conf().result_exchange,
-    routing_key=get_conf().routing_key,
-    retry=get_conf().rabbitmq_connection_retry,
-    retry_interval=get_conf().rabbitmq_retry_interval
+_compressor = compression.get_compressor(
+    get_conf().publish_compression.value, get_conf().publish_compression_level
 )
+if _connection is not None:
+    _publisher = publisher.ThreadedPublisher(
+        connection_=_connection,
+        exchange_name=get_conf().result_exchange,
+        routing_key=get_conf().routing_key,
+        compressor=_compressor,
+        compress_min_size=get_conf().publish_compression_min_size
+    )
+elif get_conf().publish_batch_size > 1:
+    _publisher = publisher.RabbitmqBatchPublisher(
+        rabbitmq_url=get_conf().rabbitmq_url,
+        exchange_name=get_conf().result_exchange,
+        routing_key=get_conf().routing_key,
+        retry=get_conf().rabbitmq_connection_retry,
+        retry_interval=get_conf().rabbitmq_retry_interval,
+        batch_size=get_conf().publish_batch_size,
+        batch_interval=get_conf().publish_batch_interval / 1000,
+        compressor=_compressor,
+        compress_min_size=get_conf().publish_compression_min_size
+    )
+else:
+    _publisher = publisher.RabbitmqPublisher(
+        rabbitmq_url=get_conf().rabbitmq_url,
+        exchange_name=get_conf().result_exchange,
+        routing_key=get_conf().routing_key,
+        retry=get_conf().rabbitmq_connection_retry,
+        retry_interval=get_conf().rabbitmq_retry_interval,
+        compressor=_compressor,
+        compress_min_size=get_conf().publish_compression_min_size
+    )
 
 
 # singleton parser
-_parser = parser.BasicParser()
+if get_conf().parser == "fast":
+    _parser = parser.FastParser()
+else:
+    _parser = parser.BasicParser()
+
+# singleton parser pool
+_parser_pool = None
+if get_conf().parse_processes:
+    _parser_pool = pool.ParserPool(
+        parser_=_parser, processes=get_conf().parse_processes, max_backlog=get_conf().parse_backlog
+    )
+
+
+# singleton validator cache, shared by all the workers
+_validator_cache = None
+if get_conf().validator_cache_size:
+    _validator_cache = validator_cache.ValidatorCache(
+        max_size=get_conf().validator_cache_size, path=get_conf().validator_cache_path
+    )
 
 
 def reader_factory(in_q: Queue, result_q: Queue, stop_event: Event) -> Thread:
-    return http_reader.Reader(in_q=in_q, result_q=result_q, stop_event=stop_event)
+    if get_conf().reader == "async":
+        return async_reader.AsyncReader(
+            in_q=in_q, result_q=result_q, stop_event=stop_event,
+            max_in_flight=get_conf().async_max_in_flight,
+            per_host_limit=get_conf().async_per_host_limit,
+            validator_cache=_validator_cache,
+            max_body_size=get_conf().max_body_size,
+            read_timeout=get_conf().http_read_timeout,
+            connect_timeout=get_conf().http_connect_timeout,
+            keep_alive=get_conf().http_keep_alive,
+            total_timeout=get_conf().fetch_timeout
+        )
+    # every worker thread gets its own session, as requests sessions are not thread safe
+    return http_reader.Reader(
+        in_q=in_q, result_q=result_q, stop_event=stop_event,
+        session=http_reader.HttpSession(
+            validator_cache=_validator_cache,
+            max_body_size=get_conf().max_body_size,
+            read_timeout=get_conf().http_read_timeout,
+            connect_timeout=get_conf().http_connect_timeout,
+            pool_connections=get_conf().http_pool_connections,
+            pool_maxsize=get_conf().http_pool_maxsize,
+            keep_alive=get_conf().http_keep_alive,
+            total_timeout=get_conf().fetch_timeout
+        )
+    )
+
+
+# singleton deduplicator
+_deduplicator = None
+if get_conf().dedup:
+    _deduplicator = dedup.ItemDeduplicator(
+        max_size=get_conf().dedup_max_items, ttl=get_conf().dedup_ttl, path=get_conf().dedup_path
+    )
+
+# singleton content cache
+_content_cache = None
+if get_conf().content_cache or get_conf().poller:
+    _content_cache = content_cache.ContentCache(
+        max_bytes=get_conf().content_cache_size * 1024 * 1024, keep_items=get_conf().content_cache_items
+    )
+
+# singleton poller
+_poller = None
+if get_conf().poller:
+    # the poller publishes only now and then, an I/O thread keeps its connection alive in between
+    _poller_publisher = publisher.ThreadedPublisher(
+        connection_=_connection or connection.RabbitmqConnection(
+            rabbitmq_url=get_conf().rabbitmq_url,
+            retry=get_conf().rabbitmq_connection_retry,
+            retry_interval=get_conf().rabbitmq_retry_interval
+        ),
+        exchange_name=get_conf().task_exchange,
+        routing_key=get_conf().binding_key
+    )
+    _poller = poller.AdaptivePoller(
+        _poller_publisher,
+        poller.read_feeds(get_conf().poller_feeds) if get_conf().poller_feeds else [],
+        min_interval=get_conf().poller_min_interval,
+        max_interval=get_conf().poller_max_interval,
+        initial_interval=get_conf().poller_initial_interval
+    )
+
+# singleton lease registry
+_lease_registry = None
+if get_conf().lease_path:
+    _lease_registry = lease.SqliteLeaseRegistry(get_conf().lease_path, fresh_for=get_conf().lease_fresh)
+
+# singleton host scheduler
+_host_scheduler = None
+if get_conf().host_scheduler:
+    _host_scheduler = scheduler.HostScheduler(
+        rate=get_conf().host_rate, burst=get_conf().host_burst, max_connections=get_conf().host_max_connections,
+        # a task parked for a paused host must still be fetched before its in-flight deadline
+        max_pause=get_conf().in_flight_timeout / 2
+    )
 
+# singleton retry policy
+_retry_policy = None
+if get_conf().fetch_retries:
+    _retry_policy = retry.RetryPolicy(
+        max_retries=get_conf().fetch_retries,
+        base_delay=get_conf().retry_base_delay, max_delay=get_conf().retry_max_delay
+    )
 
 # main_loop singleton
 _main_loop = loop.MainLoop(
     threads_num=get_conf().threads_num, worker_factory=reader_factory,
-    parser_=_parser, publisher_=_publisher, task_reader_=_task_reader
+    parser_=_parser, publisher_=_publisher, task_reader_=_task_reader,
+    parser_pool=_parser_pool, max_in_flight=_max_in_flight, max_waiting=_max_waiting,
+    deduplicator=_deduplicator,
+    host_scheduler=_host_scheduler, retry_policy=_retry_policy,
+    content_cache_=_content_cache, skip_unchanged=get_conf().content_cache_skip_publish,
+    in_flight_timeout=get_conf().in_flight_timeout, poller_=_poller,
+    lease_registry=_lease_registry, lease_recheck=get_conf().lease_recheck,
+    validator_cache_=_validator_cache
 )
 
 
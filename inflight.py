@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Hashable, Iterator, List, Optional
+
+
+class InFlight:
+    __slots__ = ("task_id", "started", "retries", "deadline", "published", "validators", "new_items")
+
+    def __init__(self, task_id: Hashable, started: float, deadline: float):
+        self.task_id = task_id
+        self.started = started
+        self.retries = 0
+        self.deadline = deadline
+        # the result is handed to the publisher, the task waits for its confirmation only
+        self.published = False
+        # http validators of the fetched content, stored once its result is confirmed
+        self.validators = None
+        # items published as new, remembered by the deduplicator once the result is confirmed
+        self.new_items = None
+
+
+class InFlightTable:
+    """The tasks taken from the task reader and not acked yet, keyed by link.
+
+    Every task gets the same timeout when it is added and keeps its deadline through its retries, so the
+    insertion order is the deadline order and the expired tasks are always at the front.
+    """
+
+    def __init__(self, timeout: float = 600):
+        """
+
+        :param timeout: seconds a task may stay in flight before it is considered stuck.
+        """
+        self.timeout = timeout
+        self._tasks: "OrderedDict[str, InFlight]" = OrderedDict()
+
+    def add(self, link: str, task_id: Hashable):
+        now = monotonic()
+        self._tasks[link] = InFlight(task_id, now, now + self.timeout)
+
+    def get(self, link: str) -> Optional[InFlight]:
+        return self._tasks.get(link)
+
+    def restart(self, link: str):
+        """gives the task of link a new deadline, for a task that has waited without being fetched"""
+        task = self._tasks[link]
+        task.deadline = monotonic() + self.timeout
+        # the new deadline is the latest one
+        self._tasks.move_to_end(link)
+
+    def pop(self, link: str) -> Hashable:
+        """removes the task of link and returns its task id"""
+        return self._tasks.pop(link).task_id
+
+    def links(self) -> List[str]:
+        return list(self._tasks)
+
+    def task_ids(self) -> List[Hashable]:
+        return [task.task_id for task in self._tasks.values()]
+
+    def expired(self) -> Iterator[str]:
+        """yields the links of the tasks past their deadline, the oldest first"""
+        now = monotonic()
+        for link, task in self._tasks.items():
+            if task.deadline > now:
+                return
+            yield link
+
+    def oldest_age(self) -> float:
+        """returns the seconds the oldest task has been in flight, 0 if there is none"""
+        for task in self._tasks.values():
+            return monotonic() - task.started
+        return 0
+
+    def __contains__(self, link: str) -> bool:
+        return link in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
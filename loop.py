@@ -1,14 +1,22 @@
 from queue import Queue, Empty
-from config import get_conf
-from rss import parser, schema
-from broker import task_reader, publisher
+from rss import parser, schema, pool, dedup, content_cache
+from reader import scheduler, retry, validator_cache
+from broker import task_reader, publisher, lease
 from broker.schema import Task
 from logging import getLogger
-from typing import Optional, List, Callable
+from typing import Optional, List, Callable, Union, Dict
+from collections import deque
 from functools import partial
+from inspect import GEN_CREATED, getgeneratorstate
 from threading import Event
 from reader.data import InputData, ResultData
 from pydantic import BaseModel
+from time import monotonic, perf_counter
+from inflight import InFlightTable
+from poller import AdaptivePoller, PollOutcome
+import metrics
+import profiling
+import utils
 
 
 class MainLoop:
@@ -18,44 +26,152 @@ class MainLoop:
             parser_: parser.Parser,
             publisher_: publisher.Publisher,
             task_reader_: task_reader.TaskReader,
+            parser_pool: Optional[pool.ParserPool] = None,
+            max_in_flight: Optional[int] = None,
+            max_waiting: Optional[int] = None,
+            wait_timeout: float = 1,
+            deduplicator: Optional[dedup.ItemDeduplicator] = None,
+            host_scheduler: Optional[scheduler.HostScheduler] = None,
+            retry_policy: Optional[retry.RetryPolicy] = None,
+            content_cache_: Optional[content_cache.ContentCache] = None,
+            skip_unchanged: bool = False,
+            in_flight_timeout: float = 600,
+            poller_: Optional[AdaptivePoller] = None,
+            lease_registry: Optional[lease.LeaseRegistry] = None,
+            lease_recheck: float = 5,
+            result_poll: float = 0.05,
+            validator_cache_: Optional[validator_cache.ValidatorCache] = None,
     ):
+        """
+
+        :param threads_num: number of workers to run.
+        :param max_in_flight: max number of tasks taken from the task reader and not acked yet, defaults to
+            threads_num. Tasks beyond the number of busy workers wait in in_q, so a worker finishing a fetch
+            picks up the next one without waiting for the broker.
+        :param max_waiting: max number of tasks waiting without a worker, i.e. for their retry, for the lease of
+            another worker or parked by the host scheduler, left out of max_in_flight, defaults to max_in_flight.
+            They are still unacked deliveries, so the prefetch must have room for them on top of max_in_flight.
+        :param parser_pool: if given, feeds are parsed on this pool instead of the main thread.
+        :param wait_timeout: max seconds to wait for a result while the in-flight window is full, before
+            checking on the workers and the publisher again.
+        :param deduplicator: if given, only the new or changed items of a feed are published.
+        :param host_scheduler: if given, it is used as the workers' in_q to limit the load on every host. The
+            tasks it parks for a throttled or paused host are not counted against max_in_flight, so they don't
+            hold back the tasks of the other hosts.
+        :param retry_policy: if given, retryable fetch failures are fetched again after a delay instead of
+            being published. The task stays in flight while it waits, no worker is blocked by it and it counts
+            against max_waiting instead of max_in_flight. A retry that can't be done before the task's deadline
+            is given up.
+        :param content_cache_: if given, a body identical to the last one of the feed is not parsed again. Its
+            cached items are published, or it is published as not modified if the cache doesn't keep items.
+        :param skip_unchanged: ack the identical bodies without publishing anything.
+        :param in_flight_timeout: seconds a task may stay in flight before it is considered stuck.
+        :param poller_: if given, it is started with the loop and told the outcome of every task.
+        :param lease_registry: if given, a link is fetched only with its lease, so other workers don't fetch it
+            at the same time. A task whose link is being fetched by another worker waits for it, and is acked
+            without fetching if the other worker completes it, as is a task whose link any worker has completed
+            recently. The waiting task counts against max_waiting instead of max_in_flight and its deadline starts
+            over with every attempt, so it outlives a dead worker's lease.
+        :param lease_recheck: seconds between two attempts to take a lease held by another worker.
+        :param result_poll: max seconds to wait for a new task while results may come. The task reader can't
+            be woken by a result, the wait is local so a short one is cheap.
+        :param validator_cache_: if given, the http validators of a fetched feed are stored in it once its
+            result is confirmed, so a failed parse or a lost publish is fetched in full again.
+        """
         self.threads_num = threads_num
-        self.task_id_mapping = dict()
+        self.max_in_flight = max_in_flight or threads_num
+        self.max_waiting = self.max_in_flight if max_waiting is None else max_waiting
+        self.wait_timeout = wait_timeout
+        self.task_id_mapping = InFlightTable(in_flight_timeout)
         self.parser = parser_
         self.publisher = publisher_
         self.task_reader = task_reader_
         self.task_reader_generator = task_reader_.get_task()
-        self.in_q = Queue()
+        self.parser_pool = parser_pool
+        self.deduplicator = deduplicator
+        # fetched results waiting for a free slot in the parser pool backlog
+        self.parse_waiting = deque()
+        # number of results handed to the publisher and not confirmed yet
+        self.publish_pending = 0
+        self.retry_policy = retry_policy
+        # fetches waiting for their retry
+        self.retry_delayed = retry.DelayQueue()
+        self.content_cache = content_cache_
+        self.skip_unchanged = skip_unchanged
+        # digests of the bodies being parsed, to be cached with their items
+        self.content_digests: Dict[str, bytes] = dict()
+        self.poller = poller_
+        self.lease_registry = lease_registry
+        self.lease_recheck = lease_recheck
+        self.result_poll = result_poll
+        self.validator_cache = validator_cache_
+        # links waiting for the lease held by another worker
+        self.lease_delayed = retry.DelayQueue()
+        # task ids of the duplicates of the in-flight links, acked along with the original
+        self.duplicates: Dict[str, List] = dict()
+        self.host_scheduler = host_scheduler
+        self.in_q = host_scheduler if host_scheduler is not None else Queue()
         self.result_q = Queue()
         self.stop_event = Event()
         self.worker_factory = partial(
             worker_factory, in_q=self.in_q, result_q=self.result_q, stop_event=self.stop_event
         )
+        metrics.QUEUE_DEPTH.set_function(self.in_q.qsize, "in")
+        metrics.QUEUE_DEPTH.set_function(self.result_q.qsize, "result")
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.parse_waiting), "parse")
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.retry_delayed), "retry")
+        metrics.IN_FLIGHT.set_function(lambda: len(self.task_id_mapping))
+        metrics.OLDEST_IN_FLIGHT.set_function(self.task_id_mapping.oldest_age)
         self.workers = []
-        for _ in range(get_conf().threads_num):
+        for _ in range(self.threads_num):
             worker = self.worker_factory()
             worker.start()
             self.workers.append(worker)
 
     def loop(self):
         getLogger().info("Started the main loop")
-        while True:
+        if self.poller is not None and not self.poller.is_alive():
+            self.poller.start()
+        while not self.stop_event.is_set():
             self._worker_threads_check()
             self._iterate()
 
     def _iterate(self):
-        if len(self.task_id_mapping) < self.threads_num:
+        if self._window_used() < self.max_in_flight:
             # block a while for a new task
             new_task: Optional[Task]
-            new_task, task_id = next(self.task_reader_generator)
+            new_task, task_id = self._read_task()
             # the generator may return None after timeout
             if new_task is not None:
                 if new_task.link not in self.task_id_mapping:
-                    self.task_id_mapping[new_task.link] = task_id
-                    self.in_q.put(InputData(new_task.link))
+                    self.task_id_mapping.add(new_task.link, task_id)
+                    self._start_fetch(new_task.link)
                 else:
-                    self.task_reader.reject(task_id)
-                    getLogger().info(f"Rejected duplicate task: {new_task.link}")
+                    # the result of the task in flight serves the duplicate too
+                    self.duplicates.setdefault(new_task.link, []).append(task_id)
+                    metrics.COALESCED_TASKS.labels("local").inc()
+                    getLogger().info(f"Coalesced duplicate task: {new_task.link}")
+        else:
+            # the window is full, so nothing can happen before a result arrives
+            timeout = self.wait_timeout
+            for next_due in (self.retry_delayed.next_due(), self.lease_delayed.next_due(), self.publisher.flush_due()):
+                if next_due is not None:
+                    timeout = min(timeout, next_due)
+            try:
+                task_result = self.result_q.get(timeout=timeout)
+            except Empty:
+                pass
+            else:
+                self._handle_result(task_result)
+
+        for in_data in self.retry_delayed.pop_due():
+            if self._awaits_result(in_data.url):
+                self.in_q.put(in_data)
+        for link in self.lease_delayed.pop_due():
+            # unless the watchdog has given up on it meanwhile
+            if self._awaits_result(link):
+                self.task_id_mapping.restart(link)
+                self._start_fetch(link)
 
         # get all completed tasks
         while not self.stop_event.is_set():
@@ -64,41 +180,309 @@ class MainLoop:
             except Empty:
                 break
             else:
-                if task_result.error:
-                    publish_data = PublishData(link=task_result.url, items=None, error=task_result.error)
-                else:
-                    try:
-                        items = self.parser.parse(task_result.data)
-                    except parser.exceptions.ParseError as e:
-                        error = repr(e)
-                        publish_data = PublishData(link=task_result.url, items=None, error=error)
-                    else:
-                        publish_data = PublishData(link=task_result.url, items=items, error=None)
-
-                self.publisher.publish(publish_data.json())
-                self.task_reader.ack(self.task_id_mapping[task_result.url])
-                del self.task_id_mapping[task_result.url]
+                self._handle_result(task_result)
+
+        self._expire_stuck()
+
+        # nothing else is in flight to fill up the publisher's batch, so there is no point in waiting
+        force = self.publish_pending > 0 and self.publish_pending == len(self.task_id_mapping)
+        self._ack_published(self.publisher.flush(force=force))
+
+    def _window_used(self) -> int:
+        """returns the number of in-flight tasks counted against max_in_flight
+
+        The tasks waiting for their retry, the lease of another worker or their host take no worker, so up to
+        max_waiting of them leave room for new tasks. The ones beyond it hold the deliveries of the window.
+        """
+        waiting = len(self.retry_delayed) + len(self.lease_delayed)
+        if self.host_scheduler is not None:
+            waiting += self.host_scheduler.parked()
+        return len(self.task_id_mapping) - min(waiting, self.max_waiting)
+
+    def _read_task(self):
+        if getgeneratorstate(self.task_reader_generator) == GEN_CREATED:
+            # a generator can't be sent a value before its first yield
+            return next(self.task_reader_generator)
+        return self.task_reader_generator.send(self._read_timeout())
+
+    def _read_timeout(self) -> Optional[float]:
+        """returns the max seconds to wait for a new task, None for the task reader's own read timeout"""
+        if not self.result_q.empty():
+            return 0
+        # nothing in flight, nothing to come but tasks
+        timeout = self.result_poll if len(self.task_id_mapping) else None
+        # a buffered batch must not wait for the read past its interval
+        for next_due in (self.retry_delayed.next_due(), self.lease_delayed.next_due(), self.publisher.flush_due()):
+            if next_due is not None:
+                timeout = next_due if timeout is None else min(timeout, next_due)
+        return timeout
+
+    def _start_fetch(self, link: str):
+        if self.lease_registry is None:
+            self.in_q.put(InputData(link))
+            return
+        state = self.lease_registry.acquire(link, ttl=self.task_id_mapping.timeout)
+        if state == lease.LeaseState.acquired:
+            self.in_q.put(InputData(link))
+        elif state == lease.LeaseState.held:
+            self.lease_delayed.put(link, self.lease_recheck)
+        else:
+            # a worker, maybe this one, has just published its result
+            metrics.COALESCED_TASKS.labels("remote").inc()
+            getLogger().info(f"Coalesced task completed recently: {link}")
+            self._ack([link])
+
+    def _handle_result(self, task_result: Union[ResultData, pool.ParseResult]):
+        if self.host_scheduler is not None and isinstance(task_result, ResultData):
+            self.host_scheduler.release(task_result.url, task_result.retry_after)
+
+        if isinstance(task_result, pool.ParseResult):
+            # the parse has freed a slot of the pool backlog, whatever becomes of its result
+            self._submit_parses()
+
+        if not self._awaits_result(task_result.url):
+            getLogger().warning(f"Dropped the late result of an expired task: {task_result.url}")
+            return
+
+        if isinstance(task_result, ResultData) and task_result.error and self._retry(task_result):
+            return
+        if isinstance(task_result, ResultData) and task_result.validators is not None:
+            self.task_id_mapping.get(task_result.url).validators = task_result.validators
+
+        if isinstance(task_result, pool.ParseResult):
+            metrics.PARSE_SECONDS.observe(task_result.parse_seconds)
+            profiling.record_parse(task_result.url, task_result.parse_seconds)
+            publish_data = PublishData.construct(
+                link=task_result.url, items=task_result.items, error=task_result.error
+            )
+        elif task_result.error:
+            publish_data = PublishData.construct(link=task_result.url, items=None, error=task_result.error)
+        elif task_result.not_modified:
+            publish_data = PublishData.construct(link=task_result.url, items=None, error=None, not_modified=True)
+        elif self.content_cache is not None and self._handle_unchanged(task_result):
+            return
+        elif self.parser_pool is not None:
+            self.parse_waiting.append(task_result)
+            self._submit_parses()
+            return
+        else:
+            start = perf_counter()
+            try:
+                items = self.parser.parse(task_result.data)
+            except parser.exceptions.ParseError as e:
+                error = repr(e)
+                publish_data = PublishData.construct(link=task_result.url, items=None, error=error)
+            else:
+                publish_data = PublishData.construct(link=task_result.url, items=items, error=None)
+            parse_seconds = perf_counter() - start
+            metrics.PARSE_SECONDS.observe(parse_seconds)
+            profiling.record_parse(task_result.url, parse_seconds)
+
+        self._publish(publish_data)
+
+    def _awaits_result(self, link: str) -> bool:
+        """returns whether the task of link is in flight and nothing is published for it yet
+
+        The watchdog publishes a timeout for an expired task, which stays in flight until it is confirmed.
+        """
+        in_flight = self.task_id_mapping.get(link)
+        return in_flight is not None and not in_flight.published
+
+    def _publish(self, publish_data: "PublishData", unchanged: bool = False):
+        """
+
+        :param unchanged: the feed is known to be unchanged, even if the items are published.
+        """
+        digest = self.content_digests.pop(publish_data.link, None)
+        if digest is not None and publish_data.items is not None:
+            self.content_cache.set(publish_data.link, digest, publish_data.items)
+
+        in_flight = self.task_id_mapping.get(publish_data.link)
+        if publish_data.items is not None:
+            metrics.FEED_ITEMS.observe(len(publish_data.items))
+        if self.deduplicator is not None and publish_data.items:
+            publish_data.items = self.deduplicator.filter(publish_data.link, publish_data.items)
+            in_flight.new_items = publish_data.items
+            unchanged = unchanged or not publish_data.items
+
+        in_flight.published = True
+        if publish_data.error:
+            # i.e. a parse error, the content must be fetched again in full
+            in_flight.validators = None
+        if self.lease_registry is not None and publish_data.error:
+            # another worker may try it at once, a successful result keeps its lease until it is confirmed
+            self.lease_registry.release(publish_data.link, completed=False)
+        if self.poller is not None:
+            if publish_data.error:
+                self.poller.record(publish_data.link, PollOutcome.error)
+            elif unchanged or publish_data.not_modified:
+                self.poller.record(publish_data.link, PollOutcome.unchanged)
+            else:
+                self.poller.record(publish_data.link, PollOutcome.changed)
+
+        self.publish_pending += 1
+        start = perf_counter()
+        published = self.publisher.publish_tracked(publish_data.to_json(), publish_data.link)
+        metrics.PUBLISH_SECONDS.observe(perf_counter() - start)
+        self._ack_published(published)
+
+    def _expire_stuck(self):
+        """publishes a timeout error for the tasks past their deadline, and replaces the workers stuck on them"""
+        expired = [link for link in self.task_id_mapping.expired() if not self.task_id_mapping.get(link).published]
+        if not expired:
+            return
+        fetching = {
+            worker.current.url: i for i, worker in enumerate(self.workers) if getattr(worker, "current", None)
+        }
+        for link in expired:
+            getLogger().error(f"Task timed out: {link}")
+            metrics.STUCK_TASKS.inc()
+            if link in fetching:
+                i = fetching[link]
+                self.workers[i].abandoned = True
+                self.workers[i] = self.worker_factory()
+                self.workers[i].start()
+                if self.host_scheduler is not None:
+                    # the abandoned worker never reports its result
+                    self.host_scheduler.release(link)
+            self._publish(PublishData.construct(
+                link=link, items=None, error=f"task timed out after {self.task_id_mapping.timeout}s"
+            ))
+
+    def _handle_unchanged(self, task_result: ResultData) -> bool:
+        """handles a body identical to the cached one, returns whether it did
+
+        The digest of a changed body is kept until the body is parsed.
+        """
+        digest = self.content_cache.digest(task_result.data)
+        entry = self.content_cache.get(task_result.url, digest)
+        if entry is None:
+            metrics.CONTENT_CACHE_LOOKUPS.labels("miss").inc()
+            self.content_digests[task_result.url] = digest
+            return False
+
+        metrics.CONTENT_CACHE_LOOKUPS.labels("hit").inc()
+        if self.skip_unchanged:
+            self._ack([task_result.url])
+            if self.poller is not None:
+                self.poller.record(task_result.url, PollOutcome.unchanged)
+        else:
+            self._publish(PublishData.construct(
+                link=task_result.url, items=entry.items, error=None, not_modified=entry.items is None
+            ), unchanged=True)
+        return True
+
+    def _retry(self, task_result: ResultData) -> bool:
+        """schedules another fetch of a failed task if the retry policy allows, returns whether it did"""
+        if self.retry_policy is None:
+            return False
+        in_flight = self.task_id_mapping.get(task_result.url)
+        attempt = in_flight.retries
+        if not self.retry_policy.should_retry(task_result, attempt):
+            return False
+        delay = self.retry_policy.delay(attempt, task_result.retry_after)
+        if monotonic() + delay >= in_flight.deadline:
+            getLogger().info(f"Not retrying {task_result.url}, its deadline is before the retry")
+            return False
+        in_flight.retries += 1
+        self.retry_delayed.put(InputData(task_result.url), delay)
+        metrics.FETCH_RETRIES.inc()
+        getLogger().info(f"Retrying {task_result.url} in {delay:.1f}s, attempt {attempt + 1}")
+        return True
+
+    def _ack_published(self, links: List[str]):
+        """acks the tasks whose results are safely published"""
+        if not links:
+            return
+        self.publish_pending -= len(links)
+        start = perf_counter()
+        self._ack(links)
+        metrics.ACK_SECONDS.observe(perf_counter() - start)
+
+    def _ack(self, links: List[str]):
+        """acks the tasks of the links and their duplicates, their content is safely published"""
+        task_ids = []
+        validators = []
+        for link in links:
+            in_flight = self.task_id_mapping.get(link)
+            if in_flight.validators is not None:
+                validators.append((link, in_flight.validators))
+            if in_flight.new_items:
+                self.deduplicator.commit(link, in_flight.new_items)
+            if self.lease_registry is not None:
+                # a no-op for the failed results, their lease is given up once they are published
+                self.lease_registry.release(link, completed=True)
+            task_ids.append(self.task_id_mapping.pop(link))
+            task_ids.extend(self.duplicates.pop(link, ()))
+        self.task_reader.ack_many(task_ids)
+        if self.validator_cache is not None:
+            self.validator_cache.set_many(validators)
+
+    def _submit_parses(self):
+        """submits the waiting results to the parser pool as long as its backlog allows"""
+        while self.parse_waiting and not self.parser_pool.full:
+            task_result: ResultData = self.parse_waiting.popleft()
+            if not self._awaits_result(task_result.url):
+                self.content_digests.pop(task_result.url, None)
+                continue
+            # the parse result is pushed to result_q, so it is handled like the fetched results
+            self.parser_pool.submit(task_result.url, task_result.data, self.result_q.put)
 
     def _worker_threads_check(self):
         for i, worker in enumerate(self.workers):
             if not worker.is_alive():
                 getLogger().error("Found dead thread, rising another one")
+                metrics.WORKER_RESTARTS.inc()
                 self.workers[i] = self.worker_factory()
                 self.workers[i].start()
 
     def exit(self):
+        if self.poller is not None:
+            self.poller.stop()
         self.stop_event.set()
         for worker in self.workers:
             worker.join(3)
 
+        if self.parser_pool is not None:
+            self.parser_pool.close()
+
+        self._ack_published(self.publisher.flush(force=True))
         self.publisher.close()
 
-        for task_id in self.task_id_mapping.values():
+        if self.deduplicator is not None:
+            self.deduplicator.close()
+        if self.validator_cache is not None:
+            self.validator_cache.close()
+
+        for task_id in self.task_id_mapping.task_ids():
             self.task_reader.reject(task_id)
+        for task_ids in self.duplicates.values():
+            for task_id in task_ids:
+                self.task_reader.reject(task_id)
         self.task_reader.close()
 
+        if self.lease_registry is not None:
+            for link in self.task_id_mapping.links():
+                self.lease_registry.release(link, completed=False)
+            self.lease_registry.close()
+
 
 class PublishData(BaseModel):
+    """The published result of a task.
+
+    The main loop builds it with 'construct' from already validated items and serializes it with 'to_json',
+    so the items are neither validated nor converted again on the publish path.
+    """
     link: str
     items: Optional[List[schema.Item]] = None
     error: Optional[str] = None
+    not_modified: bool = False
+
+    def to_json(self) -> bytes:
+        """Same document as 'json()', without the whitespace."""
+        return utils.json_dumps({
+            "link": self.link,
+            "items": None if self.items is None else [dict(item) for item in self.items],
+            "error": self.error,
+            "not_modified": self.not_modified,
+        })
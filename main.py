@@ -1,16 +1,39 @@
 from config import get_conf
+from profiling import SamplingProfiler
 import utils
-import dependencies
+import metrics
 import signal
 
 
 def graceful_exit(sig=None, frame=None):
+    import dependencies
     dependencies.get_main_loop().exit()
 
 
-signal.signal(signal.SIGTERM, graceful_exit)
-signal.signal(signal.SIGINT, graceful_exit)
+def run_worker(index: int = 0):
+    # the connections are created on import, so every worker process has its own
+    import dependencies
+    signal.signal(signal.SIGTERM, graceful_exit)
+    profiler = SamplingProfiler(
+        get_conf().profile_dir, get_conf().profile_window, get_conf().profile_interval / 1000, get_conf().profile_top
+    )
+    signal.signal(signal.SIGUSR1, profiler.toggle)
+    if get_conf().profile:
+        profiler.start()
+    if get_conf().metrics_port:
+        metrics.start_http_server(get_conf().metrics_port + index)
+    dependencies.get_main_loop().loop()
+
 
 if __name__ == "__main__":
     utils.init_logging(level=get_conf().log_level.value)
-    dependencies.get_main_loop().loop()
+    if get_conf().worker_processes > 1:
+        from supervisor import Supervisor
+        supervisor = Supervisor(get_conf().worker_processes, run_worker)
+        signal.signal(signal.SIGTERM, supervisor.stop)
+        signal.signal(signal.SIGINT, supervisor.stop)
+        signal.signal(signal.SIGUSR1, supervisor.forward)
+        supervisor.run()
+    else:
+        signal.signal(signal.SIGINT, graceful_exit)
+        run_worker()
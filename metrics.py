@@ -0,0 +1,213 @@
+"""In-process metrics registry, exposed in the Prometheus text format.
+
+Metrics are module level singletons, updating them costs a dict lookup and a lock, so they are always on.
+The http endpoint is only started if asked for.
+"""
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+import profiling
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def labels(self, *values) -> "_Metric":
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """returns (suffix, labels, value) of all the samples"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self._samples():
+            label_str = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{self.name}{suffix}{{{label_str}}} {value}" if label_str else f"{self.name}{suffix} {value}")
+        return "\n".join(lines)
+
+    def _labeled(self, values: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = _CounterValue()
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self._value.inc(amount)
+
+    def _samples(self):
+        if not self.labelnames:
+            return [("_total", {}, self._value.value)]
+        return [("_total", self._labeled(values), child.value) for values, child in list(self._children.items())]
+
+
+class Gauge(_Metric):
+    """A gauge whose value is computed by a function at scrape time."""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set_function(self, function: Callable[[], float], *values):
+        self._functions[values] = function
+
+    def _samples(self):
+        return [("", self._labeled(values), function()) for values, function in list(self._functions.items())]
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(
+            self, name: str, documentation: str, labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+        self._value = _HistogramValue(self.buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._value.observe(value)
+
+    def _samples(self):
+        children = [((), self._value)] if not self.labelnames else list(self._children.items())
+        samples = []
+        for values, child in children:
+            labels = self._labeled(values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), list(child.counts)):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append(("_bucket", {**labels, "le": le}, cumulative))
+            samples.append(("_count", labels, cumulative))
+            samples.append(("_sum", labels, child.sum))
+        return samples
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+_registry: List[_Metric] = []
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+def host(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+FETCH_SECONDS = Histogram("feedreader_fetch_seconds", "Time to fetch a feed", ["host"])
+FETCH_RESPONSES = Counter(
+    "feedreader_fetch_responses", "Fetched feeds by http status code, 'error' if no response", ["host", "status"]
+)
+FETCH_BYTES = Counter("feedreader_fetch_bytes", "Bytes downloaded", ["host"])
+PARSE_SECONDS = Histogram("feedreader_parse_seconds", "Time to parse a feed")
+FEED_ITEMS = Histogram(
+    "feedreader_feed_items", "Number of items parsed from a feed", buckets=(0, 1, 5, 10, 25, 50, 100, 250, 1000)
+)
+CONTENT_CACHE_LOOKUPS = Counter(
+    "feedreader_content_cache_lookups", "Fetched bodies looked up in the content cache, by result", ["result"]
+)
+PUBLISH_SECONDS = Histogram("feedreader_publish_seconds", "Time to hand a result to the publisher")
+ACK_SECONDS = Histogram("feedreader_ack_seconds", "Time to ack tasks")
+QUEUE_DEPTH = Gauge("feedreader_queue_depth", "Number of items waiting in a queue", ["queue"])
+IN_FLIGHT = Gauge("feedreader_in_flight_tasks", "Number of tasks taken and not acked yet")
+OLDEST_IN_FLIGHT = Gauge("feedreader_oldest_in_flight_seconds", "Age of the oldest task taken and not acked yet")
+FETCH_RETRIES = Counter("feedreader_fetch_retries", "Number of failed fetches scheduled to be retried")
+POLLS = Counter("feedreader_polls", "Number of tasks published by the poller")
+STUCK_TASKS = Counter("feedreader_stuck_tasks", "Number of tasks given up on after their in-flight deadline")
+COALESCED_TASKS = Counter(
+    "feedreader_coalesced_tasks", "Duplicate tasks acked without fetching, by where the original is", ["scope"]
+)
+WORKER_RESTARTS = Counter("feedreader_worker_restarts", "Number of dead worker threads replaced")
+
+
+def observe_fetch(url: str, seconds: float, status: Optional[int], size: int = 0):
+    """records a fetch, status is None if there was no response"""
+    url_host = host(url)
+    FETCH_SECONDS.labels(url_host).observe(seconds)
+    profiling.record_fetch(url, seconds)
+    FETCH_RESPONSES.labels(url_host, str(status) if status is not None else "error").inc()
+    if size:
+        FETCH_BYTES.labels(url_host).inc(size)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port: int, addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """serves the metrics on http://addr:port/metrics from a daemon thread"""
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,162 @@
+from enum import Enum
+from heapq import heappop, heappush
+from itertools import count
+from logging import getLogger
+from random import uniform
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Dict, Iterable, List, Tuple
+from broker import publisher, schema
+import metrics
+
+
+class PollOutcome(str, Enum):
+    changed = "changed"
+    unchanged = "unchanged"
+    error = "error"
+
+
+class FeedState:
+    __slots__ = ("url", "interval", "next_due", "change_rate", "error_streak", "entry")
+
+    def __init__(self, url: str, interval: float, next_due: float):
+        self.url = url
+        self.interval = interval
+        self.next_due = next_due
+        # moving average of how often a poll finds the feed changed
+        self.change_rate = 0.5
+        self.error_streak = 0
+        # sequence of the feed's live entry in the due heap
+        self.entry = -1
+
+
+class AdaptivePoller(Thread):
+    """Publishes a task for every feed of its table whenever the feed is due.
+
+    The poll interval of a feed adapts to the outcomes of its polls: it shrinks while the feed changes more often
+    than the target change rate, grows while it changes less often and backs off exponentially while it fails.
+    A feed is rescheduled as soon as its task is published, so feeds whose outcomes never come back (i.e. fetched
+    by another worker) keep their interval.
+    """
+
+    def __init__(
+            self, publisher_: publisher.Publisher, urls: Iterable[str],
+            min_interval: float = 60, max_interval: float = 24 * 3600, initial_interval: float = 900,
+            target_change_rate: float = 0.5, smoothing: float = 0.3
+    ):
+        """
+
+        :param publisher_: publisher to the task exchange.
+        :param urls: feeds to poll, their first polls are spread over the initial interval.
+        :param target_change_rate: share of the polls which should find the feed changed.
+        :param smoothing: weight of the last poll in the moving average of the change rate.
+        """
+        super().__init__(daemon=True)
+        self.publisher = publisher_
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.target_change_rate = target_change_rate
+        self.smoothing = smoothing
+        self.stop_event = Event()
+        self.feeds: Dict[str, FeedState] = {}
+        # (due time, sequence, url), an entry whose sequence isn't the feed's live one is stale
+        self._due: List[Tuple[float, int, str]] = []
+        self._counter = count()
+        self._lock = Lock()
+        # set when a feed gets due earlier than what the thread is waiting for
+        self._wakeup = Event()
+        now = monotonic()
+        for url in urls:
+            self._schedule(FeedState(url, initial_interval, 0), now + uniform(0, initial_interval))
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.feeds), "poller")
+
+    def _schedule(self, feed: FeedState, next_due: float):
+        self.feeds[feed.url] = feed
+        feed.next_due = next_due
+        feed.entry = next(self._counter)
+        heappush(self._due, (next_due, feed.entry, feed.url))
+
+    def add(self, url: str):
+        with self._lock:
+            if url not in self.feeds:
+                self._schedule(FeedState(url, self.initial_interval, 0), monotonic())
+        self._wakeup.set()
+
+    def remove(self, url: str):
+        with self._lock:
+            self.feeds.pop(url, None)
+
+    def record(self, url: str, outcome: PollOutcome):
+        """adapts the interval of a polled feed to the outcome of the poll"""
+        with self._lock:
+            feed = self.feeds.get(url)
+            if feed is None:
+                return
+            changed = 1 if outcome == PollOutcome.changed else 0
+            if outcome == PollOutcome.error:
+                feed.error_streak += 1
+                interval = feed.interval * 2 ** min(feed.error_streak, 10)
+            else:
+                feed.error_streak = 0
+                feed.change_rate += self.smoothing * (changed - feed.change_rate)
+                feed.interval = self._clamp(feed.interval * (1 + self.target_change_rate - feed.change_rate))
+                interval = feed.interval
+            next_due = monotonic() + self._clamp(interval)
+            if next_due < feed.next_due:
+                self._schedule(feed, next_due)
+                self._wakeup.set()
+            else:
+                # the live heap entry is pushed back once it pops
+                feed.next_due = next_due
+
+    def _clamp(self, interval: float) -> float:
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def pop_due(self) -> List[str]:
+        """returns the urls of the feeds due now and reschedules them"""
+        now = monotonic()
+        urls = []
+        with self._lock:
+            while self._due and self._due[0][0] <= now:
+                _, entry, url = heappop(self._due)
+                feed = self.feeds.get(url)
+                if feed is None or entry != feed.entry:
+                    continue
+                if feed.next_due > now:
+                    # postponed since the entry is pushed
+                    self._schedule(feed, feed.next_due)
+                    continue
+                urls.append(url)
+                # jitter keeps the feeds polled together from staying together
+                self._schedule(feed, now + feed.interval * uniform(0.9, 1.1))
+        return urls
+
+    def next_due(self) -> float:
+        """returns the seconds until the next feed is due"""
+        with self._lock:
+            if not self._due:
+                return self.max_interval
+            return max(0.0, self._due[0][0] - monotonic())
+
+    def run(self):
+        getLogger().info(f"Started polling {len(self.feeds)} feeds")
+        while not self.stop_event.is_set():
+            for url in self.pop_due():
+                self.publisher.publish(schema.Task(link=url).json().encode())
+                metrics.POLLS.inc()
+            self._wakeup.wait(min(1.0, self.next_due()))
+            self._wakeup.clear()
+
+    def stop(self):
+        self.stop_event.set()
+        self._wakeup.set()
+        self.join(3)
+        self.publisher.close()
+
+
+def read_feeds(path: str) -> List[str]:
+    """reads the urls of a feed list file, one per line, '#' starts a comment"""
+    with open(path) as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
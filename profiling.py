@@ -0,0 +1,140 @@
+"""Opt-in sampling profiler of all the threads of the process.
+
+While a window is open, the stacks of every thread are sampled at a fixed interval and the fetch and parse
+times of every feed are recorded. When it closes, the samples are written as flamegraph-compatible collapsed
+stacks ('flamegraph.pl', speedscope, ...) and the slowest feeds are logged. Outside a window the hooks cost a
+global lookup.
+"""
+from collections import Counter, defaultdict
+from logging import getLogger
+from threading import Event, Lock, Thread, enumerate as enumerate_threads, get_ident
+from time import monotonic, strftime
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+import sys
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir: str, window: float = 60, interval: float = 0.005, top: int = 10):
+        """
+
+        :param output_dir: directory to write the collapsed stacks to.
+        :param window: seconds a profile runs for, unless stopped earlier.
+        :param interval: seconds between two samples.
+        :param top: number of the slowest feeds to log.
+        """
+        self.output_dir = output_dir
+        self.window = window
+        self.interval = interval
+        self.top = top
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+        self.stacks: Counter = Counter()
+        self.fetch_seconds: Dict[str, float] = defaultdict(float)
+        self.parse_seconds: Dict[str, float] = defaultdict(float)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        global _active
+        with self._lock:
+            if self.running:
+                return
+            self.stacks = Counter()
+            self.fetch_seconds = defaultdict(float)
+            self.parse_seconds = defaultdict(float)
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name="SamplingProfiler", daemon=True)
+            _active = self
+            self._thread.start()
+        getLogger().info(f"Started profiling for {self.window}s")
+
+    def stop(self):
+        """closes the window early, the profile is written by the sampling thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def toggle(self, sig=None, frame=None):
+        """starts a profile, or stops the running one. Usable as a signal handler."""
+        if self.running:
+            # the signal handler runs on the main thread, the sampler never waits for it
+            self._stop.set()
+        else:
+            self.start()
+
+    def _run(self):
+        global _active
+        deadline = monotonic() + self.window
+        own_ident = get_ident()
+        while not self._stop.wait(self.interval) and monotonic() < deadline:
+            self._sample(own_ident)
+        _active = None
+        self._report()
+
+    def _sample(self, own_ident: int):
+        names = {thread.ident: _thread_role(thread) for thread in enumerate_threads()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            self.stacks[_collapse(names.get(ident, "unknown"), frame)] += 1
+
+    def _report(self):
+        path = os.path.join(self.output_dir, f"profile-{strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.collapsed")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(path, "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            getLogger().error(f"Could not write the profile to {path}: {e}")
+        else:
+            getLogger().info(f"Wrote {sum(self.stacks.values())} samples to {path}")
+        for name, seconds in (("fetch", self.fetch_seconds), ("parse", self.parse_seconds)):
+            slowest = _top(seconds, self.top)
+            if slowest:
+                getLogger().info(
+                    f"Slowest feeds by {name} time: " + ", ".join(f"{url} {total:.3f}s" for url, total in slowest)
+                )
+
+
+def _thread_role(thread: Thread) -> str:
+    """merges the threads doing the same job, i.e. all the readers"""
+    if type(thread).__module__ == "threading":
+        # the numbers of the default names, i.e. 'Thread-3' or 'ThreadPoolExecutor-0_1'
+        return re.sub(r"[-_]\d+", "", thread.name)
+    return type(thread).__name__
+
+
+def _collapse(role: str, frame: Optional[FrameType]) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(role)
+    return ";".join(reversed(frames))
+
+
+def _top(seconds: Dict[str, float], top: int) -> List[Tuple[str, float]]:
+    return sorted(seconds.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+_active: Optional[SamplingProfiler] = None
+
+
+def record_fetch(url: str, seconds: float):
+    profiler = _active
+    if profiler is not None:
+        profiler.fetch_seconds[url] += seconds
+
+
+def record_parse(url: str, seconds: float):
+    profiler = _active
+    if profiler is not None:
+        profiler.parse_seconds[url] += seconds
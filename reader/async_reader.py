@@ -0,0 +1,142 @@
+import asyncio
+from logging import getLogger
+import threading
+from queue import Queue, Empty
+from typing import Optional, Set
+from time import monotonic
+import aiohttp
+from reader import data, exceptions
+from reader.http_reader import Response, result_from_response, parse_retry_after, CHUNK_SIZE
+from reader.validator_cache import ValidatorCache, Validators
+import metrics
+
+# failures to get a response which are worth another attempt
+RETRYABLE_EXCEPTIONS = (
+    aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError, ConnectionError
+)
+
+
+class AsyncReader(threading.Thread):
+    """Reader running many concurrent fetches on a single asyncio event loop.
+
+    Drop-in replacement for 'http_reader.Reader', it consumes 'InputData' from in_q and
+    pushes 'ResultData' to result_q.
+    """
+
+    def __init__(
+            self, in_q: Queue, result_q: Queue,
+            stop_event: threading.Event, *args,
+            max_in_flight: int = 100,
+            per_host_limit: int = 10,
+            validator_cache: Optional[ValidatorCache] = None,
+            max_body_size: int = 32 * 1024 * 1024,
+            read_timeout: float = 30,
+            connect_timeout: float = 10,
+            keep_alive: bool = True,
+            total_timeout: Optional[float] = None,
+            **kwargs
+    ):
+        """
+
+        :param in_q: queue to fetch the tasks from, tasks should be instances of 'InputData'.
+        :param result_q: queue to push the results to, results should be instances of 'ResultData'.
+        :param stop_event: event to stop the thread.
+        :param max_in_flight: max number of concurrent fetches on the event loop.
+        :param per_host_limit: max number of concurrent connections to a single host.
+        :param validator_cache: if given, requests are made conditional on the cached ETag/Last-Modified.
+        :param max_body_size: max bytes of a response body, larger bodies are reported as errors.
+        :param read_timeout: max seconds to wait for the server to send data.
+        :param connect_timeout: max seconds to wait for a connection to the server.
+        :param keep_alive: whether to reuse connections for subsequent requests to the same host.
+        :param total_timeout: max seconds for a whole fetch.
+        """
+        self.in_q = in_q
+        self.result_q = result_q
+        self.stop_event = stop_event
+        self.max_in_flight = max_in_flight
+        self.per_host_limit = per_host_limit
+        self.validator_cache = validator_cache
+        self.max_body_size = max_body_size
+        self.read_timeout = read_timeout
+        self.connect_timeout = connect_timeout
+        self.keep_alive = keep_alive
+        self.total_timeout = total_timeout
+        super().__init__(*args, **kwargs)
+
+    def run(self) -> None:
+        asyncio.run(self._consume())
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        fetches: Set[asyncio.Task] = set()
+        connector = aiohttp.TCPConnector(
+            limit=self.max_in_flight, limit_per_host=self.per_host_limit, force_close=not self.keep_alive
+        )
+        timeout = aiohttp.ClientTimeout(total=self.total_timeout, sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            while not self.stop_event.is_set():
+                await in_flight.acquire()
+                # the blocking queue get runs on the default executor so the loop keeps serving fetches
+                in_data = await loop.run_in_executor(None, self._get_input)
+                if in_data is None:
+                    in_flight.release()
+                    continue
+
+                fetch = asyncio.ensure_future(self._fetch(session, in_data))
+                fetches.add(fetch)
+                fetch.add_done_callback(fetches.discard)
+                fetch.add_done_callback(lambda _: in_flight.release())
+
+            for fetch in fetches:
+                fetch.cancel()
+            await asyncio.gather(*fetches, return_exceptions=True)
+
+    def _get_input(self) -> Optional[data.InputData]:
+        try:
+            return self.in_q.get(timeout=1)
+        except Empty:
+            return None
+
+    async def _fetch(self, session: aiohttp.ClientSession, in_data: data.InputData):
+        headers = None
+        if self.validator_cache is not None:
+            headers = self.validator_cache.conditional_headers(in_data.url)
+        start = monotonic()
+        try:
+            async with session.get(in_data.url, headers=headers) as resp:
+                content = b""
+                validators = None
+                if resp.status == 200:
+                    content = await self._read_limited(resp)
+                    if self.validator_cache is not None:
+                        validators = Validators.from_headers(resp.headers)
+                response = Response(
+                    content=content, status_code=resp.status,
+                    retry_after=parse_retry_after(resp.headers.get("Retry-After")), validators=validators
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.observe_fetch(in_data.url, monotonic() - start, None)
+            getLogger().error(f"Error while fetching http resource {in_data.url}, Exception: {repr(e)}")
+            self.result_q.put(data.ResultData(
+                url=in_data.url, data=None, error=repr(e), retryable=isinstance(e, RETRYABLE_EXCEPTIONS)
+            ))
+        else:
+            metrics.observe_fetch(in_data.url, monotonic() - start, response.status_code, len(response.content))
+            self.result_q.put(result_from_response(in_data.url, response))
+
+    async def _read_limited(self, resp: aiohttp.ClientResponse) -> bytes:
+        """
+
+        :raises ResponseTooLarge: as soon as the body gets larger than max_body_size
+        """
+        body = []
+        size = 0
+        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            size += len(chunk)
+            if size > self.max_body_size:
+                raise exceptions.ResponseTooLarge(f"response body is larger than {self.max_body_size} bytes")
+            body.append(chunk)
+        return b"".join(body)
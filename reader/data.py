@@ -1,18 +1,33 @@
-from typing import Optional
+from typing import Optional, Union
 from dataclasses import dataclass
+from reader.validator_cache import Validators
+from utils import add_slots
 
 
+@add_slots
 @dataclass
 class ResultData:
     url: str
-    data: Optional[str] = None
+    # the raw body, the parser takes care of its encoding
+    data: Optional[Union[str, bytes]] = None
     error: Optional[str] = None
+    # the resource has not changed since the last fetch, so there is no data to parse
+    not_modified: bool = False
+    # http status code of an unsuccessful response
+    status_code: Optional[int] = None
+    # seconds the server asked to wait before the next request
+    retry_after: Optional[float] = None
+    # the failure is likely transient, i.e. a timeout or a 503
+    retryable: bool = False
+    # validators of the response, to be stored once its content is published
+    validators: Optional[Validators] = None
 
     def __post_init__(self):
-        if self.data is None and self.error is None:
+        if self.data is None and self.error is None and not self.not_modified:
             raise ValueError("'data' and 'error' attributes must be mutually exclusive")
 
 
+@add_slots
 @dataclass
 class InputData:
     url: str
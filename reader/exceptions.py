@@ -0,0 +1,7 @@
+class ResponseTooLarge(Exception):
+    pass
+
+
+class FetchTimeout(TimeoutError):
+    """the whole fetch took longer than its deadline"""
+    pass
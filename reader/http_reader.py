@@ -2,16 +2,33 @@ from abc import ABC, abstractmethod
 from logging import getLogger
 import threading
 from queue import Queue, Empty
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
 import requests
-from reader import data
+import requests.adapters
+from reader import data, exceptions
+from reader.retry import is_retryable_status
+from reader.validator_cache import ValidatorCache, Validators
 from dataclasses import dataclass
+from time import monotonic, time
+from email.utils import parsedate_to_datetime
+import metrics
 
 
 @dataclass
 class Response:
-    text: str
+    content: bytes
     status_code: int
+    # seconds the server asked to wait before the next request
+    retry_after: Optional[float] = None
+    validators: Optional[Validators] = None
+
+
+CHUNK_SIZE = 64 * 1024
+
+# failures to get a response which are worth another attempt
+RETRYABLE_EXCEPTIONS = (
+    requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError
+)
 
 
 class HttpSessionGettable(ABC):
@@ -22,12 +39,111 @@ class HttpSessionGettable(ABC):
 
 
 class HttpSession(HttpSessionGettable):
-    def __init__(self):
+    """A requests session, it is not thread safe so every worker thread should have its own."""
+
+    def __init__(
+            self, validator_cache: Optional[ValidatorCache] = None,
+            max_body_size: int = 32 * 1024 * 1024, read_timeout: float = 30,
+            connect_timeout: float = 10, pool_connections: int = 100,
+            pool_maxsize: int = 2, keep_alive: bool = True,
+            total_timeout: Optional[float] = None
+    ):
+        """
+
+        :param validator_cache: if given, requests are made conditional on the cached ETag/Last-Modified.
+        :param max_body_size: max bytes of a response body, larger bodies raise 'ResponseTooLarge'.
+        :param read_timeout: max seconds to wait for the server to send data.
+        :param connect_timeout: max seconds to wait for a connection to the server.
+        :param pool_connections: number of hosts to keep a connection pool for.
+        :param pool_maxsize: max number of connections kept per host.
+        :param keep_alive: whether to reuse connections for subsequent requests to the same host.
+        :param total_timeout: max seconds for the whole fetch, checked between the chunks of the body. A server
+            dripping a chunk slower than read_timeout is only caught by the main loop's watchdog.
+        """
         self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+        self.validator_cache = validator_cache
+        self.max_body_size = max_body_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
 
     def get(self, url: str, headers: Optional[Dict] = None) -> Response:
-        resp = self.session.get(url, headers=headers)
-        return Response(text=resp.text, status_code=resp.status_code)
+        """
+
+        :raises ResponseTooLarge: if the response body is larger than max_body_size
+        :raises FetchTimeout: if the fetch takes longer than total_timeout
+        """
+        deadline = None if self.total_timeout is None else monotonic() + self.total_timeout
+        if self.validator_cache is not None:
+            headers = {**self.validator_cache.conditional_headers(url), **(headers or {})}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as resp:
+            if resp.status_code != 200:
+                return Response(
+                    content=b"", status_code=resp.status_code,
+                    retry_after=parse_retry_after(resp.headers.get("Retry-After"))
+                )
+            content = read_limited(resp.iter_content(CHUNK_SIZE), self.max_body_size, deadline)
+        validators = None
+        if self.validator_cache is not None:
+            validators = Validators.from_headers(resp.headers)
+        return Response(content=content, status_code=resp.status_code, validators=validators)
+
+
+def read_limited(chunks: Iterable[bytes], max_size: int, deadline: Optional[float] = None) -> bytes:
+    """joins the chunks of a body
+
+    :param deadline: 'time.monotonic' value to read the whole body by.
+    :raises ResponseTooLarge: as soon as the body gets larger than max_size
+    :raises FetchTimeout: as soon as a chunk arrives after the deadline
+    """
+    body = []
+    size = 0
+    for chunk in chunks:
+        if deadline is not None and monotonic() > deadline:
+            raise exceptions.FetchTimeout("response body is not received in time")
+        size += len(chunk)
+        if size > max_size:
+            raise exceptions.ResponseTooLarge(f"response body is larger than {max_size} bytes")
+        body.append(chunk)
+    return b"".join(body)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """returns the seconds to wait from a 'Retry-After' header, given in seconds or as a http date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+
+def result_from_response(url: str, response: Response) -> data.ResultData:
+    """Maps a http response to the result to be pushed to the result queue."""
+    if response.status_code == 200:
+        getLogger().info(f"Fetched successful result from {url}")
+        return data.ResultData(url=url, data=response.content, error=None, validators=response.validators)
+    elif response.status_code == 304:
+        getLogger().info(f"Resource not modified {url}")
+        return data.ResultData(url=url, not_modified=True)
+    else:
+        getLogger().error(
+            f"Http response status code mismatch expected 200 but received {response.status_code}"
+        )
+        return data.ResultData(
+            url=url, data=None,
+            error=f"result status code mismatch, status code:{response.status_code}",
+            status_code=response.status_code, retry_after=response.retry_after,
+            retryable=is_retryable_status(response.status_code)
+        )
 
 
 class Reader(threading.Thread):
@@ -35,7 +151,7 @@ class Reader(threading.Thread):
     def __init__(
             self, in_q: Queue, result_q: Queue,
             stop_event: threading.Event, *args,
-            session: HttpSessionGettable = HttpSession(),
+            session: Optional[HttpSessionGettable] = None,
             **kwargs
     ):
         """
@@ -43,11 +159,17 @@ class Reader(threading.Thread):
         :param in_q: queue to fetch the tasks from, tasks should be instances of 'InputData'.
         :param result_q: queue to push the results to, results should be instances of 'ResultData'.
         :param stop_event: event to stop the thread.
+        :param session: session to fetch with, must not be shared with other threads. Defaults to a new
+            'HttpSession'.
         """
         self.in_q = in_q
         self.result_q = result_q
         self.stop_event = stop_event
-        self.session = session
+        self.session = session or HttpSession()
+        # the task being fetched
+        self.current: Optional[data.InputData] = None
+        # set by the main loop when it gives up on the current fetch, the thread exits once it returns
+        self.abandoned = False
         super().__init__(*args, **kwargs)
 
     def run(self) -> None:
@@ -57,27 +179,23 @@ class Reader(threading.Thread):
             except Empty:
                 continue
 
+            self.current = in_data
+            start = monotonic()
             try:
                 response = self.session.get(in_data.url)
             except Exception as e:
+                metrics.observe_fetch(in_data.url, monotonic() - start, None)
                 getLogger().error(f"Error while fetching http resource {in_data.url}, Exception: {repr(e)}")
-                self.result_q.put(
-                    data.ResultData(url=in_data.url, data=None, error=repr(e))
+                result = data.ResultData(
+                    url=in_data.url, data=None, error=repr(e), retryable=isinstance(e, RETRYABLE_EXCEPTIONS)
                 )
-                continue
             else:
-                if response.status_code == 200:
-                    self.result_q.put(data.ResultData(url=in_data.url, data=response.text, error=None))
-                    getLogger().info(f"Fetched successful result from {in_data.url}")
-                    continue
-                elif response.status_code == 304:
-                    continue
-                else:
-                    getLogger().error(
-                        f"Http response status code mismatch expected 200 but received {response.status_code}"
-                    )
-                    self.result_q.put(data.ResultData(
-                        url=in_data.url, data=None,
-                        error=f"result status code mismatch, status code:{response.status_code}")
-                    )
-                    continue
+                metrics.observe_fetch(in_data.url, monotonic() - start, response.status_code, len(response.content))
+                result = result_from_response(in_data.url, response)
+
+            if self.abandoned:
+                # the main loop has already reported the task and replaced this thread
+                getLogger().info(f"Dropped the result of the abandoned fetch of {in_data.url}")
+                return
+            self.current = None
+            self.result_q.put(result)
@@ -0,0 +1,76 @@
+from heapq import heappop, heappush
+from itertools import count
+from random import uniform
+from time import monotonic
+from typing import Any, List, Optional, Tuple
+from reader import data
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """server errors and rate limiting are likely to be gone by the next attempt"""
+    return status_code == 429 or status_code >= 500
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for retryable fetch failures."""
+
+    def __init__(
+            self, max_retries: int = 3, base_delay: float = 1, max_delay: float = 300, multiplier: float = 2
+    ):
+        """
+
+        :param max_retries: max number of retries of a single task, after which its error is published.
+        :param base_delay: seconds to wait before the first retry.
+        :param max_delay: max seconds to wait before a retry, a failure whose server asks for longer is not
+            retried.
+        :param multiplier: the delay grows by this factor on every retry.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def should_retry(self, result: data.ResultData, attempt: int) -> bool:
+        """
+
+        :param attempt: number of retries done so far.
+        """
+        return result.retryable and attempt < self.max_retries and (result.retry_after or 0) <= self.max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """returns the seconds to wait before the next retry, the server's 'Retry-After' up to max_delay
+
+        Half of the backoff is random, so the retries of feeds that failed together are spread out.
+        """
+        backoff = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        backoff = backoff / 2 + uniform(0, backoff / 2)
+        return min(self.max_delay, max(backoff, retry_after or 0))
+
+
+class DelayQueue:
+    """Holds items until their delay is over. Not thread safe, it belongs to the main loop."""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any]] = []
+        # keeps the order of items due at the same time, and never compares the items
+        self._counter = count()
+
+    def put(self, item: Any, delay: float):
+        heappush(self._heap, (monotonic() + delay, next(self._counter), item))
+
+    def pop_due(self) -> List[Any]:
+        """removes and returns the items whose delay is over"""
+        now = monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heappop(self._heap)[2])
+        return due
+
+    def next_due(self) -> Optional[float]:
+        """returns the seconds until the next item is due, None if empty"""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - monotonic())
+
+    def __len__(self) -> int:
+        return len(self._heap)
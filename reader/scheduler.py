@@ -0,0 +1,156 @@
+from collections import deque
+from queue import Empty
+from threading import Condition
+from time import monotonic
+from typing import Deque, Dict, Optional
+from urllib.parse import urlsplit
+from reader import data
+
+
+class _Host:
+    __slots__ = ("pending", "active", "tokens", "updated", "paused_until")
+
+    def __init__(self, burst: int, now: float):
+        self.pending: Deque[data.InputData] = deque()
+        self.active = 0
+        self.tokens = float(burst)
+        self.updated = now
+        self.paused_until = 0.0
+
+
+class HostScheduler:
+    """Queue of 'InputData' handing out tasks while respecting per host limits.
+
+    Every host has a token bucket limiting its request rate, a max number of concurrent fetches and may be
+    paused, i.e. after a 'Retry-After' response. Hosts take turns, so tasks of a throttled host don't hold
+    back the tasks of the others.
+
+    It is a drop-in replacement for the workers' in_q, the owner must call 'release' once a fetch taken from
+    it is done.
+    """
+
+    def __init__(self, rate: float = 0, burst: int = 1, max_connections: int = 2, max_pause: float = 3600):
+        """
+
+        :param rate: max requests per second to a host, 0 is unlimited.
+        :param burst: number of requests a host may get at once, before being limited by rate.
+        :param max_connections: max number of concurrent fetches from a host.
+        :param max_pause: max seconds to pause a host for, whatever its 'Retry-After' says.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_connections = max_connections
+        self.max_pause = max_pause
+        self._hosts: Dict[str, _Host] = {}
+        # hosts with pending tasks, in the order of their turns
+        self._turns: Deque[str] = deque()
+        self._size = 0
+        self._cond = Condition()
+
+    @staticmethod
+    def _host_name(url: str) -> str:
+        return urlsplit(url).netloc
+
+    def put(self, item: data.InputData, block: bool = True, timeout: Optional[float] = None):
+        name = self._host_name(item.url)
+        with self._cond:
+            host = self._hosts.get(name)
+            if host is None:
+                host = self._hosts[name] = _Host(self.burst, monotonic())
+            if not host.pending:
+                self._turns.append(name)
+            host.pending.append(item)
+            self._size += 1
+            self._cond.notify()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> data.InputData:
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            while True:
+                item, wait = self._take()
+                if item is not None:
+                    return item
+                if not block:
+                    raise Empty
+                if deadline is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def get_nowait(self) -> data.InputData:
+        return self.get(block=False)
+
+    def _take(self):
+        """returns a task of the first eligible host, or None and the seconds until a host gets eligible"""
+        now = monotonic()
+        wait = None
+        for _ in range(len(self._turns)):
+            name = self._turns[0]
+            self._turns.rotate(-1)
+            host = self._hosts[name]
+            delay = self._delay(host, now)
+            if delay == 0:
+                item = host.pending.popleft()
+                if not host.pending:
+                    # it has just been rotated to the end
+                    self._turns.pop()
+                host.active += 1
+                if self.rate:
+                    host.tokens -= 1
+                self._size -= 1
+                return item, None
+            if delay is not None:
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _delay(self, host: _Host, now: float) -> Optional[float]:
+        """seconds until the host may be fetched from, None if it has to wait for a release"""
+        if host.active >= self.max_connections:
+            return None
+        if host.paused_until > now:
+            return host.paused_until - now
+        if self.rate:
+            host.tokens = min(self.burst, host.tokens + (now - host.updated) * self.rate)
+            host.updated = now
+            if host.tokens < 1:
+                return (1 - host.tokens) / self.rate
+        return 0
+
+    def release(self, url: str, retry_after: Optional[float] = None):
+        """marks a fetch taken from the scheduler as done
+
+        :param retry_after: seconds the host asked to be left alone for.
+        """
+        name = self._host_name(url)
+        with self._cond:
+            host = self._hosts.get(name)
+            if host is None:
+                return
+            host.active -= 1
+            now = monotonic()
+            if retry_after:
+                host.paused_until = max(host.paused_until, now + min(retry_after, self.max_pause))
+            elif not host.pending and host.active == 0 and host.paused_until <= now and self._delay(host, now) == 0 \
+                    and host.tokens >= self.burst:
+                # nothing to remember about an idle host
+                del self._hosts[name]
+            self._cond.notify_all()
+
+    def parked(self) -> int:
+        """returns the number of pending tasks of the hosts that may not be fetched from right now"""
+        now = monotonic()
+        parked = 0
+        with self._cond:
+            for name in self._turns:
+                host = self._hosts[name]
+                if self._delay(host, now) != 0:
+                    parked += len(host.pending)
+        return parked
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+import sqlite3
+import threading
+
+
+@dataclass
+class Validators:
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @staticmethod
+    def from_headers(response_headers: Mapping[str, str]) -> Optional["Validators"]:
+        """returns the validators of a successful response, None if it has none"""
+        validators = Validators(
+            etag=response_headers.get("ETag"), last_modified=response_headers.get("Last-Modified")
+        )
+        if validators.etag is None and validators.last_modified is None:
+            return None
+        return validators
+
+
+class ValidatorCache:
+    """Thread safe LRU cache of http validators (ETag/Last-Modified) keyed by feed url.
+
+    If a path is given the validators are also kept in a sqlite file, so they survive restarts
+    and entries evicted from memory can be loaded back. Storing is left to the caller once the content
+    is safely published, otherwise a lost result would be answered with 304 until the feed changes.
+    """
+
+    def __init__(self, max_size: int = 10000, path: Optional[str] = None):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Validators]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS validators (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT)"
+            )
+            self._db.commit()
+
+    def get(self, url: str) -> Optional[Validators]:
+        with self._lock:
+            validators = self._entries.get(url)
+            if validators is not None:
+                self._entries.move_to_end(url)
+                return validators
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT etag, last_modified FROM validators WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            validators = Validators(etag=row[0], last_modified=row[1])
+            self._put(url, validators)
+            return validators
+
+    def set(self, url: str, validators: Validators):
+        self.set_many([(url, validators)])
+
+    def set_many(self, entries: Iterable[Tuple[str, Validators]]):
+        """stores the validators of many urls, with a single commit"""
+        entries = list(entries)
+        if not entries:
+            return
+        with self._lock:
+            for url, validators in entries:
+                self._put(url, validators)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO validators (url, etag, last_modified) VALUES (?, ?, ?)",
+                    [(url, validators.etag, validators.last_modified) for url, validators in entries]
+                )
+                self._db.commit()
+
+    def _put(self, url: str, validators: Validators):
+        self._entries[url] = validators
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """returns the headers to make a conditional request for the url"""
+        validators = self.get(url)
+        headers = {}
+        if validators is not None:
+            if validators.etag is not None:
+                headers["If-None-Match"] = validators.etag
+            if validators.last_modified is not None:
+                headers["If-Modified-Since"] = validators.last_modified
+        return headers
+
+    def update(self, url: str, response_headers: Mapping[str, str]):
+        """stores the validators of a successful response, if it has any"""
+        validators = Validators.from_headers(response_headers)
+        if validators is not None:
+            self.set(url, validators)
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
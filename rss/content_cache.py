@@ -0,0 +1,77 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from rss import schema
+from typing import List, Optional, Union
+
+# rough memory cost of an entry and of an item, on top of their strings
+_ENTRY_OVERHEAD = 200
+_ITEM_OVERHEAD = 400
+
+
+class _Entry:
+    __slots__ = ("digest", "items", "size")
+
+    def __init__(self, digest: bytes, items: Optional[List[schema.Item]], size: int):
+        self.digest = digest
+        self.items = items
+        self.size = size
+
+
+class ContentCache:
+    """LRU cache of the digest of the last body of every feed url, and optionally of its parsed items.
+
+    The entries are evicted once their estimated size goes over max_bytes. It is not thread safe, it belongs
+    to the main loop.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, keep_items: bool = True):
+        """
+
+        :param max_bytes: max estimated memory used by the entries.
+        :param keep_items: keep the parsed items, so an unchanged feed can be published again without parsing.
+        """
+        self.max_bytes = max_bytes
+        self.keep_items = keep_items
+        self.size = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    @staticmethod
+    def digest(data: Union[str, bytes]) -> bytes:
+        if isinstance(data, str):
+            data = data.encode()
+        return blake2b(data, digest_size=16).digest()
+
+    def get(self, url: str, digest: bytes) -> Optional[_Entry]:
+        """returns the entry of url if its last body has the same digest"""
+        entry = self._entries.get(url)
+        if entry is None or entry.digest != digest:
+            return None
+        self._entries.move_to_end(url)
+        return entry
+
+    def set(self, url: str, digest: bytes, items: List[schema.Item]):
+        if not self.keep_items:
+            items = None
+        size = _ENTRY_OVERHEAD + len(url) + (_items_size(items) if items else 0)
+        self.remove(url)
+        if size > self.max_bytes:
+            return
+        self._entries[url] = _Entry(digest, items, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def remove(self, url: str):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _items_size(items: List[schema.Item]) -> int:
+    return sum(
+        _ITEM_OVERHEAD + sum(len(value) for value in item.__dict__.values() if value is not None) for item in items
+    )
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from rss import schema
+from time import time
+from typing import List, Optional, Tuple
+import sqlite3
+
+
+def item_key(item: schema.Item) -> str:
+    """identifies an item within its feed, by its guid or else by its link and title"""
+    if item.guid:
+        return item.guid
+    return blake2b(f"{item.link}\0{item.title}".encode(), digest_size=16).hexdigest()
+
+
+def item_fingerprint(item: schema.Item) -> str:
+    """changes whenever any field of the item changes"""
+    return blake2b(
+        "\0".join(str(value) for value in item.dict().values()).encode(), digest_size=16
+    ).hexdigest()
+
+
+class ItemDeduplicator:
+    """Filters out the items of a feed which are already seen.
+
+    The seen items are kept in memory up to max_size entries, an entry not seen for ttl seconds is forgotten.
+    If a path is given they are also kept in a sqlite file, so they survive restarts. The new items are only
+    remembered by 'commit', once they are safely published, so a lost publish doesn't lose them for good.
+    """
+
+    def __init__(self, max_size: int = 1000000, ttl: float = 7 * 24 * 3600, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # (feed url, item key) -> (fingerprint, last time it is persisted), in the order they are last seen
+        self._seen: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seen_items "
+                "(feed TEXT, key TEXT, fingerprint TEXT, seen_at REAL, PRIMARY KEY (feed, key))"
+            )
+            self._db.execute("DELETE FROM seen_items WHERE seen_at < ?", (time() - ttl,))
+            self._db.commit()
+
+    def filter(self, url: str, items: List[schema.Item]) -> List[schema.Item]:
+        """returns the new or changed items of the feed at url, 'commit' remembers them"""
+        now = time()
+        self._evict(now)
+        results = []
+        for item in items:
+            key = (url, item_key(item))
+            fingerprint = item_fingerprint(item)
+            seen = self._seen.pop(key, None)
+            if seen is None or now - seen[1] > self.ttl:
+                seen = self._load(key, now)
+            if seen is None or seen[0] != fingerprint:
+                results.append(item)
+                if seen is None:
+                    continue
+            elif now - seen[1] > self.ttl / 2:
+                # refresh the persisted entry before it expires
+                seen = (fingerprint, now)
+                self._store(key, seen)
+            self._seen[key] = seen
+        if self._db is not None:
+            self._db.commit()
+        self._evict(now)
+        return results
+
+    def commit(self, url: str, items: List[schema.Item]):
+        """remembers the items of the feed at url, once they are published"""
+        now = time()
+        for item in items:
+            key = (url, item_key(item))
+            seen = (item_fingerprint(item), now)
+            self._seen.pop(key, None)
+            self._seen[key] = seen
+            self._store(key, seen)
+        if self._db is not None:
+            self._db.commit()
+        self._evict(now)
+
+    def _evict(self, now: float):
+        while self._seen:
+            key, (_, seen_at) = next(iter(self._seen.items()))
+            if len(self._seen) <= self.max_size and now - seen_at <= self.ttl:
+                break
+            del self._seen[key]
+
+    def _load(self, key: Tuple[str, str], now: float) -> Optional[Tuple[str, float]]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT fingerprint, seen_at FROM seen_items WHERE feed = ? AND key = ?", key
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            return None
+        return row[0], row[1]
+
+    def _store(self, key: Tuple[str, str], seen: Tuple[str, float]):
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO seen_items (feed, key, fingerprint, seen_at) VALUES (?, ?, ?, ?)",
+                (*key, *seen)
+            )
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
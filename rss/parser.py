@@ -1,14 +1,18 @@
 from abc import ABC, abstractmethod
 from rss import schema, exceptions
-from typing import List
+from typing import List, Optional, Union
+from xml.etree import ElementTree
 import feedparser
+from feedparser.mixin import _FeedParserMixin
+from feedparser.sanitizer import _sanitize_html
 from pydantic import ValidationError
 from logging import getLogger
 
 
 class Parser(ABC):
     @abstractmethod
-    def parse(self, data: str) -> List[schema.Item]:
+    def parse(self, data: Union[str, bytes]) -> List[schema.Item]:
+        """parses a feed, bytes are decoded based on the feed's declared encoding"""
         raise NotImplemented
 
 
@@ -17,7 +21,7 @@ class BasicParser(Parser):
 
     :raises ParseError:
     """
-    def parse(self, data: str) -> List[schema.Item]:
+    def parse(self, data: Union[str, bytes]) -> List[schema.Item]:
         results = []
         feed = feedparser.parse(data)
         if feed.bozo:
@@ -37,3 +41,129 @@ class BasicParser(Parser):
         if len(results) == 0:
             raise exceptions.ParseError("No valid Item in feed")
         return results
+
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+DC_CREATOR = "{http://purl.org/dc/elements/1.1/}creator"
+
+
+class _Unsupported(Exception):
+    """the feed uses something the fast parser does not handle"""
+
+
+class FastParser(Parser):
+    """Extracts only the fields of 'schema.Item' from RSS 2.0 and Atom feeds with a streaming XML parser.
+
+    It sanitizes html with feedparser's sanitizer, on the same fields, and falls back to the id of an Atom entry
+    without a link, so its items are the same as 'BasicParser' ones. Unlike feedparser it does not resolve
+    relative links or parse dates. Anything it can't handle (other feed formats, malformed xml, xhtml content,
+    ...) is parsed by the fallback parser. Every field it extracts is a plain string, so the items are built
+    without validation.
+
+    :raises ParseError:
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, fallback: Optional[Parser] = None):
+        self.fallback = fallback or BasicParser()
+
+    def parse(self, data: Union[str, bytes]) -> List[schema.Item]:
+        try:
+            results = self._parse(data)
+        except (ElementTree.ParseError, _Unsupported):
+            return self.fallback.parse(data)
+        if len(results) == 0:
+            return self.fallback.parse(data)
+        return results
+
+    def _parse(self, data: Union[str, bytes]) -> List[schema.Item]:
+        results = []
+        pull_parser = ElementTree.XMLPullParser(events=("start", "end"))
+        root = None
+        for start in range(0, len(data), self.chunk_size):
+            pull_parser.feed(data[start:start + self.chunk_size])
+            for event, elem in pull_parser.read_events():
+                if root is None:
+                    root = elem.tag
+                    if root not in ("rss", f"{ATOM}feed"):
+                        raise _Unsupported(root)
+                elif event == "end" and elem.tag == "item" and root == "rss":
+                    results.append(self._rss_item(elem))
+                    elem.clear()
+                elif event == "end" and elem.tag == f"{ATOM}entry":
+                    results.append(self._atom_entry(elem))
+                    elem.clear()
+        pull_parser.close()
+        return results
+
+    @staticmethod
+    def _text(elem: ElementTree.Element) -> str:
+        if len(elem):
+            # markup inside the element
+            raise _Unsupported(elem.tag)
+        return (elem.text or "").strip()
+
+    @staticmethod
+    def _sanitized(html: str) -> str:
+        """strips the dangerous markup, i.e. scripts and event handler attributes, like feedparser"""
+        if "<" not in html:
+            return html
+        return _sanitize_html(html, "utf-8", "text/html")
+
+    def _rss_item(self, elem: ElementTree.Element) -> schema.Item:
+        fields = {}
+        permalink = None
+        for child in elem:
+            if child.tag == "title" and "title" not in fields:
+                title = self._text(child)
+                # an rss title is plain text, unless it looks like html to feedparser
+                if "<" in title and _FeedParserMixin.looks_like_html(title):
+                    title = self._sanitized(title)
+                fields["title"] = title
+            elif child.tag == "description" and "description" not in fields:
+                fields["description"] = self._sanitized(self._text(child))
+            elif child.tag == "link":
+                fields.setdefault("link", self._text(child))
+            elif child.tag in ("author", DC_CREATOR):
+                fields.setdefault("author", self._text(child))
+            elif child.tag == "guid":
+                fields.setdefault("guid", self._text(child))
+                if child.get("isPermaLink", "true") != "false":
+                    permalink = fields["guid"]
+        if "link" not in fields and permalink:
+            fields["link"] = permalink
+        return schema.Item.construct(**fields)
+
+    def _atom_entry(self, elem: ElementTree.Element) -> schema.Item:
+        fields = {}
+        content = None
+        for child in elem:
+            if child.tag == f"{ATOM}title":
+                fields.setdefault("title", self._atom_text(child))
+            elif child.tag == f"{ATOM}summary":
+                fields.setdefault("description", self._atom_text(child))
+            elif child.tag == f"{ATOM}content" and content is None:
+                content = self._atom_text(child)
+            elif child.tag == f"{ATOM}link" and child.get("rel", "alternate") == "alternate":
+                fields.setdefault("link", child.get("href"))
+            elif child.tag == f"{ATOM}id":
+                fields.setdefault("guid", self._text(child))
+            elif child.tag == f"{ATOM}author" and "author" not in fields:
+                name = child.findtext(f"{ATOM}name")
+                email = child.findtext(f"{ATOM}email")
+                if name and email:
+                    fields["author"] = f"{name.strip()} ({email.strip()})"
+                elif name or email:
+                    fields["author"] = (name or email).strip()
+        if "description" not in fields and content is not None:
+            fields["description"] = content
+        if "link" not in fields and "guid" in fields:
+            fields["link"] = fields["guid"]
+        return schema.Item.construct(**fields)
+
+    def _atom_text(self, elem: ElementTree.Element) -> str:
+        if elem.get("type") == "xhtml":
+            raise _Unsupported(elem.tag)
+        if elem.get("type") == "html":
+            return self._sanitized(self._text(elem))
+        return self._text(elem)
@@ -0,0 +1,75 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from logging import getLogger
+from rss import schema, exceptions
+from rss.parser import Parser
+from threading import Lock
+from typing import Callable, List, Optional, Tuple, Union
+from time import perf_counter
+from utils import add_slots
+
+
+@add_slots
+@dataclass
+class ParseResult:
+    url: str
+    items: Optional[List[schema.Item]] = None
+    error: Optional[str] = None
+    parse_seconds: float = 0
+
+
+def _timed_parse(parser_: Parser, data: Union[str, bytes]) -> Tuple[List[schema.Item], float]:
+    start = perf_counter()
+    items = parser_.parse(data)
+    return items, perf_counter() - start
+
+
+class ParserPool:
+    """Runs a parser on a pool of processes.
+
+    At most 'max_backlog' parses are submitted at once, callers should check 'full' before submitting
+    and keep the rest of the data on their side.
+    """
+
+    def __init__(self, parser_: Parser, processes: int, max_backlog: int):
+        self.parser = parser_
+        self.processes = processes
+        self.max_backlog = max_backlog
+        self.executor = ProcessPoolExecutor(max_workers=processes)
+        self._pending = 0
+        self._lock = Lock()
+
+    @property
+    def full(self) -> bool:
+        return self._pending >= self.max_backlog
+
+    def submit(self, url: str, data: Union[str, bytes], callback: Callable[[ParseResult], None]):
+        """Parses the data in the pool, the callback is called with a 'ParseResult' from a pool thread."""
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self.executor.submit(_timed_parse, self.parser, data)
+        except BrokenProcessPool as e:
+            getLogger().error(f"Parser pool is broken, creating a new one: {repr(e)}")
+            self.executor = ProcessPoolExecutor(max_workers=self.processes)
+            future = self.executor.submit(_timed_parse, self.parser, data)
+        future.add_done_callback(lambda f: self._done(url, f, callback))
+
+    def _done(self, url: str, future: Future, callback: Callable[[ParseResult], None]):
+        with self._lock:
+            self._pending -= 1
+        if future.cancelled():
+            return
+        try:
+            items, parse_seconds = future.result()
+        except exceptions.ParseError as e:
+            callback(ParseResult(url=url, error=repr(e)))
+        except Exception as e:
+            getLogger().exception(e)
+            callback(ParseResult(url=url, error=repr(e)))
+        else:
+            callback(ParseResult(url=url, items=items, parse_seconds=parse_seconds))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
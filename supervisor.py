@@ -0,0 +1,95 @@
+from logging import getLogger
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from threading import Event
+from time import monotonic
+from typing import Callable, List, Optional
+import os
+import signal
+
+
+class Supervisor:
+    """Runs a target in a number of child processes, restarting the ones that die.
+
+    The children are forked, so everything created before 'run' is shared with them. Connections must be
+    created by the target itself.
+    """
+
+    def __init__(
+            self, processes: int, target: Callable[[int], None],
+            restart_delay: float = 1, stop_timeout: float = 30
+    ):
+        """
+
+        :param processes: number of child processes to run.
+        :param target: function to run in a child, called with the index of the child.
+        :param restart_delay: min seconds between two starts of the same child, so a child failing on start
+            doesn't spin.
+        :param stop_timeout: seconds to wait for the children to exit gracefully before killing them.
+        """
+        self.processes = processes
+        self.target = target
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        self.stop_event = Event()
+        self._context = get_context("fork")
+        self.children: List[Optional[BaseProcess]] = [None] * processes
+        self._started = [0.0] * processes
+
+    def run(self):
+        """starts the children and keeps them running until 'stop' is called, then waits for them to exit"""
+        getLogger().info(f"Starting {self.processes} worker processes")
+        while not self.stop_event.is_set():
+            for i, child in enumerate(self.children):
+                if self.stop_event.is_set():
+                    break
+                if child is not None and child.is_alive():
+                    continue
+                if monotonic() - self._started[i] < self.restart_delay:
+                    continue
+                if child is not None:
+                    # only logged, the supervisor serves no metrics of its own
+                    getLogger().error(f"Worker process {child.pid} exited with {child.exitcode}, starting another one")
+                self._start(i)
+            alive = [child.sentinel for child in self.children if child is not None and child.is_alive()]
+            wait(alive, timeout=self.restart_delay)
+        self._join()
+
+    def _start(self, index: int):
+        child = self._context.Process(target=self._child_main, args=(index,), daemon=False)
+        child.start()
+        self.children[index] = child
+        self._started[index] = monotonic()
+
+    def _child_main(self, index: int):
+        # the supervisor forwards the signals, so a Ctrl+C reaching the whole group must not stop a child twice
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # the default action of SIGUSR1 is to terminate, the target sets its own handler
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        self.target(index)
+
+    def stop(self, sig=None, frame=None):
+        """stops restarting the children and asks them to exit gracefully"""
+        self.stop_event.set()
+        for child in self.children:
+            if child is not None and child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    def forward(self, sig, frame=None):
+        """sends the signal to the running children, usable as a signal handler"""
+        for child in self.children:
+            if child is not None and child.is_alive():
+                os.kill(child.pid, sig)
+
+    def _join(self):
+        deadline = monotonic() + self.stop_timeout
+        for child in self.children:
+            if child is None:
+                continue
+            child.join(max(0.0, deadline - monotonic()))
+            if child.is_alive():
+                getLogger().error(f"Worker process {child.pid} did not exit in time, killing it")
+                child.kill()
+                child.join()
@@ -1,5 +1,5 @@
 import pytest
-from broker import publisher
+from broker import publisher, compression, connection
 from config import get_conf
 import pika
 
@@ -34,3 +34,54 @@ def test_publish_data(consumer_channel, basic_publisher: publisher.Publisher):
     assert body == b"test"
     consumer_channel.basic_ack(delivery_tag=m.delivery_tag)
     basic_publisher.close()
+
+
+def test_publish_batch(consumer_channel):
+    batch_publisher = publisher.RabbitmqBatchPublisher(
+        get_conf().rabbitmq_url, get_conf().result_exchange,
+        get_conf().routing_key, 1, 0, batch_size=2, batch_interval=60
+    )
+    assert batch_publisher.publish_tracked(b"test1", 1) == []
+    assert batch_publisher.publish_tracked(b"test2", 2) == [1, 2]
+    msg_gen = consumer_channel.consume("test_q", inactivity_timeout=1)
+    for expected in (b"test1", b"test2"):
+        m, _, body = next(msg_gen)
+        assert body == expected
+        consumer_channel.basic_ack(delivery_tag=m.delivery_tag)
+    batch_publisher.close()
+
+
+def test_publish_compressed(consumer_channel):
+    compressor = compression.GzipCompressor()
+    compressed_publisher = publisher.RabbitmqPublisher(
+        get_conf().rabbitmq_url, get_conf().result_exchange,
+        get_conf().routing_key, 1, 0, compressor=compressor, compress_min_size=100
+    )
+    large = b"test" * 100
+    compressed_publisher.publish(b"test")
+    compressed_publisher.publish(large)
+    msg_gen = consumer_channel.consume("test_q", inactivity_timeout=1)
+    m, props, body = next(msg_gen)
+    # below the threshold
+    assert props.content_encoding is None and body == b"test"
+    consumer_channel.basic_ack(delivery_tag=m.delivery_tag)
+    m, props, body = next(msg_gen)
+    assert props.content_encoding == "gzip" and compressor.decompress(body) == large
+    consumer_channel.basic_ack(delivery_tag=m.delivery_tag)
+    compressed_publisher.close()
+
+
+def test_threaded_publish(consumer_channel):
+    connection_ = connection.RabbitmqConnection(get_conf().rabbitmq_url, 1, 0)
+    threaded_publisher = publisher.ThreadedPublisher(
+        connection_, get_conf().result_exchange, get_conf().routing_key
+    )
+    threaded_publisher.publish_tracked(b"test1", 1)
+    threaded_publisher.publish_tracked(b"test2", 2)
+    assert threaded_publisher.flush(force=True) == [1, 2]
+    msg_gen = consumer_channel.consume("test_q", inactivity_timeout=1)
+    for expected in (b"test1", b"test2"):
+        m, _, body = next(msg_gen)
+        assert body == expected
+        consumer_channel.basic_ack(delivery_tag=m.delivery_tag)
+    threaded_publisher.close()
@@ -1,6 +1,6 @@
 import pytest
 from config import get_conf
-from broker import task_reader
+from broker import task_reader, connection
 import pika
 
 
@@ -49,3 +49,27 @@ def test_read_task(basic_task_reader: task_reader.TaskReader, publisher_channel)
             break
     basic_task_reader.ack(task_id)
     assert task.link == "test"
+
+
+def test_threaded_read_task(publisher_channel):
+    connection_ = connection.RabbitmqConnection(get_conf().rabbitmq_url, 1, 0)
+    threaded_task_reader = task_reader.ThreadedTaskReader(
+        connection_, 1, get_conf().work_queue, get_conf().task_exchange, get_conf().binding_key
+    )
+    publisher_channel.basic_publish(
+        get_conf().task_exchange,
+        get_conf().binding_key,
+        '{"link": "test"}',
+        pika.BasicProperties(delivery_mode=2)
+    )
+    task_gen = threaded_task_reader.get_task()
+    task = None
+    task_id = None
+    for _ in range(100):
+        task, task_id = next(task_gen)
+        if task:
+            break
+    threaded_task_reader.ack(task_id)
+    threaded_task_reader.close()
+    assert task.link == "test"
+    assert not connection_.is_alive()
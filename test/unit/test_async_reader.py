@@ -0,0 +1,75 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+import threading
+import pytest
+from reader import async_reader, data
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/feed":
+            body = b"test"
+            self.send_response(200)
+        elif self.path == "/large":
+            body = b"test" * 1024
+            self.send_response(200)
+        else:
+            body = b""
+            self.send_response(500)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def reader_queues():
+    event = threading.Event()
+    in_q = Queue()
+    result_q = Queue()
+    r = async_reader.AsyncReader(in_q, result_q, event, max_in_flight=4, per_host_limit=2, max_body_size=1024)
+    r.start()
+    yield in_q, result_q
+    event.set()
+    r.join(3)
+
+
+def test_async_reader_success(server_url, reader_queues):
+    in_q, result_q = reader_queues
+    for _ in range(10):
+        in_q.put(data.InputData(url=f"{server_url}/feed"))
+    for _ in range(10):
+        assert result_q.get(timeout=3) == data.ResultData(url=f"{server_url}/feed", data=b"test")
+
+
+def test_async_reader_status_mismatch(server_url, reader_queues):
+    in_q, result_q = reader_queues
+    in_q.put(data.InputData(url=f"{server_url}/missing"))
+    result = result_q.get(timeout=3)
+    assert result.error is not None and result.data is None
+
+
+def test_async_reader_exception(reader_queues):
+    in_q, result_q = reader_queues
+    in_q.put(data.InputData(url="test"))
+    result = result_q.get(timeout=3)
+    assert result.error is not None and result.data is None
+
+
+def test_async_reader_too_large(server_url, reader_queues):
+    in_q, result_q = reader_queues
+    in_q.put(data.InputData(url=f"{server_url}/large"))
+    result = result_q.get(timeout=3)
+    assert "ResponseTooLarge" in result.error and result.data is None
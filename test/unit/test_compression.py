@@ -0,0 +1,27 @@
+from broker import compression
+import pytest
+
+DATA = b'{"link":"test","items":[' + b'{"title":"test"},' * 1000 + b'],"error":null}'
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_compress_round_trip(encoding):
+    if encoding == "zstd":
+        pytest.importorskip("zstandard")
+    compressor = compression.get_compressor(encoding)
+    assert compressor.encoding == encoding
+    compressed = compressor.compress(DATA)
+    assert len(compressed) < len(DATA)
+    assert compressor.decompress(compressed) == DATA
+
+
+def test_gzip_is_deterministic():
+    compressor = compression.get_compressor("gzip", 9)
+    assert compressor.level == 9
+    assert compressor.compress(DATA) == compressor.compress(DATA)
+
+
+def test_get_compressor_none():
+    assert compression.get_compressor("none") is None
+    with pytest.raises(ValueError):
+        compression.get_compressor("brotli")
@@ -0,0 +1,228 @@
+from threading import Event
+from pika import spec
+from broker import connection, task_reader, publisher, exceptions
+import pytest
+
+
+class MockChannel:
+    def __init__(self):
+        self.is_open = True
+        self.acks = []
+        self.rejects = []
+        self.published = []
+        self.on_message = None
+        self.on_confirm = None
+        self._close_callbacks = []
+
+    def add_on_close_callback(self, callback):
+        self._close_callbacks.append(callback)
+
+    def add_on_cancel_callback(self, callback):
+        pass
+
+    def exchange_declare(self, *args, **kwargs):
+        pass
+
+    def basic_qos(self, *args, **kwargs):
+        pass
+
+    def queue_declare(self, *args, **kwargs):
+        pass
+
+    def queue_bind(self, *args, **kwargs):
+        pass
+
+    def basic_consume(self, queue, on_message_callback, callback=None):
+        self.on_message = on_message_callback
+        callback(None)
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        self.on_confirm = ack_nack_callback
+        callback(None)
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_reject(self, delivery_tag):
+        self.rejects.append(delivery_tag)
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append(body)
+
+    def close(self):
+        self.is_open = False
+        for callback in self._close_callbacks:
+            callback(self, "closed")
+
+    def deliver(self, delivery_tag: int, body: bytes):
+        self.on_message(self, spec.Basic.Deliver(delivery_tag=delivery_tag), None, body)
+
+    def confirm(self, delivery_tag: int, multiple: bool = False, ack: bool = True):
+        method = spec.Basic.Ack if ack else spec.Basic.Nack
+        self.on_confirm(type("Frame", (), {"method": method(delivery_tag=delivery_tag, multiple=multiple)}))
+
+
+class MockSelectConnection:
+    is_open = True
+
+    def __init__(self):
+        self.channels = []
+
+    def channel(self, on_open_callback):
+        channel = MockChannel()
+        self.channels.append(channel)
+        on_open_callback(channel)
+
+
+class MockConnection:
+    """runs the callbacks at once, instead of on an I/O thread"""
+    retry_interval = 0
+
+    def __init__(self):
+        self.failed = Event()
+        self.connection = MockSelectConnection()
+        self.later = []
+
+    def attach(self, client):
+        client.on_connection_open(self.connection)
+
+    def detach(self, client):
+        pass
+
+    def call_threadsafe(self, callback):
+        if self.failed.is_set():
+            raise exceptions.ConnectionFailed
+        callback()
+
+    def call_later(self, delay, callback):
+        self.later.append(callback)
+
+    @property
+    def channel(self) -> MockChannel:
+        return self.connection.channels[-1]
+
+
+def _task_reader(connection_: MockConnection, **kwargs) -> task_reader.ThreadedTaskReader:
+    return task_reader.ThreadedTaskReader(
+        connection_, prefetch=10, queue_name="q", exchange_name="e", binding_key="k", poll_interval=0.01, **kwargs
+    )
+
+
+def test_threaded_task_reader_ack_and_reject():
+    connection_ = MockConnection()
+    reader = _task_reader(connection_)
+    tasks = reader.get_task()
+    assert next(tasks) == (None, None)
+    connection_.channel.deliver(1, b'{"link": "http://a.com"}')
+    connection_.channel.deliver(2, b'bad')
+    connection_.channel.deliver(3, b'{"link": "http://b.com"}')
+    task, first_id = next(tasks)
+    assert task.link == "http://a.com"
+    # the bad one is acked right away
+    task, second_id = next(tasks)
+    assert task.link == "http://b.com"
+    assert connection_.channel.acks == [(2, False)]
+    reader.ack(first_id)
+    reader.reject(second_id)
+    assert connection_.channel.acks == [(2, False), (1, False)]
+    assert connection_.channel.rejects == [3]
+
+
+def test_threaded_task_reader_drops_stale_deliveries():
+    connection_ = MockConnection()
+    reader = _task_reader(connection_)
+    tasks = reader.get_task()
+    lost = connection_.channel
+    lost.deliver(1, b'{"link": "http://a.com"}')
+    task, task_id = next(tasks)
+    lost.deliver(2, b'{"link": "http://b.com"}')
+    lost.close()
+    assert not reader.ready.is_set()
+    # the channel is opened again after the retry interval
+    connection_.later.pop()()
+    assert reader.ready.is_set() and connection_.channel is not lost
+    # the broker requeues both of them, so the buffered one is dropped and the ack of the other is ignored
+    assert next(tasks) == (None, None)
+    reader.ack(task_id)
+    assert lost.acks == [] and connection_.channel.acks == []
+    connection_.channel.deliver(1, b'{"link": "http://b.com"}')
+    task, task_id = next(tasks)
+    reader.ack(task_id)
+    assert task.link == "http://b.com" and connection_.channel.acks == [(1, False)]
+
+
+def test_threaded_task_reader_coalesces_acks():
+    connection_ = MockConnection()
+    reader = _task_reader(connection_, ack_batch_size=2, ack_flush_interval=60)
+    tasks = reader.get_task()
+    for tag in range(1, 4):
+        connection_.channel.deliver(tag, b'{"link": "http://a.com/%d"}' % tag)
+    task_ids = [next(tasks)[1] for _ in range(3)]
+    reader.ack_many(task_ids[:2])
+    reader.ack(task_ids[2])
+    assert connection_.channel.acks == [(2, True)]
+    reader.close()
+    assert connection_.channel.acks == [(2, True), (3, True)]
+    assert reader.closed.is_set() and not connection_.channel.is_open
+
+
+def test_threaded_task_reader_connection_failed():
+    connection_ = MockConnection()
+    reader = _task_reader(connection_)
+    tasks = reader.get_task()
+    connection_.failed.set()
+    with pytest.raises(exceptions.ConnectionFailed):
+        next(tasks)
+
+
+def test_threaded_publisher_returns_confirmed_tags():
+    connection_ = MockConnection()
+    publisher_ = publisher.ThreadedPublisher(connection_, "e", "k")
+    assert publisher_.publish_tracked(b"1", "a") == []
+    assert publisher_.publish_tracked(b"2", "b") == []
+    publisher_.publish(b"3")
+    assert connection_.channel.published == [b"1", b"2", b"3"]
+    connection_.channel.confirm(2, multiple=True)
+    assert publisher_.flush() == ["a", "b"]
+    # untracked messages are confirmed too, without a tag
+    connection_.channel.confirm(3)
+    assert publisher_.flush(force=True) == [] and publisher_.pending == 0
+
+
+def test_threaded_publisher_flush_due():
+    connection_ = MockConnection()
+    publisher_ = publisher.ThreadedPublisher(connection_, "e", "k", confirm_poll=0.01)
+    assert publisher_.flush_due() is None
+    publisher_.publish_tracked(b"1", "a")
+    # the caller looks again for the confirm shortly, instead of waiting for its own timeout
+    assert publisher_.flush_due() == 0.01
+    connection_.channel.confirm(1)
+    assert publisher_.flush_due() == 0
+    assert publisher_.flush() == ["a"] and publisher_.flush_due() is None
+
+
+def test_threaded_publisher_publishes_again_unconfirmed():
+    connection_ = MockConnection()
+    publisher_ = publisher.ThreadedPublisher(connection_, "e", "k", flush_timeout=0.01)
+    publisher_.publish_tracked(b"1", "a")
+    publisher_.publish_tracked(b"2", "b")
+    lost = connection_.channel
+    lost.confirm(1, ack=False)
+    # a nacked message is published again at once
+    assert lost.published == [b"1", b"2", b"1"]
+    lost.close()
+    publisher_.publish_tracked(b"3", "c")
+    assert publisher_.flush(force=True) == []
+    connection_.later.pop()()
+    # the unconfirmed messages go first, in their order
+    assert connection_.channel.published == [b"2", b"1", b"3"]
+    connection_.channel.confirm(3, multiple=True)
+    assert publisher_.flush() == ["b", "a", "c"]
+
+
+def test_rabbitmq_connection_gives_up():
+    connection_ = connection.RabbitmqConnection("amqp://localhost:1", retry=2, retry_interval=0.01)
+    with pytest.raises(exceptions.ConnectionFailed):
+        publisher.ThreadedPublisher(connection_, "e", "k")
+    connection_.join(5)
+    assert not connection_.is_alive()
@@ -0,0 +1,34 @@
+from rss import content_cache, schema
+
+
+def test_get_same_digest_only():
+    cache = content_cache.ContentCache()
+    digest = cache.digest(b"body")
+    assert digest == cache.digest("body")
+    items = [schema.Item(title="test")]
+    cache.set("url", digest, items)
+    assert cache.get("url", digest).items == items
+    assert cache.get("url", cache.digest(b"other body")) is None
+    assert cache.get("other url", digest) is None
+
+
+def test_without_items():
+    cache = content_cache.ContentCache(keep_items=False)
+    digest = cache.digest(b"body")
+    cache.set("url", digest, [schema.Item(title="test")])
+    assert cache.get("url", digest).items is None
+
+
+def test_evicts_least_recently_used_by_size():
+    items = [schema.Item(description="x" * 1000)]
+    cache = content_cache.ContentCache(max_bytes=5000)
+    for url in ("a", "b", "c"):
+        cache.set(url, cache.digest(url), items)
+    assert cache.get("a", cache.digest("a")) is not None
+    cache.set("d", cache.digest("d"), items)
+    # 'b' is the least recently used
+    assert cache.get("b", cache.digest("b")) is None
+    assert len(cache) == 3
+    assert cache.size <= cache.max_bytes
+    cache.set("a", cache.digest("a"), [])
+    assert cache.size == sum(entry.size for entry in cache._entries.values())
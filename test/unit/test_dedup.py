@@ -0,0 +1,50 @@
+from rss import dedup, schema
+
+
+def _filter(deduplicator: dedup.ItemDeduplicator, url: str, items):
+    new_items = deduplicator.filter(url, items)
+    deduplicator.commit(url, new_items)
+    return new_items
+
+
+def test_filter_new_and_changed_items():
+    deduplicator = dedup.ItemDeduplicator()
+    items = [schema.Item(title="a", guid="1"), schema.Item(title="b", link="http://example.org/b")]
+    assert _filter(deduplicator, "feed", items) == items
+    assert _filter(deduplicator, "feed", items) == []
+    changed = schema.Item(title="a changed", guid="1")
+    assert _filter(deduplicator, "feed", [changed, items[1]]) == [changed]
+    # items are tracked per feed
+    assert _filter(deduplicator, "other feed", items) == items
+
+
+def test_filter_remembers_only_committed(tmp_path):
+    deduplicator = dedup.ItemDeduplicator(path=str(tmp_path / "dedup.db"))
+    a, b = schema.Item(guid="a"), schema.Item(guid="b")
+    assert deduplicator.filter("feed", [a, b]) == [a, b]
+    # the publish of b is lost
+    deduplicator.commit("feed", [a])
+    assert deduplicator.filter("feed", [a, b]) == [b]
+
+
+def test_ttl_and_size_eviction(monkeypatch):
+    deduplicator = dedup.ItemDeduplicator(max_size=1)
+    a, b = schema.Item(guid="a"), schema.Item(guid="b")
+    _filter(deduplicator, "feed", [a])
+    _filter(deduplicator, "feed", [b])
+    assert _filter(deduplicator, "feed", [a]) == [a]
+
+    deduplicator = dedup.ItemDeduplicator(ttl=60)
+    monkeypatch.setattr(dedup, "time", lambda: 0)
+    _filter(deduplicator, "feed", [a])
+    monkeypatch.setattr(dedup, "time", lambda: 61)
+    assert deduplicator.filter("feed", [a]) == [a]
+
+
+def test_persistent_store(tmp_path):
+    path = str(tmp_path / "dedup.db")
+    items = [schema.Item(title="a", guid="1")]
+    deduplicator = dedup.ItemDeduplicator(path=path)
+    _filter(deduplicator, "feed", items)
+    deduplicator.close()
+    assert dedup.ItemDeduplicator(path=path).filter("feed", items) == []
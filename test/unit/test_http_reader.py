@@ -1,7 +1,9 @@
 from typing import Dict, Optional
 from queue import Queue
 import threading
-from reader import http_reader, data
+from reader import http_reader, data, exceptions
+from time import monotonic, sleep
+import pytest
 
 
 def test_reader_exception():
@@ -25,7 +27,7 @@ def test_reader_success():
 
     class MockSessionRaiseGet(http_reader.HttpSessionGettable):
         def get(self, url: str, headers: Optional[Dict] = None):
-            return http_reader.Response(text="test", status_code=200)
+            return http_reader.Response(content=b"test", status_code=200)
 
     event = threading.Event()
     in_q = Queue()
@@ -33,7 +35,7 @@ def test_reader_success():
     r = http_reader.Reader(in_q, result_q, event, session=MockSessionRaiseGet())
     r.start()
     in_q.put(data.InputData(url="test"))
-    assert result_q.get(timeout=3) == data.ResultData(url="test", data="test")
+    assert result_q.get(timeout=3) == data.ResultData(url="test", data=b"test")
     event.set()
     r.join(3)
 
@@ -42,7 +44,7 @@ def test_reader_status_mismatch():
 
     class MockSessionRaiseGet(http_reader.HttpSessionGettable):
         def get(self, url: str, headers: Optional[Dict] = None):
-            return http_reader.Response(text="", status_code=500)
+            return http_reader.Response(content=b"", status_code=500)
 
     event = threading.Event()
     in_q = Queue()
@@ -54,3 +56,99 @@ def test_reader_status_mismatch():
     assert result.error is not None and result.data is None
     event.set()
     r.join(3)
+
+
+def test_reader_not_modified():
+
+    class MockSessionRaiseGet(http_reader.HttpSessionGettable):
+        def get(self, url: str, headers: Optional[Dict] = None):
+            return http_reader.Response(content=b"", status_code=304)
+
+    event = threading.Event()
+    in_q = Queue()
+    result_q = Queue()
+    r = http_reader.Reader(in_q, result_q, event, session=MockSessionRaiseGet())
+    r.start()
+    in_q.put(data.InputData(url="test"))
+    assert result_q.get(timeout=3) == data.ResultData(url="test", not_modified=True)
+    event.set()
+    r.join(3)
+
+
+def test_read_limited():
+    assert http_reader.read_limited([b"te", b"st"], 4) == b"test"
+    with pytest.raises(exceptions.ResponseTooLarge):
+        http_reader.read_limited([b"te", b"st", b"!"], 4)
+
+
+def test_reader_session_not_shared():
+    event = threading.Event()
+    r1 = http_reader.Reader(Queue(), Queue(), event)
+    r2 = http_reader.Reader(Queue(), Queue(), event)
+    assert r1.session is not r2.session
+
+
+def test_http_session_pool_config():
+    session = http_reader.HttpSession(pool_connections=5, pool_maxsize=3, keep_alive=False)
+    adapter = session.session.get_adapter("https://example.org/feed")
+    assert adapter._pool_connections == 5 and adapter._pool_maxsize == 3
+    assert session.session.headers["Connection"] == "close"
+
+
+def test_parse_retry_after():
+    assert http_reader.parse_retry_after(None) is None
+    assert http_reader.parse_retry_after("120") == 120
+    assert http_reader.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert http_reader.parse_retry_after("soon") is None
+
+
+def test_result_from_response_retry_after():
+    result = http_reader.result_from_response(
+        "test", http_reader.Response(content=b"", status_code=429, retry_after=30)
+    )
+    assert result.error is not None
+    assert result.status_code == 429
+    assert result.retry_after == 30
+
+
+def test_result_from_response_validators():
+    validators = http_reader.Validators(etag='"abc"')
+    result = http_reader.result_from_response(
+        "test", http_reader.Response(content=b"test", status_code=200, validators=validators)
+    )
+    # handed to the main loop instead of being stored before the content is published
+    assert result.validators == validators
+
+
+def test_read_limited_deadline():
+    def chunks():
+        yield b"a"
+        sleep(0.06)
+        yield b"b"
+
+    with pytest.raises(exceptions.FetchTimeout):
+        http_reader.read_limited(chunks(), 10, deadline=monotonic() + 0.05)
+    assert http_reader.read_limited(chunks(), 10, deadline=monotonic() + 1) == b"ab"
+
+
+def test_reader_abandoned_drops_result():
+    release = threading.Event()
+
+    class MockSessionBlockingGet(http_reader.HttpSessionGettable):
+        def get(self, url: str, headers: Optional[Dict] = None):
+            release.wait(3)
+            return http_reader.Response(content=b"test", status_code=200)
+
+    in_q = Queue()
+    result_q = Queue()
+    r = http_reader.Reader(in_q, result_q, threading.Event(), session=MockSessionBlockingGet())
+    r.start()
+    in_q.put(data.InputData(url="test"))
+    while r.current is None:
+        sleep(0.01)
+    assert r.current.url == "test"
+    r.abandoned = True
+    release.set()
+    r.join(3)
+    assert not r.is_alive()
+    assert result_q.empty()
@@ -0,0 +1,38 @@
+from time import sleep
+import inflight
+
+
+def test_add_pop():
+    table = inflight.InFlightTable()
+    table.add("a", 1)
+    table.add("b", 2)
+    assert "a" in table and len(table) == 2
+    assert table.get("a").retries == 0
+    assert table.pop("a") == 1
+    assert "a" not in table
+    assert table.task_ids() == [2]
+
+
+def test_expired_oldest_first():
+    table = inflight.InFlightTable(timeout=0.05)
+    table.add("a", 1)
+    table.add("b", 2)
+    assert list(table.expired()) == []
+    sleep(0.06)
+    table.add("c", 3)
+    assert list(table.expired()) == ["a", "b"]
+    assert table.oldest_age() >= 0.05
+
+
+def test_restart_moves_to_the_back():
+    table = inflight.InFlightTable(timeout=0.05)
+    table.add("a", 1)
+    table.add("b", 2)
+    sleep(0.06)
+    table.restart("a")
+    assert list(table.expired()) == ["b"]
+    assert table.links() == ["b", "a"]
+
+
+def test_oldest_age_empty():
+    assert inflight.InFlightTable().oldest_age() == 0
@@ -0,0 +1,51 @@
+from broker import lease
+import pytest
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def registries(request, tmp_path):
+    if request.param == "memory":
+        leases = {}
+        return [lease.InMemoryLeaseRegistry(fresh_for=60, leases=leases) for _ in range(2)]
+    path = str(tmp_path / "leases.db")
+    return [lease.SqliteLeaseRegistry(path, fresh_for=60) for _ in range(2)]
+
+
+def test_acquire_held(registries):
+    first, second = registries
+    assert first.acquire("link", ttl=60) == lease.LeaseState.acquired
+    # taking its own lease again is fine
+    assert first.acquire("link", ttl=60) == lease.LeaseState.acquired
+    assert second.acquire("link", ttl=60) == lease.LeaseState.held
+    assert second.acquire("other link", ttl=60) == lease.LeaseState.acquired
+
+
+def test_release_completed(registries):
+    first, second = registries
+    first.acquire("link", ttl=60)
+    first.release("link", completed=True)
+    assert second.acquire("link", ttl=60) == lease.LeaseState.done
+
+
+def test_own_completed_is_done(registries):
+    first, _ = registries
+    first.acquire("link", ttl=60)
+    first.release("link", completed=True)
+    # a repeated task of a link this worker has just completed isn't fetched again either
+    assert first.acquire("link", ttl=60) == lease.LeaseState.done
+
+
+def test_release_failed(registries):
+    first, second = registries
+    first.acquire("link", ttl=60)
+    # only the holder can release
+    second.release("link", completed=True)
+    assert second.acquire("link", ttl=60) == lease.LeaseState.held
+    first.release("link", completed=False)
+    assert second.acquire("link", ttl=60) == lease.LeaseState.acquired
+
+
+def test_expired_lease(registries):
+    first, second = registries
+    first.acquire("link", ttl=0)
+    assert second.acquire("link", ttl=60) == lease.LeaseState.acquired
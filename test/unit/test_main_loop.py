@@ -1,11 +1,14 @@
+import json
 from typing import Generator, Tuple, Optional, List
-from broker import task_reader, publisher, schema
-from rss import parser
-from threading import Event
+from broker import task_reader, publisher, schema, lease
+from rss import parser, pool, content_cache, dedup
+import poller
+from threading import Event, Timer
+from time import sleep
 import loop
 from queue import Queue, Empty
 import pytest
-from reader import data
+from reader import data, scheduler, retry, validator_cache
 
 
 class MockTaskReader(task_reader.TaskReader):
@@ -14,13 +17,15 @@ class MockTaskReader(task_reader.TaskReader):
         self.tasks = tasks
         self.acked = []
         self.rejected = []
+        # the read timeouts sent by the loop
+        self.timeouts = []
 
-    def get_task(self) -> Generator[Tuple[Optional[schema.Task], Optional[int]], None, None]:
+    def get_task(self) -> Generator[Tuple[Optional[schema.Task], Optional[int]], Optional[float], None]:
         for i, task in enumerate(self.tasks):
-            yield task, i
+            self.timeouts.append((yield task, i))
         i = len(self.tasks)
         while True:
-            yield None, i
+            self.timeouts.append((yield None, i))
             i += 1
 
     def close(self):
@@ -33,6 +38,23 @@ class MockTaskReader(task_reader.TaskReader):
         self.rejected.append(task_id)
 
 
+class MockPrefetchTaskReader(MockTaskReader):
+    """delivers no more than prefetch tasks that are not acked yet, like the broker"""
+
+    def __init__(self, tasks, prefetch: int):
+        super().__init__(tasks)
+        self.prefetch = prefetch
+
+    def get_task(self) -> Generator[Tuple[Optional[schema.Task], Optional[int]], Optional[float], None]:
+        i = 0
+        while True:
+            if i < len(self.tasks) and i - len(self.acked) - len(self.rejected) < self.prefetch:
+                self.timeouts.append((yield self.tasks[i], i))
+                i += 1
+            else:
+                self.timeouts.append((yield None, None))
+
+
 class MockPublisher(publisher.Publisher):
     def __init__(self):
         self.published = []
@@ -93,7 +115,7 @@ def test_main_loop_iterate_success():
     assert len(mock_task_reader.rejected) == 0
 
 
-def test_main_loop_iterate_reject_duplicate():
+def test_main_loop_iterate_coalesce_duplicate():
     mock_parser = MockParser()
     mock_publisher = MockPublisher()
     tasks = [schema.Task(link=f"task") for _ in range(2)]
@@ -103,7 +125,13 @@ def test_main_loop_iterate_reject_duplicate():
     )
     main_loop._iterate()
     main_loop._iterate()
-    assert len(mock_task_reader.rejected) == 1
+    assert len(mock_task_reader.rejected) == 0
+    # a single fetch for both
+    assert main_loop.in_q.qsize() == 1
+    main_loop.result_q.put(data.ResultData(url=main_loop.in_q.get_nowait().url, data="test"))
+    main_loop._iterate()
+    assert len(mock_publisher.published) == 1
+    assert mock_task_reader.acked == [0, 1]
 
 
 def test_main_loop_dead_thread():
@@ -120,3 +148,535 @@ def test_main_loop_dead_thread():
     main_loop._worker_threads_check()
     for worker in main_loop.workers:
         assert worker.is_alive()
+
+
+def test_main_loop_not_modified():
+    mock_parser = MockParser(exception=Exception("should not parse"))
+    mock_publisher = MockPublisher()
+    mock_task_reader = MockTaskReader([schema.Task(link="task")])
+    main_loop = loop.MainLoop(
+        2, MockThread, parser_=mock_parser, publisher_=mock_publisher, task_reader_=mock_task_reader
+    )
+    main_loop._iterate()
+    task = main_loop.in_q.get_nowait()
+    main_loop.result_q.put(data.ResultData(url=task.url, not_modified=True))
+    main_loop._iterate()
+    assert loop.PublishData.parse_raw(mock_publisher.published[0]).not_modified
+    assert mock_task_reader.acked == [0]
+    assert len(main_loop.task_id_mapping) == 0
+
+
+def test_main_loop_parser_pool():
+    mock_publisher = MockPublisher()
+    tasks = [schema.Task(link=f"task{i}") for i in range(3)]
+    mock_task_reader = MockTaskReader(tasks)
+    parser_pool = pool.ParserPool(MockParser(), processes=1, max_backlog=1)
+    main_loop = loop.MainLoop(
+        3, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=mock_task_reader,
+        parser_pool=parser_pool
+    )
+    for _ in range(3):
+        main_loop._iterate()
+    for _ in range(3):
+        task = main_loop.in_q.get_nowait()
+        main_loop.result_q.put(data.ResultData(url=task.url, data="test"))
+    main_loop._iterate()
+    # only one parse fits in the backlog
+    assert len(main_loop.parse_waiting) == 2
+    for _ in range(3):
+        main_loop._handle_result(main_loop.result_q.get(timeout=10))
+    assert len(mock_publisher.published) == 3
+    assert loop.PublishData.parse_raw(mock_publisher.published[0]).items == [parser.schema.Item(title="test")]
+    assert len(mock_task_reader.acked) == 3
+    parser_pool.close()
+
+
+class MockBatchPublisher(MockPublisher):
+    def __init__(self):
+        super().__init__()
+        self.batch = []
+
+    def publish_tracked(self, msg: str, tag):
+        self.batch.append((msg, tag))
+        return []
+
+    def flush(self, force: bool = False):
+        if not force:
+            return []
+        self.published.extend(msg for msg, _ in self.batch)
+        tags = [tag for _, tag in self.batch]
+        self.batch = []
+        return tags
+
+
+def test_main_loop_ack_after_publish_confirm():
+    mock_publisher = MockBatchPublisher()
+    tasks = [schema.Task(link=f"task{i}") for i in range(2)]
+    mock_task_reader = MockTaskReader(tasks)
+    main_loop = loop.MainLoop(
+        2, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=mock_task_reader
+    )
+    main_loop._iterate()
+    main_loop._iterate()
+    task1 = main_loop.in_q.get_nowait()
+    main_loop.result_q.put(data.ResultData(url=task1.url, data="test"))
+    main_loop._iterate()
+    # the other task is still in flight, so the batch is not forced out
+    assert mock_task_reader.acked == []
+    assert len(main_loop.task_id_mapping) == 2
+    task2 = main_loop.in_q.get_nowait()
+    main_loop.result_q.put(data.ResultData(url=task2.url, data="test"))
+    main_loop._iterate()
+    assert len(mock_publisher.published) == 2
+    assert sorted(mock_task_reader.acked) == [0, 1]
+    assert len(main_loop.task_id_mapping) == 0
+
+
+def test_main_loop_read_waits_for_batch_interval():
+    mock_publisher = MockBatchPublisher()
+    mock_publisher.flush_due = lambda: 0.02 if mock_publisher.batch else None
+    mock_task_reader = MockTaskReader([schema.Task(link=f"task{i}") for i in range(2)])
+    main_loop = loop.MainLoop(
+        2, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=mock_task_reader,
+        max_in_flight=3
+    )
+    main_loop._iterate()
+    main_loop._iterate()
+    main_loop.result_q.put(data.ResultData(url=main_loop.in_q.get_nowait().url, data="test"))
+    main_loop._iterate()
+    main_loop._iterate()
+    # the reader is not kept waiting past the batch interval
+    assert mock_task_reader.timeouts[-1] == 0.02
+
+
+def test_main_loop_read_waits_briefly_for_results():
+    mock_task_reader = MockTaskReader([schema.Task(link="task0")])
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=mock_task_reader,
+        max_in_flight=2, result_poll=0.01
+    )
+    main_loop._iterate()
+    main_loop._iterate()
+    # task0 is in flight, its result may come at any time
+    assert mock_task_reader.timeouts[-1] == 0.01
+    # a result waiting to be handled, even the late one of a task not in flight
+    main_loop.result_q.put(data.ResultData(url="task1", data="test"))
+    main_loop._iterate()
+    assert mock_task_reader.timeouts[-1] == 0
+    main_loop._handle_result(data.ResultData(url="task0", data="test"))
+    main_loop._iterate()
+    # the reader's own read timeout once nothing is in flight
+    assert mock_task_reader.timeouts[-1] is None
+
+
+def test_main_loop_max_in_flight():
+    tasks = [schema.Task(link=f"task{i}") for i in range(4)]
+    mock_task_reader = MockTaskReader(tasks)
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=mock_task_reader,
+        max_in_flight=3
+    )
+    for _ in range(4):
+        main_loop._iterate()
+    assert len(main_loop.workers) == 1
+    # tasks beyond the single worker are buffered in in_q
+    assert main_loop.in_q.qsize() == 3
+    assert len(main_loop.task_id_mapping) == 3
+
+
+def test_main_loop_full_window_waits_for_result():
+    tasks = [schema.Task(link=f"task{i}") for i in range(2)]
+    mock_task_reader = MockTaskReader(tasks)
+    mock_publisher = MockPublisher()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=mock_task_reader,
+        wait_timeout=0.01
+    )
+    main_loop._iterate()
+    # the window is full, so the task reader is left alone
+    main_loop._iterate()
+    assert main_loop.in_q.qsize() == 1
+    task = main_loop.in_q.get_nowait()
+    Timer(0.1, main_loop.result_q.put, [data.ResultData(url=task.url, data="test")]).start()
+    main_loop.wait_timeout = 3
+    main_loop._iterate()
+    assert len(mock_publisher.published) == 1
+    assert mock_task_reader.acked == [0]
+
+
+def test_main_loop_releases_host_scheduler():
+    tasks = [schema.Task(link=f"http://a.com/{i}") for i in range(2)]
+    mock_task_reader = MockTaskReader(tasks)
+    host_scheduler = scheduler.HostScheduler(max_connections=1)
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=mock_task_reader,
+        max_in_flight=2, host_scheduler=host_scheduler
+    )
+    main_loop._iterate()
+    main_loop._iterate()
+    assert main_loop.in_q is host_scheduler
+    task = main_loop.in_q.get_nowait()
+    # a single connection per host
+    with pytest.raises(Empty):
+        main_loop.in_q.get_nowait()
+    main_loop.result_q.put(data.ResultData(url=task.url, error="status code:429", status_code=429))
+    main_loop._iterate()
+    assert main_loop.in_q.get_nowait().url == "http://a.com/1"
+
+
+def test_main_loop_parked_tasks_leave_room():
+    tasks = [schema.Task(link=link) for link in ["http://a.com/0", "http://a.com/1", "http://b.com/0"]]
+    host_scheduler = scheduler.HostScheduler(max_connections=1)
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=MockTaskReader(tasks),
+        max_in_flight=2, host_scheduler=host_scheduler
+    )
+    main_loop._iterate()
+    main_loop._iterate()
+    assert main_loop.in_q.get_nowait().url == "http://a.com/0"
+    # the other task of a.com waits for its host, it doesn't hold back b.com
+    main_loop._iterate()
+    assert len(main_loop.task_id_mapping) == 3
+    assert main_loop.in_q.get_nowait().url == "http://b.com/0"
+
+
+def test_main_loop_waiting_tasks_fit_in_prefetch():
+    host_scheduler = scheduler.HostScheduler()
+    # a.com has asked to be left alone
+    host_scheduler.put(data.InputData("http://a.com/"))
+    host_scheduler.release(host_scheduler.get_nowait().url, retry_after=60)
+    links = ["http://a.com/0", "http://a.com/1", "http://b.com/0", "http://b.com/1", "http://a.com/2", "http://b.com/2"]
+    # the prefetch has room for max_waiting on top of max_in_flight
+    mock_task_reader = MockPrefetchTaskReader([schema.Task(link=link) for link in links], prefetch=4)
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=mock_task_reader,
+        max_in_flight=2, max_waiting=2, host_scheduler=host_scheduler, wait_timeout=0.01
+    )
+    for _ in range(5):
+        main_loop._iterate()
+    # the paused host holds the waiting slots only, the other one still gets the window
+    assert [main_loop.in_q.get_nowait().url for _ in range(2)] == ["http://b.com/0", "http://b.com/1"]
+    assert main_loop._window_used() == main_loop.max_in_flight
+    main_loop.result_q.put(data.ResultData(url="http://b.com/0", data="test"))
+    main_loop._iterate()
+    main_loop._iterate()
+    # the third parked task counts against the window, which is full as soon as the prefetch is
+    assert len(main_loop.task_id_mapping) == 4
+    assert main_loop._window_used() == main_loop.max_in_flight
+
+
+def test_main_loop_retries_transient_failure():
+    mock_task_reader = MockTaskReader([schema.Task(link="task0")])
+    mock_publisher = MockPublisher()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=mock_task_reader,
+        retry_policy=retry.RetryPolicy(max_retries=1, base_delay=0.01), wait_timeout=0.1
+    )
+    main_loop._iterate()
+    task = main_loop.in_q.get_nowait()
+    main_loop.result_q.put(data.ResultData(url=task.url, error="timeout", retryable=True))
+    main_loop._iterate()
+    # the task is still in flight and nothing is published
+    assert mock_publisher.published == []
+    assert mock_task_reader.acked == []
+    # the waiting retry leaves room for a new task, whose read waits no longer than the retry delay
+    main_loop._iterate()
+    assert 0 <= mock_task_reader.timeouts[-1] <= 0.01
+    sleep(0.01)
+    main_loop._iterate()
+    assert main_loop.in_q.get_nowait().url == "task0"
+
+    # out of retries, so the error is published
+    main_loop.result_q.put(data.ResultData(url=task.url, error="timeout", retryable=True))
+    main_loop._iterate()
+    assert len(mock_publisher.published) == 1
+    assert mock_task_reader.acked == [0]
+    assert len(main_loop.task_id_mapping) == 0
+
+
+def test_main_loop_waiting_retries_fit_in_prefetch():
+    mock_task_reader = MockPrefetchTaskReader([schema.Task(link=f"task{i}") for i in range(3)], prefetch=2)
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=mock_task_reader,
+        retry_policy=retry.RetryPolicy(base_delay=10), max_in_flight=1, max_waiting=1, wait_timeout=0.01
+    )
+    main_loop._iterate()
+    main_loop._handle_result(data.ResultData(url="task0", error="timeout", retryable=True))
+    main_loop._iterate()
+    main_loop._handle_result(data.ResultData(url="task1", error="timeout", retryable=True))
+    main_loop._iterate()
+    # a burst of failures holds the waiting slots, the ones beyond them take the window like the broker's prefetch
+    assert len(main_loop.retry_delayed) == 2 and len(main_loop.task_id_mapping) == 2
+    assert main_loop._window_used() == main_loop.max_in_flight
+
+
+def test_main_loop_gives_up_retry_past_deadline():
+    mock_publisher = MockPublisher()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=mock_publisher,
+        task_reader_=MockTaskReader([schema.Task(link="task0")]),
+        retry_policy=retry.RetryPolicy(max_retries=1, base_delay=1), in_flight_timeout=1
+    )
+    main_loop._iterate()
+    main_loop._handle_result(data.ResultData(url="task0", error="status code:503", retryable=True, retry_after=5))
+    # the server asks for a longer wait than the task may take
+    assert len(mock_publisher.published) == 1 and len(main_loop.retry_delayed) == 0
+
+
+def test_publish_data_to_json():
+    items = [parser.schema.Item(title="tést", link="http://a.com/1"), parser.schema.Item.construct(guid="2")]
+    for publish_data in [
+        loop.PublishData(link="test", items=items),
+        loop.PublishData(link="test", error="error"),
+        loop.PublishData(link="test", not_modified=True),
+    ]:
+        # the same document as pydantic's, in compact form
+        assert json.loads(publish_data.to_json()) == json.loads(publish_data.json())
+        assert list(json.loads(publish_data.to_json())) == ["link", "items", "error", "not_modified"]
+
+
+@pytest.mark.parametrize("keep_items,skip_unchanged", [(True, False), (False, False), (True, True)])
+def test_main_loop_content_cache(keep_items, skip_unchanged):
+    tasks = [schema.Task(link="task0"), schema.Task(link="task0")]
+
+    class CountingParser(MockParser):
+        calls = 0
+
+        def parse(self, data: str) -> List[parser.schema.Item]:
+            CountingParser.calls += 1
+            return super().parse(data)
+
+    mock_task_reader = MockTaskReader(tasks)
+    mock_publisher = MockPublisher()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=CountingParser(), publisher_=mock_publisher, task_reader_=mock_task_reader,
+        content_cache_=content_cache.ContentCache(keep_items=keep_items), skip_unchanged=skip_unchanged
+    )
+    for _ in range(2):
+        main_loop._iterate()
+        task = main_loop.in_q.get_nowait()
+        main_loop.result_q.put(data.ResultData(url=task.url, data="test"))
+        main_loop._iterate()
+    assert CountingParser.calls == 1
+    assert mock_task_reader.acked == [0, 1]
+    if skip_unchanged:
+        assert len(mock_publisher.published) == 1
+    else:
+        second = loop.PublishData.parse_raw(mock_publisher.published[1])
+        assert second.not_modified is not keep_items
+        assert second.items == ([parser.schema.Item(title="test")] if keep_items else None)
+
+
+def test_main_loop_records_poll_outcomes():
+    tasks = [schema.Task(link=f"task{i}") for i in range(3)]
+
+    class MockPoller(poller.AdaptivePoller):
+        def __init__(self):
+            super().__init__(MockPublisher(), [f"task{i}" for i in range(3)])
+            self.outcomes = {}
+
+        def record(self, url: str, outcome: poller.PollOutcome):
+            self.outcomes[url] = outcome
+
+    mock_poller = MockPoller()
+    main_loop = loop.MainLoop(
+        3, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=MockTaskReader(tasks),
+        poller_=mock_poller
+    )
+    for _ in range(3):
+        main_loop._iterate()
+    main_loop.result_q.put(data.ResultData(url="task0", data="test"))
+    main_loop.result_q.put(data.ResultData(url="task1", not_modified=True))
+    main_loop.result_q.put(data.ResultData(url="task2", error="error"))
+    main_loop._iterate()
+    assert mock_poller.outcomes == {
+        "task0": poller.PollOutcome.changed,
+        "task1": poller.PollOutcome.unchanged,
+        "task2": poller.PollOutcome.error,
+    }
+
+
+def test_main_loop_expires_stuck_task():
+    mock_task_reader = MockTaskReader([schema.Task(link="task0")])
+    mock_publisher = MockPublisher()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=mock_task_reader,
+        in_flight_timeout=0.05
+    )
+    main_loop._iterate()
+    stuck = main_loop.workers[0]
+    stuck.current = main_loop.in_q.get_nowait()
+    sleep(0.06)
+    main_loop._iterate()
+    assert stuck.abandoned
+    assert main_loop.workers[0] is not stuck
+    assert "timed out" in loop.PublishData.parse_raw(mock_publisher.published[0]).error
+    assert mock_task_reader.acked == [0]
+
+    # a late result of the expired task is dropped
+    main_loop.result_q.put(data.ResultData(url="task0", data="test"))
+    main_loop._iterate()
+    assert len(mock_publisher.published) == 1
+
+
+def test_main_loop_drops_result_of_expired_unconfirmed_task():
+    tasks = [schema.Task(link=f"task{i}") for i in range(2)]
+    mock_task_reader = MockTaskReader(tasks)
+    mock_publisher = MockBatchPublisher()
+    main_loop = loop.MainLoop(
+        2, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=mock_task_reader,
+        in_flight_timeout=0.05, wait_timeout=0.01
+    )
+    main_loop._iterate()
+    sleep(0.06)
+    main_loop._iterate()
+    # the timeout of task0 waits in the batch, as task1 is still in flight
+    assert len(mock_publisher.batch) == 1
+    main_loop.result_q.put(data.ResultData(url="task0", data="test"))
+    main_loop._iterate()
+    assert len(mock_publisher.batch) == 1
+    main_loop._ack_published(mock_publisher.flush(force=True))
+    assert mock_task_reader.acked == [0]
+
+
+class MockParserPool:
+    def __init__(self):
+        self.full = True
+        self.submitted = []
+
+    def submit(self, url, data, callback):
+        self.submitted.append(url)
+
+
+def test_main_loop_late_parse_result_frees_pool_slot():
+    tasks = [schema.Task(link=f"task{i}") for i in range(2)]
+    mock_task_reader = MockTaskReader(tasks)
+    mock_pool = MockParserPool()
+    main_loop = loop.MainLoop(
+        2, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=mock_task_reader,
+        parser_pool=mock_pool
+    )
+    main_loop._iterate()
+    main_loop._iterate()
+    main_loop._handle_result(data.ResultData(url="task1", data="test"))
+    assert list(main_loop.parse_waiting)[0].url == "task1"
+    # task0 is gone meanwhile, its parse still frees a slot for the waiting one
+    main_loop.task_id_mapping.pop("task0")
+    mock_pool.full = False
+    main_loop._handle_result(pool.ParseResult(url="task0", items=[]))
+    assert mock_pool.submitted == ["task1"]
+
+
+def test_main_loop_lease_held_by_another_worker():
+    leases = {}
+    other = lease.InMemoryLeaseRegistry(leases=leases)
+    assert other.acquire("task0", ttl=60) == lease.LeaseState.acquired
+    mock_task_reader = MockTaskReader([schema.Task(link="task0")])
+    mock_publisher = MockPublisher()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=mock_task_reader,
+        lease_registry=lease.InMemoryLeaseRegistry(leases=leases), lease_recheck=0.01
+    )
+    main_loop._iterate()
+    # waits for the other worker instead of fetching
+    assert main_loop.in_q.empty()
+    assert len(main_loop.task_id_mapping) == 1
+    other.release("task0", completed=True)
+    sleep(0.01)
+    main_loop._iterate()
+    assert main_loop.in_q.empty()
+    assert mock_publisher.published == []
+    assert mock_task_reader.acked == [0]
+
+
+def test_main_loop_lease_waiting_leaves_room_and_outlives_deadline():
+    leases = {}
+    other = lease.InMemoryLeaseRegistry(leases=leases)
+    other.acquire("task0", ttl=60)
+    mock_task_reader = MockTaskReader([schema.Task(link=f"task{i}") for i in range(2)])
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=mock_task_reader,
+        lease_registry=lease.InMemoryLeaseRegistry(leases=leases), lease_recheck=0.02, in_flight_timeout=0.05
+    )
+    main_loop._iterate()
+    # the waiting task takes no slot of the window
+    main_loop._iterate()
+    assert main_loop.in_q.get_nowait().url == "task1"
+    for _ in range(4):
+        sleep(0.02)
+        main_loop._iterate()
+    # the other worker has died, its lease expires after the deadline of the waiting task
+    assert "task0" in main_loop.task_id_mapping and not main_loop.task_id_mapping.get("task0").published
+    other.release("task0", completed=False)
+    sleep(0.02)
+    main_loop._iterate()
+    assert main_loop.in_q.get_nowait().url == "task0"
+
+
+def test_main_loop_lease_waiting_fits_in_prefetch():
+    leases = {}
+    other = lease.InMemoryLeaseRegistry(leases=leases)
+    for i in range(2):
+        other.acquire(f"task{i}", ttl=60)
+    mock_task_reader = MockPrefetchTaskReader([schema.Task(link=f"task{i}") for i in range(3)], prefetch=2)
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=MockPublisher(), task_reader_=mock_task_reader,
+        lease_registry=lease.InMemoryLeaseRegistry(leases=leases), max_in_flight=1, max_waiting=1,
+        wait_timeout=0.01
+    )
+    for _ in range(3):
+        main_loop._iterate()
+    # the second waiting task takes the window, which is full along with the prefetch
+    assert len(main_loop.lease_delayed) == 2 and len(main_loop.task_id_mapping) == 2
+    assert main_loop._window_used() == main_loop.max_in_flight
+
+
+def test_main_loop_completes_lease_once_confirmed():
+    leases = {}
+    other = lease.InMemoryLeaseRegistry(leases=leases)
+    mock_publisher = MockBatchPublisher()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=mock_publisher,
+        task_reader_=MockTaskReader([schema.Task(link="task0")]),
+        lease_registry=lease.InMemoryLeaseRegistry(leases=leases)
+    )
+    main_loop._iterate()
+    main_loop._handle_result(data.ResultData(url="task0", data="test"))
+    # the publish may still be lost, so the lease is kept
+    assert other.acquire("task0", ttl=60) == lease.LeaseState.held
+    main_loop._ack_published(mock_publisher.flush(force=True))
+    assert other.acquire("task0", ttl=60) == lease.LeaseState.done
+
+
+def test_main_loop_stores_validators_once_confirmed():
+    tasks = [schema.Task(link=f"task{i}") for i in range(2)]
+    mock_publisher = MockBatchPublisher()
+    cache = validator_cache.ValidatorCache()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=mock_publisher, task_reader_=MockTaskReader(tasks),
+        max_in_flight=2, validator_cache_=cache
+    )
+    main_loop._iterate()
+    main_loop._iterate()
+    main_loop._handle_result(data.ResultData(url="task0", data="test", validators=validator_cache.Validators(etag="a")))
+    assert cache.get("task0") is None
+    main_loop.parser = MockParser(parser.exceptions.ParseError())
+    main_loop._handle_result(data.ResultData(url="task1", data="test", validators=validator_cache.Validators(etag="b")))
+    main_loop._ack_published(mock_publisher.flush(force=True))
+    assert cache.get("task0") == validator_cache.Validators(etag="a")
+    # the content of task1 is not published, it is fetched in full next time
+    assert cache.get("task1") is None
+
+
+def test_main_loop_remembers_items_once_confirmed():
+    mock_publisher = MockBatchPublisher()
+    main_loop = loop.MainLoop(
+        1, MockThread, parser_=MockParser(), publisher_=mock_publisher,
+        task_reader_=MockTaskReader([schema.Task(link="task0")]), deduplicator=dedup.ItemDeduplicator()
+    )
+    main_loop._iterate()
+    main_loop._handle_result(data.ResultData(url="task0", data="test"))
+    # the publish is not confirmed yet, so the item is still new
+    assert main_loop.deduplicator.filter("task0", [parser.schema.Item(title="test")])
+    main_loop._ack_published(mock_publisher.flush(force=True))
+    assert main_loop.deduplicator.filter("task0", [parser.schema.Item(title="test")]) == []
@@ -0,0 +1,39 @@
+from urllib.request import urlopen
+import metrics
+
+
+def test_render_histogram():
+    histogram = metrics.Histogram("test_seconds", "test histogram", ["host"], buckets=(0.1, 1))
+    histogram.labels("example.org").observe(0.05)
+    histogram.labels("example.org").observe(0.5)
+    histogram.labels("example.org").observe(5)
+    assert histogram.render() == "\n".join([
+        "# HELP test_seconds test histogram",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{host="example.org",le="0.1"} 1',
+        'test_seconds_bucket{host="example.org",le="1"} 2',
+        'test_seconds_bucket{host="example.org",le="+Inf"} 3',
+        'test_seconds_count{host="example.org"} 3',
+        'test_seconds_sum{host="example.org"} 5.55',
+    ])
+
+
+def test_render_counter_and_gauge():
+    counter = metrics.Counter("test_events", "test counter")
+    counter.inc()
+    counter.inc(2)
+    assert counter.render().endswith("test_events_total 3.0")
+    gauge = metrics.Gauge("test_depth", "test gauge", ["queue"])
+    gauge.set_function(lambda: 7, "in")
+    assert gauge.render().endswith('test_depth{queue="in"} 7')
+
+
+def test_observe_fetch_and_serve():
+    metrics.observe_fetch("http://metrics.example.org/feed", 0.2, 200, 10)
+    metrics.observe_fetch("http://metrics.example.org/feed", 0.2, None)
+    server = metrics.start_http_server(0, "127.0.0.1")
+    body = urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics").read().decode()
+    server.shutdown()
+    assert 'feedreader_fetch_responses_total{host="metrics.example.org",status="200"} 1.0' in body
+    assert 'feedreader_fetch_responses_total{host="metrics.example.org",status="error"} 1.0' in body
+    assert 'feedreader_fetch_bytes_total{host="metrics.example.org"} 10.0' in body
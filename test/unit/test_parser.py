@@ -21,16 +21,91 @@ def sample_rss():
     """
 
 
-def test_parse_error():
-    p = parser.BasicParser()
+@pytest.fixture(params=[parser.BasicParser, parser.FastParser])
+def any_parser(request):
+    return request.param()
+
+
+def test_parse_error(any_parser):
+    p = any_parser
     with pytest.raises(exceptions.ParseError):
         p.parse("blah blah")
 
 
-def test_parse_success(sample_rss):
-    p = parser.BasicParser()
+def test_parse_success(sample_rss, any_parser):
+    p = any_parser
     assert p.parse(sample_rss)[0] == schema.Item(
         title="test", link="http://example.org/2003/12/13/atom03",
         guid="urn:uuid:1225c695-cfb8-4ebb-aaaa-80da344efa6a",
         description="test"
     )
+
+
+def test_parse_bytes(sample_rss, any_parser):
+    p = any_parser
+    assert p.parse(sample_rss.encode())[0].title == "test"
+
+
+@pytest.fixture
+def sample_atom():
+    return """<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+        <title>Example Feed</title>
+        <link href="http://example.org/"/>
+        <id>urn:uuid:60a76c80-d399-11d9-b93C-0003939e0af6</id>
+        <entry>
+                <title>test</title>
+                <link rel="self" href="http://example.org/self"/>
+                <link href="http://example.org/2003/12/13/atom03"/>
+                <id>urn:uuid:1225c695-cfb8-4ebb-aaaa-80da344efa6a</id>
+                <summary>test</summary>
+                <author><name>John Doe</name></author>
+        </entry>
+</feed>
+    """
+
+
+def test_parse_atom(sample_atom, any_parser):
+    assert any_parser.parse(sample_atom) == [schema.Item(
+        title="test", link="http://example.org/2003/12/13/atom03",
+        guid="urn:uuid:1225c695-cfb8-4ebb-aaaa-80da344efa6a",
+        description="test", author="John Doe"
+    )]
+
+
+def test_parse_sanitizes_html(any_parser):
+    rss = """<rss version="2.0"><channel><title>x</title><item>
+        <title>a &lt;b onclick="x()"&gt;bold&lt;/b&gt;</title>
+        <description>&lt;p onclick="evil()"&gt;hi&lt;script&gt;alert(1)&lt;/script&gt;&lt;/p&gt;</description>
+        <link>http://example.org/1</link>
+    </item></channel></rss>"""
+    assert any_parser.parse(rss) == [schema.Item(
+        title="a <b>bold</b>", description="<p>hi</p>", link="http://example.org/1"
+    )]
+    atom = """<feed xmlns="http://www.w3.org/2005/Atom"><title>x</title><entry>
+        <title type="html">t &lt;script&gt;x&lt;/script&gt;</title>
+        <id>urn:uuid:1</id>
+        <summary type="html">&lt;b onclick="x"&gt;s&lt;/b&gt;</summary>
+    </entry></feed>"""
+    assert any_parser.parse(atom)[0].description == "<b>s</b>"
+    assert any_parser.parse(atom)[0].title == "t"
+
+
+def test_parse_atom_link_falls_back_to_id(any_parser):
+    atom = """<feed xmlns="http://www.w3.org/2005/Atom"><title>x</title><entry>
+        <title>t</title><id>http://example.org/1</id>
+    </entry></feed>"""
+    assert any_parser.parse(atom)[0].link == "http://example.org/1"
+
+
+def test_fast_parser_fallback():
+    class MockFallback(parser.Parser):
+        def parse(self, data):
+            return [schema.Item(title="fallback")]
+
+    p = parser.FastParser(fallback=MockFallback())
+    rss_1 = """<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns="http://purl.org/rss/1.0/">
+        <item><title>test</title></item>
+    </rdf:RDF>"""
+    assert p.parse(rss_1) == [schema.Item(title="fallback")]
+    assert p.parse("<rss><channel></channel>") == [schema.Item(title="fallback")]
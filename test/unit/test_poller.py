@@ -0,0 +1,71 @@
+from time import sleep
+import json
+import poller
+from broker import publisher
+
+
+class MockPublisher(publisher.Publisher):
+    def __init__(self):
+        self.published = []
+
+    def publish(self, msg: bytes):
+        self.published.append(json.loads(msg)["link"])
+
+    def close(self):
+        pass
+
+
+def test_pop_due_reschedules():
+    p = poller.AdaptivePoller(MockPublisher(), [], min_interval=10, initial_interval=100)
+    p.add("a")
+    assert p.pop_due() == ["a"]
+    assert p.pop_due() == []
+    assert 90 <= p.next_due() <= 110
+
+
+def test_interval_adapts_to_changes():
+    p = poller.AdaptivePoller(MockPublisher(), ["a", "b"], min_interval=10, max_interval=1000, initial_interval=100)
+    for _ in range(10):
+        p.record("a", poller.PollOutcome.changed)
+        p.record("b", poller.PollOutcome.unchanged)
+    assert p.feeds["a"].interval == 10
+    assert p.feeds["b"].interval == 1000
+    assert p.feeds["a"].change_rate > 0.9
+    assert p.feeds["b"].change_rate < 0.1
+
+
+def test_errors_back_off():
+    p = poller.AdaptivePoller(MockPublisher(), ["a"], min_interval=10, max_interval=1000, initial_interval=100)
+    p.record("a", poller.PollOutcome.error)
+    first = p.feeds["a"].next_due
+    p.record("a", poller.PollOutcome.error)
+    assert p.feeds["a"].next_due > first
+    assert p.feeds["a"].error_streak == 2
+    # the interval itself is kept for when the feed recovers
+    assert p.feeds["a"].interval == 100
+
+
+def test_postponed_feed_gets_due():
+    p = poller.AdaptivePoller(MockPublisher(), [], min_interval=0.05, max_interval=0.05, initial_interval=0.05)
+    p.add("a")
+    assert p.pop_due() == ["a"]
+    # postponed by the error, the popped entry is pushed back
+    p.record("a", poller.PollOutcome.error)
+    sleep(0.06)
+    assert p.pop_due() == ["a"]
+
+
+def test_run_publishes_tasks():
+    mock_publisher = MockPublisher()
+    p = poller.AdaptivePoller(mock_publisher, [], initial_interval=100)
+    p.start()
+    p.add("a")
+    sleep(0.1)
+    p.stop()
+    assert mock_publisher.published == ["a"]
+
+
+def test_read_feeds(tmp_path):
+    path = tmp_path / "feeds.txt"
+    path.write_text("http://a.com/feed  # comment\n\n# http://b.com/feed\nhttp://c.com/feed\n")
+    assert poller.read_feeds(str(path)) == ["http://a.com/feed", "http://c.com/feed"]
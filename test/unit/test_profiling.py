@@ -0,0 +1,47 @@
+from threading import Event, Thread
+from time import sleep
+import os
+import profiling
+
+
+def _busy_reader(stop: Event):
+    while not stop.is_set():
+        sleep(0.001)
+
+
+def test_profiler_writes_collapsed_stacks(tmp_path):
+    stop = Event()
+    worker = Thread(target=_busy_reader, args=(stop,), name="Thread-7")
+    worker.start()
+    profiler = profiling.SamplingProfiler(str(tmp_path), window=0.2, interval=0.005)
+    profiler.start()
+    profiling.record_fetch("http://a.com/rss", 0.5)
+    profiling.record_fetch("http://a.com/rss", 0.25)
+    profiling.record_parse("http://b.com/rss", 0.1)
+    profiler._thread.join(5)
+    stop.set()
+    worker.join()
+    assert profiler.fetch_seconds == {"http://a.com/rss": 0.75}
+    assert profiler.parse_seconds == {"http://b.com/rss": 0.1}
+    files = os.listdir(tmp_path)
+    assert len(files) == 1 and files[0].endswith(".collapsed")
+    lines = (tmp_path / files[0]).read_text().splitlines()
+    # the numbers of the default thread names are dropped, the sampler itself is left out
+    assert any(line.startswith("Thread;") and "_busy_reader" in line for line in lines)
+    assert not any(line.startswith("SamplingProfiler") for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_profiler_records_only_while_running(tmp_path):
+    profiler = profiling.SamplingProfiler(str(tmp_path), window=10, interval=0.005)
+    profiling.record_fetch("http://a.com/rss", 1)
+    profiler.toggle()
+    assert profiler.running
+    profiling.record_parse("http://a.com/rss", 1)
+    profiler.toggle()
+    profiler._thread.join(5)
+    assert not profiler.running
+    profiling.record_parse("http://a.com/rss", 1)
+    assert profiler.fetch_seconds == {}
+    assert profiler.parse_seconds == {"http://a.com/rss": 1}
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,40 @@
+from pika.exceptions import AMQPConnectionError
+from broker import publisher, exceptions
+import pytest
+
+
+class MockChannel:
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self.published = []
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        if self.fail:
+            raise AMQPConnectionError("lost")
+        self.published.append(body)
+
+
+class MockRabbitmqPublisher(publisher.RabbitmqPublisher):
+    """connects to the channels given, in their order"""
+
+    def __init__(self, channels, retry: int):
+        self.channels = channels
+        super().__init__("amqp://localhost", "e", "k", retry, 0)
+
+    def _connect(self):
+        if not self.channels:
+            raise exceptions.ConnectionFailed
+        return self.channels.pop(0)
+
+
+def test_publisher_publishes_again_on_new_channel():
+    healthy = MockChannel(fail=False)
+    publisher_ = MockRabbitmqPublisher([MockChannel(fail=True), healthy], retry=3)
+    assert publisher_.publish_tracked(b"test", "a") == ["a"]
+    assert healthy.published == [b"test"]
+
+
+def test_publisher_gives_up():
+    publisher_ = MockRabbitmqPublisher([MockChannel(fail=True), MockChannel(fail=True)], retry=2)
+    with pytest.raises(exceptions.ConnectionFailed):
+        publisher_.publish_tracked(b"test", "a")
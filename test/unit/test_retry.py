@@ -0,0 +1,42 @@
+from time import sleep
+from reader import data, retry
+
+
+def test_is_retryable_status():
+    assert retry.is_retryable_status(429)
+    assert retry.is_retryable_status(503)
+    assert not retry.is_retryable_status(404)
+
+
+def test_should_retry():
+    policy = retry.RetryPolicy(max_retries=2)
+    result = data.ResultData(url="test", error="timeout", retryable=True)
+    assert policy.should_retry(result, 0)
+    assert policy.should_retry(result, 1)
+    assert not policy.should_retry(result, 2)
+    assert not policy.should_retry(data.ResultData(url="test", error="not found"), 0)
+    # the server asks for a longer wait than the policy allows
+    assert not policy.should_retry(
+        data.ResultData(url="test", error="status code:429", retryable=True, retry_after=3600), 0
+    )
+
+
+def test_delay_backoff():
+    policy = retry.RetryPolicy(base_delay=1, max_delay=10)
+    for attempt, backoff in [(0, 1), (1, 2), (2, 4), (5, 10)]:
+        assert backoff / 2 <= policy.delay(attempt) <= backoff
+    # the server may ask for more than the backoff, up to max_delay
+    assert policy.delay(0, retry_after=8) == 8
+    assert policy.delay(0, retry_after=60) == 10
+
+
+def test_delay_queue():
+    delay_queue = retry.DelayQueue()
+    assert delay_queue.next_due() is None
+    delay_queue.put("later", 0.05)
+    delay_queue.put("now", 0)
+    assert delay_queue.pop_due() == ["now"]
+    assert 0 < delay_queue.next_due() <= 0.05
+    sleep(0.06)
+    assert delay_queue.pop_due() == ["later"]
+    assert len(delay_queue) == 0
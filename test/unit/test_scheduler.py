@@ -0,0 +1,66 @@
+from queue import Empty
+from time import monotonic
+from reader import data, scheduler
+import pytest
+
+
+def test_max_connections_per_host():
+    s = scheduler.HostScheduler(max_connections=1)
+    s.put(data.InputData("http://a.com/1"))
+    s.put(data.InputData("http://a.com/2"))
+    assert s.get_nowait().url == "http://a.com/1"
+    with pytest.raises(Empty):
+        s.get(timeout=0.05)
+    s.release("http://a.com/1")
+    assert s.get_nowait().url == "http://a.com/2"
+    assert s.empty()
+
+
+def test_hosts_take_turns():
+    s = scheduler.HostScheduler(max_connections=10)
+    for url in ["http://a.com/1", "http://a.com/2", "http://a.com/3", "http://b.com/1", "http://c.com/1"]:
+        s.put(data.InputData(url))
+    assert [s.get_nowait().url for _ in range(5)] == [
+        "http://a.com/1", "http://b.com/1", "http://c.com/1", "http://a.com/2", "http://a.com/3"
+    ]
+
+
+def test_rate_limit():
+    s = scheduler.HostScheduler(rate=20, burst=1, max_connections=10)
+    s.put(data.InputData("http://a.com/1"))
+    s.put(data.InputData("http://a.com/2"))
+    s.put(data.InputData("http://b.com/1"))
+    start = monotonic()
+    assert s.get_nowait().url == "http://a.com/1"
+    # the other host is not held back by the throttled one
+    assert s.get_nowait().url == "http://b.com/1"
+    with pytest.raises(Empty):
+        s.get_nowait()
+    assert s.get(timeout=1).url == "http://a.com/2"
+    assert monotonic() - start >= 0.04
+
+
+def test_retry_after_pauses_host():
+    s = scheduler.HostScheduler(max_connections=10)
+    s.put(data.InputData("http://a.com/1"))
+    s.put(data.InputData("http://a.com/2"))
+    s.get_nowait()
+    s.release("http://a.com/1", retry_after=0.1)
+    with pytest.raises(Empty):
+        s.get_nowait()
+    start = monotonic()
+    assert s.get(timeout=1).url == "http://a.com/2"
+    assert monotonic() - start >= 0.05
+
+
+def test_parked():
+    s = scheduler.HostScheduler(max_connections=1)
+    s.put(data.InputData("http://a.com/1"))
+    s.put(data.InputData("http://a.com/2"))
+    s.put(data.InputData("http://b.com/1"))
+    assert s.parked() == 0
+    s.get_nowait()
+    # a.com is busy, b.com may be fetched from
+    assert s.parked() == 1
+    s.release("http://a.com/1", retry_after=60)
+    assert s.parked() == 1
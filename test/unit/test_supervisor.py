@@ -0,0 +1,56 @@
+from time import sleep, monotonic
+from threading import Thread
+import os
+import signal
+import supervisor
+
+
+def _exit_soon(index: int):
+    sleep(0.1)
+
+
+def _run_forever(index: int):
+    while True:
+        sleep(1)
+
+
+def test_supervisor_restarts_dead_children():
+    sv = supervisor.Supervisor(2, _exit_soon, restart_delay=0.2)
+    thread = Thread(target=sv.run)
+    thread.start()
+    sleep(0.1)
+    first_pids = [child.pid for child in sv.children]
+    sleep(0.5)
+    sv.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert all(child.pid not in first_pids for child in sv.children)
+
+
+def test_supervisor_stop_forwards_sigterm():
+    sv = supervisor.Supervisor(2, _run_forever, restart_delay=0.1, stop_timeout=5)
+    thread = Thread(target=sv.run)
+    thread.start()
+    sleep(0.3)
+    pids = [child.pid for child in sv.children]
+    assert len(set(pids)) == 2 and os.getpid() not in pids
+    start = monotonic()
+    sv.stop()
+    thread.join(5)
+    # the children exited on SIGTERM instead of being killed after the timeout
+    assert monotonic() - start < 3
+    assert all(child.exitcode == -15 for child in sv.children)
+
+
+def test_supervisor_forward_sigusr1_keeps_children():
+    sv = supervisor.Supervisor(1, _run_forever, restart_delay=0.1, stop_timeout=5)
+    thread = Thread(target=sv.run)
+    thread.start()
+    sleep(0.3)
+    pid = sv.children[0].pid
+    sv.forward(signal.SIGUSR1)
+    sleep(0.3)
+    # a target without its own handler ignores it
+    assert sv.children[0].pid == pid and sv.children[0].is_alive()
+    sv.stop()
+    thread.join(5)
@@ -0,0 +1,116 @@
+from time import sleep
+from pika import spec
+from pika.exceptions import AMQPConnectionError
+from broker import task_reader, exceptions
+import pytest
+
+
+def test_ack_coalescer_contiguous_range():
+    coalescer = task_reader.AckCoalescer(batch_size=3, flush_interval=60)
+    for tag in range(1, 6):
+        coalescer.deliver(tag)
+    coalescer.complete(2)
+    coalescer.complete(1)
+    assert not coalescer.due
+    coalescer.complete(4)
+    assert coalescer.due
+    # 3 is still pending, so only 1 and 2 can be acked together
+    assert coalescer.flush() == (2, [])
+    coalescer.reject(3)
+    coalescer.complete(5)
+    assert coalescer.flush() == (5, [])
+    assert len(coalescer.delivered) == 0
+
+
+def test_ack_coalescer_forced_flush():
+    coalescer = task_reader.AckCoalescer(batch_size=10, flush_interval=60)
+    for tag in range(1, 5):
+        coalescer.deliver(tag)
+    coalescer.complete(1)
+    coalescer.complete(3)
+    coalescer.complete(4)
+    assert coalescer.flush(force=True) == (1, [3, 4])
+    assert list(coalescer.delivered) == [2]
+
+
+def test_ack_coalescer_flush_interval():
+    coalescer = task_reader.AckCoalescer(batch_size=10, flush_interval=0)
+    coalescer.deliver(1)
+    coalescer.deliver(2)
+    coalescer.complete(2)
+    assert coalescer.due
+    assert coalescer.flush() == (None, [2])
+
+
+def test_ack_coalescer_steady_acks_dont_postpone_forced_flush():
+    coalescer = task_reader.AckCoalescer(batch_size=2, flush_interval=0.05)
+    coalescer.deliver(1)
+    singles = []
+    # tag 1 never completes, the tags behind it are acked by the forced flushes only
+    for tag in range(2, 30):
+        coalescer.deliver(tag)
+        coalescer.complete(tag)
+        if coalescer.due:
+            singles.extend(coalescer.flush()[1])
+        sleep(0.01)
+    assert singles and singles == sorted(singles)
+    assert len(coalescer.completed) < 10
+
+
+class MockBlockingChannel:
+    def __init__(self, bodies, fail: bool = False):
+        self.bodies = list(bodies)
+        self.fail = fail
+        self.acks = []
+        self.on_message = None
+        self.connection = self
+
+    def process_data_events(self, time_limit=None):
+        if self.fail:
+            raise AMQPConnectionError("lost")
+        for tag, body in enumerate(self.bodies, 1):
+            self.on_message(self, spec.Basic.Deliver(delivery_tag=tag), None, body)
+        self.bodies = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_cancel(self, consumer_tag):
+        pass
+
+    def close(self):
+        pass
+
+
+class MockRabbitmqTaskReader(task_reader.RabbitmqTaskReader):
+    """connects to the channels given, in their order"""
+
+    def __init__(self, channels, **kwargs):
+        self.channels = channels
+        super().__init__("amqp://localhost", 10, "q", "e", "k", 1, 1, 0, **kwargs)
+
+    def _connect(self):
+        if not self.channels:
+            raise exceptions.ConnectionFailed
+        channel = self.channels.pop(0)
+        channel.on_message = self._on_message
+        return channel
+
+
+@pytest.mark.parametrize("ack_batch_size", [1, 2])
+def test_rabbitmq_task_reader_ignores_acks_of_lost_channel(ack_batch_size):
+    lost = MockBlockingChannel([b'{"link": "http://a.com"}'])
+    current = MockBlockingChannel([b'{"link": "http://a.com"}', b'{"link": "http://b.com"}'])
+    reader = MockRabbitmqTaskReader([lost, current], ack_batch_size=ack_batch_size)
+    tasks = reader.get_task()
+    _, stale_id = next(tasks)
+    lost.fail = True
+    # the broker requeues the task along with the lost channel, the new one delivers it again with the same tag
+    task, first_id = next(tasks)
+    _, second_id = next(tasks)
+    assert task.link == "http://a.com" and first_id != stale_id
+    reader.ack(stale_id)
+    reader.ack(second_id)
+    reader.close()
+    # tag 1 of the new channel is still being processed
+    assert current.acks == [(2, False)]
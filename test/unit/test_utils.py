@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+from typing import Optional
+import json
+import utils
+
+
+def test_json_dumps_compact():
+    encoded = utils.json_dumps({"a": [1, None], "b": "é"})
+    assert b" " not in encoded
+    assert json.loads(encoded) == {"a": [1, None], "b": "é"}
+
+
+def test_json_dumps_without_orjson(monkeypatch):
+    monkeypatch.setattr(utils, "orjson", None)
+    assert utils.json_dumps({"a": [1, None]}) == b'{"a":[1,null]}'
+
+
+def test_json_dumps_lone_surrogate():
+    assert json.loads(utils.json_dumps({"a": "\ud800"})) == {"a": "\ud800"}
+
+
+def test_add_slots():
+    @utils.add_slots
+    @dataclass
+    class Record:
+        a: int
+        b: Optional[str] = None
+
+    record = Record(1)
+    assert record == Record(a=1, b=None)
+    assert not hasattr(record, "__dict__")
+    assert Record.__slots__ == ("a", "b")
@@ -0,0 +1,42 @@
+from reader.validator_cache import ValidatorCache, Validators
+
+
+def test_conditional_headers():
+    cache = ValidatorCache()
+    assert cache.conditional_headers("test") == {}
+    cache.update("test", {"ETag": '"abc"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"})
+    assert cache.conditional_headers("test") == {
+        "If-None-Match": '"abc"', "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"
+    }
+
+
+def test_lru_eviction():
+    cache = ValidatorCache(max_size=2)
+    cache.set("a", Validators(etag="a"))
+    cache.set("b", Validators(etag="b"))
+    cache.get("a")
+    cache.set("c", Validators(etag="c"))
+    assert cache.get("b") is None
+    assert cache.get("a") == Validators(etag="a")
+    assert cache.get("c") == Validators(etag="c")
+
+
+def test_disk_backing_store(tmp_path):
+    path = str(tmp_path / "validators.db")
+    cache = ValidatorCache(max_size=1, path=path)
+    cache.set("a", Validators(etag="a"))
+    cache.set("b", Validators(etag="b"))
+    # evicted from memory but still on disk
+    assert cache.get("a") == Validators(etag="a")
+    cache.close()
+    assert ValidatorCache(path=path).get("b") == Validators(etag="b")
+
+
+def test_set_many(tmp_path):
+    path = str(tmp_path / "validators.db")
+    cache = ValidatorCache(path=path)
+    cache.set_many([("a", Validators(etag="a")), ("b", Validators(last_modified="b"))])
+    cache.close()
+    cache = ValidatorCache(path=path)
+    assert cache.get("a") == Validators(etag="a")
+    assert cache.get("b") == Validators(last_modified="b")
@@ -1,6 +1,13 @@
+from dataclasses import fields
+import json
 import logging
 import sys
-from typing import Optional
+from typing import Any, Optional, Type, TypeVar
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def init_logging(
@@ -17,3 +24,37 @@ def init_logging(
         style='%'
     ))
     logger.addHandler(handler)
+
+
+_json_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+def json_dumps(obj: Any) -> bytes:
+    """Encodes to compact json, with orjson if it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            # i.e. lone surrogates, which the standard encoder escapes
+            pass
+    return _json_encoder.encode(obj).encode()
+
+
+_T = TypeVar("_T")
+
+
+def add_slots(cls: Type[_T]) -> Type[_T]:
+    """Class decorator giving a dataclass '__slots__' instead of an instance '__dict__'.
+
+    It has to be applied on top of '@dataclass', the fields' defaults live on in the generated '__init__'.
+    """
+    cls_dict = dict(cls.__dict__)
+    field_names = tuple(field.name for field in fields(cls))
+    cls_dict["__slots__"] = field_names
+    for name in field_names:
+        cls_dict.pop(name, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+    slotted = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    slotted.__qualname__ = cls.__qualname__
+    return slotted